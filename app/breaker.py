@@ -0,0 +1,199 @@
+"""
+Circuit breaker por conexão (instância da Evolution).
+
+- Fechado: o worker envia normalmente.
+- Aberto: depois de BREAKER_FAILURE_THRESHOLD falhas seguidas (rede/5xx) o
+  worker abre o breaker (`connections.is_healthy = False`). As mensagens da
+  conexão que chegam da fila são estacionadas em `parked_messages` em vez de
+  esperar o timeout e virar log `failed`, e o scheduler para de atribuir
+  contatos novos a ela.
+- Sondagem: o scheduler consulta `connectionState` das instâncias abertas a
+  cada BREAKER_PROBE_INTERVAL; quando a instância volta (`open`), o breaker
+  fecha e as mensagens estacionadas voltam para a fila no ritmo da conexão,
+  só as que têm slot dentro do lookahead do scheduler (como a alimentação
+  normal); o resto espera os próximos ciclos.
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import metrics
+import models
+import services
+import versions
+from database import SessionLocal
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', os.getenv('CONNECTION_FAILURE_THRESHOLD', '3')))
+BREAKER_PROBE_INTERVAL = float(os.getenv('BREAKER_PROBE_INTERVAL', '30'))
+BREAKER_PROBE_TIMEOUT = float(os.getenv('BREAKER_PROBE_TIMEOUT', '5'))
+# Quanto tempo o worker confia no estado do breaker que leu do banco
+BREAKER_CACHE_SECONDS = float(os.getenv('BREAKER_CACHE_SECONDS', '5'))
+BREAKER_RELEASE_BATCH = int(os.getenv('BREAKER_RELEASE_BATCH', '500'))
+
+CONNECTED_STATE = "open" # estado da Evolution para instância conectada
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ==========================================
+# 🔌 LADO DO WORKER
+# ==========================================
+
+class BreakerCache:
+    """Estado dos breakers visto por um worker (evita uma query por mensagem)."""
+
+    def __init__(self, ttl=BREAKER_CACHE_SECONDS):
+        self.ttl = ttl
+        self._states = {}
+
+    def is_open(self, connection_id, now=None):
+        now = now or time.monotonic()
+        cached = self._states.get(connection_id)
+        if cached and now - cached[1] < self.ttl:
+            return cached[0]
+        db = SessionLocal()
+        try:
+            healthy = (
+                db.query(models.Connection.is_healthy)
+                .filter(models.Connection.id == connection_id)
+                .scalar()
+            )
+        finally:
+            db.close()
+        is_open = healthy is False
+        self._states[connection_id] = (is_open, now)
+        return is_open
+
+    def set(self, connection_id, is_open):
+        self._states[connection_id] = (is_open, time.monotonic())
+
+
+def open_breaker(db, connection_id):
+    """Abre o breaker (sem commit). No-op se já estava aberto."""
+    opened = (
+        db.query(models.Connection)
+        .filter(models.Connection.id == connection_id, models.Connection.is_healthy.isnot(False))
+        .update({"is_healthy": False, "unhealthy_since": _utcnow()}, synchronize_session=False)
+    )
+    if opened:
+        versions.bump_owner(db, models.Connection, connection_id, versions.CONNECTIONS)
+    return opened
+
+
+def park(db, payload):
+    """Guarda a mensagem até a conexão voltar (sem commit)."""
+    db.add(models.ParkedMessage(
+        connection_id=payload["connection"]["id"],
+        campaign_id=payload.get("campaign_id"),
+        payload=json.dumps(payload),
+    ))
+    # parked_messages aparece no GET /connections
+    versions.bump_owner(db, models.Connection, payload["connection"]["id"], versions.CONNECTIONS)
+
+
+# ==========================================
+# 🩺 LADO DO SCHEDULER (SONDAGEM)
+# ==========================================
+
+def probe_instance(conn):
+    """connectionState da instância ('open', 'close', 'connecting'...) ou None se não respondeu."""
+    url = f"{conn.api_url.rstrip('/')}/instance/connectionState/{conn.instance_name}"
+    try:
+        response = requests.get(url, headers={"apikey": conn.api_key}, timeout=BREAKER_PROBE_TIMEOUT)
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        return (data.get("instance") or data).get("state")
+    except Exception:
+        return None
+
+
+def release_parked(db, conn, now, horizon, queue=None):
+    """
+    Devolve à fila as mensagens estacionadas cujo slot (espaçado pelo limite
+    da conexão a partir do próximo slot livre) cai antes do horizonte; o
+    worker é FIFO e dorme até cada slot, então um slot distante seguraria as
+    mensagens das outras conexões. Retorna quantas.
+    """
+    parked = (
+        db.query(models.ParkedMessage)
+        .filter(models.ParkedMessage.connection_id == conn.id)
+        .order_by(models.ParkedMessage.id)
+        .limit(BREAKER_RELEASE_BATCH)
+        .all()
+    )
+    if not parked:
+        return 0
+
+    slot = max(now, conn.next_send_at or now)
+    messages = []
+    released = []
+    for row in parked:
+        if slot >= horizon:
+            break
+        payload = json.loads(row.payload)
+        interval = payload.get("delay_seconds") or 6
+        if conn.messages_per_minute:
+            interval = max(interval, 60 / conn.messages_per_minute)
+        payload["not_before"] = slot.replace(tzinfo=timezone.utc).timestamp()
+        messages.append(payload)
+        released.append(row.id)
+        slot += timedelta(seconds=interval)
+    if not messages:
+        return 0
+
+    services.publish_messages(messages, queue=queue)
+    db.query(models.ParkedMessage).filter(
+        models.ParkedMessage.id.in_(released)
+    ).delete(synchronize_session=False)
+    conn.next_send_at = slot
+    # parked_messages de GET /connections mudou: invalida o ETag
+    versions.bump(db, conn.user_id, versions.CONNECTIONS)
+    metrics.MESSAGES_RETRIED.labels(str(conn.id)).inc(len(messages))
+    return len(messages)
+
+
+def probe_open_connections(db, now, horizon, queue=None):
+    """
+    Sonda as conexões com breaker aberto (respeitando o intervalo) e fecha as
+    que voltaram. Conexões fechadas com mensagens ainda estacionadas continuam
+    sendo drenadas, até `horizon` (fim do lookahead) a cada ciclo.
+    """
+    due = now - timedelta(seconds=BREAKER_PROBE_INTERVAL)
+    opened = (
+        db.query(models.Connection)
+        .filter(
+            models.Connection.is_healthy.is_(False),
+            (models.Connection.probed_at.is_(None)) | (models.Connection.probed_at <= due),
+        )
+        .all()
+    )
+    for conn in opened:
+        state = probe_instance(conn)
+        conn.instance_state = state
+        conn.probed_at = now
+        if state == CONNECTED_STATE:
+            conn.is_healthy = True
+            conn.unhealthy_since = None
+            print(f"🔁 Conexão {conn.id} ({conn.instance_name}) voltou; breaker fechado")
+        versions.bump(db, conn.user_id, versions.CONNECTIONS)
+        db.commit()
+
+    draining = (
+        db.query(models.Connection)
+        .filter(
+            models.Connection.is_healthy.isnot(False),
+            models.Connection.id.in_(db.query(models.ParkedMessage.connection_id).distinct()),
+        )
+        .all()
+    )
+    for conn in draining:
+        released = release_parked(db, conn, now, horizon, queue=queue)
+        db.commit()
+        if released:
+            print(f"📤 Conexão {conn.id}: {released} mensagens retidas devolvidas à fila")
@@ -1,20 +1,57 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import time
+
+import metrics
 
 DEFAULT_DB = "sqlite:///./data/campaign_manager.db"
 SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL', DEFAULT_DB)
 
+# Sessões síncronas: worker, scheduler, migrações e retenção
 # check_same_thread=False é necessário apenas para SQLite
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+# Drivers assíncronos usados pela API para o mesmo banco
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '20'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+
+
+def async_database_url(url=SQLALCHEMY_DATABASE_URL):
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db, postgresql://... -> postgresql+asyncpg://..."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}'")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def _create_async_engine():
+    url = async_database_url()
+    if url.get_backend_name() == "sqlite":
+        return create_async_engine(url)
+    # Conexões abertas (não threads) limitam as requisições simultâneas ao banco
+    return create_async_engine(
+        url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True,
+    )
+
+
+async_engine = _create_async_engine()
+# expire_on_commit=False: a resposta é serializada depois do commit, sem lazy load
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+async def get_db():
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        finally:
+            metrics.DB_SESSION_SECONDS.observe(time.perf_counter() - started)
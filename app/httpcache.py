@@ -0,0 +1,94 @@
+"""
+GET condicional e cache de respostas das telas que quase não mudam.
+
+/connections, /tags, /lists e /campaigns (e o detalhe da campanha) dependem
+de poucos escopos de data_versions (versions.py), incrementados por toda
+escrita que muda o que essas rotas devolvem — na API, no worker e no
+scheduler. Antes de consultar qualquer coisa a rota lê as versões do tenant
+(uma busca pela PK):
+- ETag = W/"<tenant>-<versões>" e Last-Modified = último bump dos escopos;
+- If-None-Match / If-Modified-Since batendo -> 304 sem corpo, sem consulta
+  nem serialização;
+- senão o corpo sai do ResponseCache (LRU limitado em bytes, chave = tenant +
+  URL, válido só para a mesma ETag) ou é montado e guardado.
+
+O cache é por processo da API; RESPONSE_CACHE_MAX_BYTES=0 desliga.
+"""
+import os
+from collections import OrderedDict
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import versions
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+# O navegador guarda, mas sempre revalida (o 304 é barato)
+CACHE_CONTROL = "private, no-cache"
+
+
+class ResponseCache:
+    """(tenant, path, query) -> (etag, corpo JSON); só usado no event loop."""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, etag):
+        entry = self._entries.get(key)
+        if not entry or entry[0] != etag:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, etag, body):
+        if len(body) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old:
+            self.size -= len(old[1])
+        self._entries[key] = (etag, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+CACHE = ResponseCache()
+
+
+def validators(db, user_id, scopes):
+    """(ETag, Last-Modified ou None) do tenant para os escopos da rota."""
+    snapshot = versions.snapshot(db, user_id, scopes)
+    tag = ".".join(str(snapshot[scope][0]) for scope in scopes)
+    stamps = [updated_at for _, updated_at in snapshot.values() if updated_at]
+    return f'W/"{user_id}-{tag}"', max(stamps) if stamps else None
+
+
+def headers(etag, last_modified):
+    result = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified:
+        result["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    return result
+
+
+def not_modified(request_headers, etag, last_modified):
+    """If-None-Match (comparação fraca) tem precedência sobre If-Modified-Since."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+        return "*" in candidates or etag.removeprefix("W/") in candidates
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # Last-Modified tem resolução de segundos
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
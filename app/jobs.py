@@ -0,0 +1,437 @@
+"""
+Jobs duráveis: o trabalho pesado de lançar e retomar campanhas.
+
+POST /campaigns e /campaigns/{id}/resume só validam, deixam a campanha em
+`preparing` e gravam um job na tabela `jobs`; respondem em milissegundos
+qualquer que seja a audiência. Este runner (processo próprio, `python -u
+jobs.py`) pega os jobs e faz o que antes rodava dentro da requisição:
+- launch_campaign: conta a audiência (total_contacts);
+- resume_campaign: volta o cursor para o primeiro contato publicado e não
+  processado (scheduler.rewind_cursor) e conta a audiência se ainda não houver
+  total (campanha pausada durante o preparo).
+No fim a campanha vai para `scheduled` ou `processing` e o scheduler assume.
+
+As duas varreduras andam por faixas de contacts.id (JOB_CHUNK ids por vez).
+Depois de cada faixa o job grava o checkpoint (próximo id + parciais), o
+progresso (0-100) e renova o lease, tudo num commit: um runner que cai
+(deploy, OOM) perde no máximo uma faixa, e quando o lease vence outro runner
+retoma do checkpoint. Toda escrita do runner exige ainda ser o dono do lease;
+se o job foi cancelado ou tomado por outro runner, ele só larga.
+
+O job carrega o feed_epoch da campanha: pause/cancel/resume incrementam o
+epoch, e o job de um preparo interrompido é cancelado em vez de pôr a
+campanha para rodar de novo.
+"""
+import json
+import os
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, exists, func, or_, update
+
+import metrics
+import models
+import segments
+import versions
+from database import SessionLocal
+
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+# Sem checkpoint por esse tempo, o job é considerado órfão e outro runner retoma
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))
+# Faixa de contacts.id varrida entre dois checkpoints
+JOB_CHUNK = int(os.getenv('JOB_CHUNK', '50000'))
+# Tentativas (erros ou runners que caíram) antes de desistir
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+
+LAUNCH_CAMPAIGN = "launch_campaign"
+RESUME_CAMPAIGN = "resume_campaign"
+KINDS = (LAUNCH_CAMPAIGN, RESUME_CAMPAIGN)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+OPEN_STATUSES = (QUEUED, RUNNING)
+
+# Campanha esperando o job
+PREPARING = "preparing"
+
+JOB_FIELDS = (
+    "id", "kind", "campaign_id", "status", "progress", "checkpoint", "result",
+    "error", "attempts", "created_at", "started_at", "finished_at",
+)
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class LeaseLost(Exception):
+    """O job foi cancelado ou outro runner assumiu: este para sem escrever nada."""
+
+
+class Stale(Exception):
+    """A campanha saiu do preparo (pause/cancel) depois que o job foi criado."""
+
+
+def enqueue(db, campaign, kind):
+    """Grava o job de preparo da campanha já com id (sem commit: vai junto com a campanha)."""
+    job = models.Job(
+        user_id=campaign.user_id,
+        kind=kind,
+        campaign_id=campaign.id,
+        status=QUEUED,
+        progress=0,
+        checkpoint=json.dumps({"epoch": campaign.feed_epoch or 0}),
+        attempts=0,
+    )
+    db.add(job)
+    return job
+
+
+def cancel_open(db, campaign_id):
+    """Cancela os jobs ainda abertos da campanha (sem commit); o runner larga no próximo checkpoint."""
+    return db.query(models.Job).filter(
+        models.Job.campaign_id == campaign_id,
+        models.Job.status.in_(OPEN_STATUSES),
+    ).update(
+        {"status": CANCELLED, "finished_at": utcnow(), "locked_by": None, "locked_until": None},
+        synchronize_session=False,
+    )
+
+
+def decode(job):
+    """Linha de jobs (dict) com checkpoint/result como objetos."""
+    for field in ("checkpoint", "result"):
+        if job.get(field):
+            job[field] = json.loads(job[field])
+    return job
+
+
+# ==========================================
+# 🔒 CLAIM E LEASE
+# ==========================================
+
+def _claimable(now):
+    return or_(
+        models.Job.status == QUEUED,
+        and_(models.Job.status == RUNNING, models.Job.locked_until < now),
+    )
+
+
+def claim(db, runner_id, now=None):
+    """Reserva o próximo job pendente (ou órfão) para o runner; devolve o Job ou None."""
+    now = now or utcnow()
+    candidates = (
+        db.query(models.Job.id)
+        .filter(_claimable(now))
+        .order_by(models.Job.id)
+        .limit(10)
+        .all()
+    )
+    for job_id, in candidates:
+        # UPDATE condicional: de vários runners disputando o mesmo job, só um leva
+        claimed = db.query(models.Job).filter(models.Job.id == job_id, _claimable(now)).update({
+            "status": RUNNING,
+            "locked_by": runner_id,
+            "locked_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            "attempts": models.Job.attempts + 1,
+            "started_at": func.coalesce(models.Job.started_at, now),
+        }, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return db.get(models.Job, job_id)
+    return None
+
+
+def _owned(job, runner_id):
+    return and_(
+        models.Job.id == job.id,
+        models.Job.status == RUNNING,
+        models.Job.locked_by == runner_id,
+    )
+
+
+def checkpoint(db, job, runner_id, state, progress):
+    """Grava o ponto de retomada e renova o lease (com commit)."""
+    saved = db.execute(
+        update(models.Job)
+        .where(_owned(job, runner_id))
+        .values(
+            checkpoint=json.dumps(state),
+            progress=round(min(progress, 100.0), 2),
+            locked_until=utcnow() + timedelta(seconds=JOB_LEASE_SECONDS),
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    if not saved:
+        raise LeaseLost()
+
+
+def _close(db, job, runner_id, status, result=None, error=None):
+    """Fecha o job (sem commit); LeaseLost se ele não é mais deste runner."""
+    closed = db.execute(
+        update(models.Job)
+        .where(_owned(job, runner_id))
+        .values(
+            status=status,
+            progress=100.0 if status == COMPLETED else models.Job.progress,
+            result=json.dumps(result) if result is not None else None,
+            error=error,
+            finished_at=utcnow(),
+            locked_by=None,
+            locked_until=None,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not closed:
+        raise LeaseLost()
+
+
+# ==========================================
+# 🧮 VARREDURAS POR FAIXA DE ID
+# ==========================================
+
+def _campaign(db, job, state):
+    """Campanha do job, ainda no mesmo preparo (status e epoch) em que ele foi criado."""
+    campaign = db.get(models.Campaign, job.campaign_id)
+    if campaign is None:
+        raise Stale()
+    db.refresh(campaign)
+    if campaign.status != PREPARING or (campaign.feed_epoch or 0) != state.get("epoch", 0):
+        raise Stale()
+    return campaign
+
+
+def _id_bounds(db, user_id):
+    low, high = db.query(func.min(models.Contact.id), func.max(models.Contact.id)).filter(
+        models.Contact.user_id == user_id
+    ).one()
+    return (low or 1) - 1, high or 0
+
+
+def _scan_progress(state, weight=100.0, offset=0.0):
+    span = max(state["high"] - state["start"], 1)
+    return offset + weight * (state["next"] - state["start"]) / span
+
+
+def _count_step(db, campaign, state):
+    """Conta a próxima faixa da audiência; True quando a contagem terminou."""
+    if "high" not in state:
+        state["start"], state["high"] = _id_bounds(db, campaign.user_id)
+        state["next"], state["count"] = state["start"], 0
+    if state["next"] >= state["high"]:
+        return True
+    upper = min(state["next"] + JOB_CHUNK, state["high"])
+    state["count"] += segments.audience_query(
+        db, campaign.user_id, segments.campaign_expression(campaign), func.count(models.Contact.id),
+    ).filter(models.Contact.id > state["next"], models.Contact.id <= upper).scalar()
+    state["next"] = upper
+    return upper >= state["high"]
+
+
+def _rewind_step(db, campaign, state):
+    """
+    Mesma busca de scheduler.rewind_cursor, em faixas: primeiro contato da
+    audiência até o cursor sem entrada no ledger. True quando terminou.
+    """
+    if "high" not in state:
+        state["start"], state["high"] = 0, campaign.feed_cursor or 0
+        state["next"], state["first_missing"] = 0, None
+    if state["next"] >= state["high"]:
+        return True
+    upper = min(state["next"] + JOB_CHUNK, state["high"])
+    ledger = models.DispatchLedger
+    processed = exists().where(and_(
+        ledger.campaign_id == campaign.id,
+        ledger.contact_id == models.Contact.id,
+    ))
+    first_missing = (
+        segments.audience_query(
+            db, campaign.user_id, segments.campaign_expression(campaign), models.Contact.id,
+        )
+        .filter(models.Contact.id > state["next"], models.Contact.id <= upper, ~processed)
+        .order_by(models.Contact.id)
+        .limit(1)
+        .scalar()
+    )
+    state["next"] = upper
+    if first_missing is not None:
+        state["first_missing"] = first_missing
+        return True
+    return upper >= state["high"]
+
+
+# ==========================================
+# 🚀 HANDLERS
+# ==========================================
+
+def _start(db, campaign, state, **values):
+    """
+    Fim do preparo (sem commit): a campanha fica com o scheduler. O UPDATE é
+    condicional para não atropelar um pause/cancel que chegou no meio.
+    """
+    now = utcnow()
+    starts_later = campaign.scheduled_at is not None and campaign.scheduled_at > now
+    values["status"] = "scheduled" if starts_later else "processing"
+    started = db.execute(
+        update(models.Campaign)
+        .where(
+            models.Campaign.id == campaign.id,
+            models.Campaign.status == PREPARING,
+            func.coalesce(models.Campaign.feed_epoch, 0) == state.get("epoch", 0),
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not started:
+        raise Stale()
+    versions.bump(db, campaign.user_id, versions.CAMPAIGNS)
+    return values
+
+
+def run_launch(db, job, runner_id, state):
+    campaign = _campaign(db, job, state)
+    state.setdefault("phase", "count")
+    while not _count_step(db, campaign, state):
+        checkpoint(db, job, runner_id, state, _scan_progress(state))
+        campaign = _campaign(db, job, state)
+    return _start(db, campaign, state, total_contacts=state["count"])
+
+
+def run_resume(db, job, runner_id, state):
+    campaign = _campaign(db, job, state)
+    # Sem total: a campanha foi pausada antes de o lançamento terminar de contar
+    counting = campaign.total_contacts is None
+    rewind_weight = 50.0 if counting else 100.0
+    state.setdefault("phase", "rewind")
+    if state["phase"] == "rewind":
+        while not _rewind_step(db, campaign, state):
+            checkpoint(db, job, runner_id, state, _scan_progress(state, rewind_weight))
+            campaign = _campaign(db, job, state)
+        if state["first_missing"] is not None:
+            state["feed_cursor"] = state["first_missing"] - 1
+        else:
+            state["feed_cursor"] = campaign.feed_cursor
+        state = {"epoch": state["epoch"], "phase": "count" if counting else "done", "feed_cursor": state["feed_cursor"]}
+        checkpoint(db, job, runner_id, state, rewind_weight)
+        campaign = _campaign(db, job, state)
+    if state["phase"] == "count":
+        while not _count_step(db, campaign, state):
+            checkpoint(db, job, runner_id, state, _scan_progress(state, 50.0, 50.0))
+            campaign = _campaign(db, job, state)
+    values = {"feed_cursor": state["feed_cursor"]}
+    if state["phase"] == "count":
+        values["total_contacts"] = state["count"]
+    return _start(db, campaign, state, **values)
+
+
+HANDLERS = {
+    LAUNCH_CAMPAIGN: run_launch,
+    RESUME_CAMPAIGN: run_resume,
+}
+
+
+def _give_up(db, job):
+    """Sem mais tentativas: a campanha volta para paused (o resume cria outro job)."""
+    db.execute(
+        update(models.Campaign)
+        .where(models.Campaign.id == job.campaign_id, models.Campaign.status == PREPARING)
+        .values(status="paused")
+        .execution_options(synchronize_session=False)
+    )
+    versions.bump(db, job.user_id, versions.CAMPAIGNS)
+
+
+def execute(db, job, runner_id):
+    """Roda o job reservado até o fim, com commit; devolve o status final."""
+    state = json.loads(job.checkpoint or "{}")
+    try:
+        if job.attempts > JOB_MAX_ATTEMPTS:
+            raise RuntimeError(f"Desistindo após {JOB_MAX_ATTEMPTS} tentativas")
+        result = HANDLERS[job.kind](db, job, runner_id, state)
+        _close(db, job, runner_id, COMPLETED, result=result)
+        status = COMPLETED
+    except LeaseLost:
+        db.rollback()
+        return None
+    except Stale:
+        db.rollback()
+        status = CANCELLED
+        try:
+            _close(db, job, runner_id, CANCELLED, error="Campaign left preparing")
+        except LeaseLost:
+            db.rollback()
+            return None
+    except Exception as e:
+        db.rollback()
+        print(f"Erro no job {job.id} ({job.kind}): {e}")
+        if job.attempts < JOB_MAX_ATTEMPTS:
+            # De volta à fila: o próximo claim retoma do último checkpoint
+            db.query(models.Job).filter(_owned(job, runner_id)).update(
+                {"status": QUEUED, "error": str(e), "locked_by": None, "locked_until": None},
+                synchronize_session=False,
+            )
+            db.commit()
+            metrics.JOBS.labels(job.kind, "retried").inc()
+            return QUEUED
+        status = FAILED
+        try:
+            _close(db, job, runner_id, FAILED, error=str(e))
+        except LeaseLost:
+            db.rollback()
+            return None
+        _give_up(db, job)
+    db.commit()
+    metrics.JOBS.labels(job.kind, status).inc()
+    return status
+
+
+def run_once(runner_id):
+    """Pega e executa um job; devolve o status final ou None se não havia nada."""
+    db = SessionLocal()
+    try:
+        job = claim(db, runner_id)
+        if job is None:
+            return None
+        started = time.monotonic()
+        status = execute(db, job, runner_id)
+        print(f"⚙️  Job {job.id} ({job.kind}, campanha {job.campaign_id}): {status or 'largado'} em {time.monotonic() - started:.1f}s")
+        return status
+    finally:
+        db.close()
+
+
+def start_runner():
+    metrics.start_listener()
+    runner_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    print(f" [*] Heimdall Jobs ativo ({runner_id}, lease {JOB_LEASE_SECONDS:.0f}s)")
+    while True:
+        try:
+            if run_once(runner_id) is None:
+                time.sleep(JOB_POLL_SECONDS)
+        except Exception as e:
+            print(f"Erro no runner de jobs: {e}")
+            time.sleep(5)
+
+
+def print_status(limit=20):
+    db = SessionLocal()
+    try:
+        rows = db.query(models.Job).order_by(models.Job.id.desc()).limit(limit).all()
+        for job in rows:
+            print(f"{job.id:>6}  {job.kind:<16} campanha {job.campaign_id:<6} {job.status:<10} {job.progress:6.1f}%  tentativas {job.attempts}  {job.error or ''}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        print_status()
+    else:
+        start_runner()
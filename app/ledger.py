@@ -0,0 +1,60 @@
+"""
+Ledger de despacho: no máximo um envio por (campanha, contato).
+
+Antes de chamar a Evolution, o worker reivindica a chave com um INSERT ... ON
+CONFLICT DO NOTHING (busca pela PK, O(1)) e faz commit. Quem não conseguir
+inserir está vendo uma reentrega (worker morreu antes do ack, republicação
+após pause) e descarta a mensagem. O resultado do envio é gravado na mesma
+transação do log, e uma mensagem devolvida sem ter sido enviada (breaker)
+libera a chave.
+
+Com isso a fila pode entregar a mesma mensagem mais de uma vez (prefetch
+maior, vários workers) sem que o contato receba em dobro.
+"""
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+
+CLAIMED = "claimed"
+# Suprimido ou número repetido (suppressions.py): nunca vai para a fila
+SKIPPED = "skipped"
+SKIP_CHUNK = 1000
+
+
+def _insert(db):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(models.DispatchLedger.__table__)
+
+
+def claim(db, campaign_id, contact_id):
+    """Reivindica o envio (sem commit). False se outra entrega já reivindicou."""
+    stmt = _insert(db).values(campaign_id=campaign_id, contact_id=contact_id, status=CLAIMED)
+    result = db.execute(stmt.on_conflict_do_nothing(index_elements=["campaign_id", "contact_id"]))
+    return result.rowcount == 1
+
+
+def record(db, campaign_id, contact_id, status):
+    """Grava o resultado (sem commit: vai junto com o log)."""
+    db.query(models.DispatchLedger).filter(
+        models.DispatchLedger.campaign_id == campaign_id,
+        models.DispatchLedger.contact_id == contact_id,
+    ).update({"status": status}, synchronize_session=False)
+
+
+def release(db, campaign_id, contact_id):
+    """Libera a chave de uma mensagem que voltou sem envio (sem commit)."""
+    db.query(models.DispatchLedger).filter(
+        models.DispatchLedger.campaign_id == campaign_id,
+        models.DispatchLedger.contact_id == contact_id,
+        models.DispatchLedger.status == CLAIMED,
+    ).delete(synchronize_session=False)
+
+
+def skip(db, campaign_id, contact_ids):
+    """Marca contatos pulados na alimentação (sem commit): o rewind não volta neles."""
+    for offset in range(0, len(contact_ids), SKIP_CHUNK):
+        stmt = _insert(db).values([
+            {"campaign_id": campaign_id, "contact_id": contact_id, "status": SKIPPED}
+            for contact_id in contact_ids[offset:offset + SKIP_CHUNK]
+        ])
+        db.execute(stmt.on_conflict_do_nothing(index_elements=["campaign_id", "contact_id"]))
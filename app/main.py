@@ -1,15 +1,36 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Body
+from fastapi import FastAPI, Depends, HTTPException, Body, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import delete, func, null, select, update
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
-import models, schemas, database, services, auth
+import asyncio
+import hmac
+import json
+import time
 
-# Cria Tabelas
-models.Base.metadata.create_all(bind=database.engine)
+import models, schemas, database, auth, metrics, migrations, search, segments, versions, scheduler, ratecontrol, timings, retention, responses, queues, receipts, suppressions, memberships, httpcache, jobs
 
-app = FastAPI(title="Heimdall API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cria/atualiza Tabelas (migrações versionadas, pela engine síncrona)
+    await run_in_threadpool(migrations.upgrade, database.engine)
+    if not receipts.RECEIPTS_WEBHOOK_TOKEN:
+        print("⚠️ RECEIPTS_WEBHOOK_TOKEN não definido: /webhooks/evolution recusa recibos (503)")
+    flusher = asyncio.create_task(receipts.run_flusher())
+    yield
+    flusher.cancel()
+    await asyncio.gather(flusher, return_exceptions=True)
+    await database.async_engine.dispose()
+
+# Endpoints assíncronos com sessões AsyncSession: uma consulta lenta espera no
+# event loop em vez de ocupar uma thread do pool. Os módulos de apoio
+# (segments, search, versions, scheduler) continuam síncronos e rodam via
+# AsyncSession.run_sync, na mesma sessão/transação da requisição.
+app = FastAPI(title="Heimdall API", lifespan=lifespan)
 
 # Configuração CORS
 app.add_middleware(
@@ -20,21 +41,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Dependência do Banco
-def get_db():
-    db = database.SessionLocal()
+# Dependência do Banco (a mesma do auth: uma sessão por requisição)
+get_db = database.get_db
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
     try:
-        yield db
+        response = await call_next(request)
+        status = response.status_code
+        return response
     finally:
-        db.close()
+        # Template da rota (ex: /campaigns/{campaign_id}) para não explodir a cardinalidade
+        route = request.scope.get("route")
+        metrics.REQUEST_LATENCY.labels(
+            request.method, route.path if route else "unmatched", str(status)
+        ).observe(time.perf_counter() - started)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 # ==========================================
 # 🔐 AUTH
 # ==========================================
 
 @app.post("/auth/register", response_model=schemas.User)
-def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.User).filter(models.User.email == user_in.email).first()
+async def register(user_in: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    existing = await db.scalar(select(models.User.id).where(models.User.email == user_in.email))
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
@@ -43,112 +79,191 @@ def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
         last_name=user_in.last_name,
         phone=user_in.phone,
         email=user_in.email,
-        password_hash=auth.hash_password(user_in.password),
+        # bcrypt é CPU: fora do event loop
+        password_hash=await run_in_threadpool(auth.hash_password, user_in.password),
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 @app.post("/auth/login", response_model=schemas.Token)
-def login(user_in: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == user_in.email).first()
-    if not user or not auth.verify_password(user_in.password, user.password_hash):
+async def login(user_in: schemas.UserLogin, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.email == user_in.email))
+    if not user or not await run_in_threadpool(auth.verify_password, user_in.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     token = auth.create_access_token(user)
     return schemas.Token(access_token=token)
 
+async def _conditional_json(request: Request, db: AsyncSession, user_id: int, scopes, build, exists=None) -> Response:
+    """
+    GET condicional (httpcache.py): 304 se o cliente já tem a versão atual dos
+    escopos; senão o corpo vem do cache de respostas ou de build() (JSON).
+    Rotas de um recurso passam `exists` (levanta 404): o ETag é do tenant, não
+    do id, então sem isso um id inexistente ou de outro tenant daria 304.
+    """
+    if exists:
+        await exists()
+    etag, last_modified = await db.run_sync(httpcache.validators, user_id, scopes)
+    headers = httpcache.headers(etag, last_modified)
+    if httpcache.not_modified(request.headers, etag, last_modified):
+        metrics.RESPONSE_CACHE.labels("not_modified").inc()
+        return Response(status_code=304, headers=headers)
+
+    key = (user_id, request.url.path, request.url.query)
+    body = httpcache.CACHE.get(key, etag)
+    if body is None:
+        metrics.RESPONSE_CACHE.labels("miss").inc()
+        body = responses.dumps(await build())
+        httpcache.CACHE.put(key, etag, body)
+    else:
+        metrics.RESPONSE_CACHE.labels("hit").inc()
+    return Response(body, media_type="application/json", headers=headers)
+
 # ==========================================
 # 📡 CONNECTIONS
 # ==========================================
 
 @app.post("/connections", response_model=schemas.Connection)
-def create_connection(
+async def create_connection(
     conn: schemas.ConnectionCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
     db_conn = models.Connection(**conn.dict(), user_id=current_user.id)
     db.add(db_conn)
-    db.commit()
-    db.refresh(db_conn)
+    await db.run_sync(versions.bump, current_user.id, versions.CONNECTIONS)
+    await db.commit()
+    await db.refresh(db_conn)
     return db_conn
 
+# Colunas de schemas.Connection (breaker_state e parked_messages são calculados)
+CONNECTION_FIELDS = (
+    "id", "name", "api_url", "api_key", "instance_name", "messages_per_minute",
+    "min_messages_per_minute", "is_healthy", "effective_rate", "unhealthy_since",
+    "instance_state", "probed_at",
+)
+
+async def _connection_rows(db: AsyncSession, stmt) -> List[dict]:
+    """
+    Conexões do SELECT como dicts, com o estado do breaker e quantas mensagens
+    cada uma tem retidas (uma query só, só para as de breaker aberto).
+    """
+    rows = (await db.execute(
+        stmt.with_only_columns(*[getattr(models.Connection, field) for field in CONNECTION_FIELDS])
+    )).all()
+    connections = responses.rows_to_dicts(CONNECTION_FIELDS, rows)
+    ids = [c["id"] for c in connections if c["is_healthy"] is False]
+    counts = {}
+    if ids:
+        parked = await db.execute(
+            select(models.ParkedMessage.connection_id, func.count(models.ParkedMessage.id))
+            .where(models.ParkedMessage.connection_id.in_(ids))
+            .group_by(models.ParkedMessage.connection_id)
+        )
+        counts = dict(parked.all())
+    for conn in connections:
+        conn["is_healthy"] = conn["is_healthy"] is not False
+        conn["breaker_state"] = "closed" if conn["is_healthy"] else "open"
+        conn["parked_messages"] = counts.get(conn["id"], 0)
+    return connections
+
 @app.get("/connections", response_model=List[schemas.Connection])
-def list_connections(
+async def list_connections(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    return (
-        db.query(models.Connection)
-        .filter(models.Connection.user_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+    async def build():
+        return await _connection_rows(db, (
+            select(models.Connection)
+            .where(models.Connection.user_id == current_user.id)
+            .order_by(models.Connection.id)
+            .offset(skip)
+            .limit(limit)
+        ))
+    return await _conditional_json(request, db, current_user.id, (versions.CONNECTIONS,), build)
 
 @app.get("/connections/{connection_id}", response_model=schemas.Connection)
-def get_connection(
+async def get_connection(
     connection_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    db_conn = (
-        db.query(models.Connection)
-        .filter(
-            models.Connection.id == connection_id,
-            models.Connection.user_id == current_user.id,
+    async def exists():
+        found = await db.scalar(
+            select(models.Connection.id)
+            .where(
+                models.Connection.id == connection_id,
+                models.Connection.user_id == current_user.id,
+            )
         )
-        .first()
-    )
-    if not db_conn:
-        raise HTTPException(status_code=404, detail="Connection not found")
-    return db_conn
+        if not found:
+            raise HTTPException(status_code=404, detail="Connection not found")
+
+    async def build():
+        connections = await _connection_rows(db, (
+            select(models.Connection)
+            .where(
+                models.Connection.id == connection_id,
+                models.Connection.user_id == current_user.id,
+            )
+        ))
+        if not connections:
+            raise HTTPException(status_code=404, detail="Connection not found")
+        return connections[0]
+    return await _conditional_json(request, db, current_user.id, (versions.CONNECTIONS,), build, exists)
 
 # ==========================================
 # 🏷️ TAGS
 # ==========================================
 
 @app.post("/tags", response_model=schemas.Tag)
-def create_tag(
+async def create_tag(
     tag: schemas.TagCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
     db_tag = models.Tag(name=tag.name, user_id=current_user.id)
     db.add(db_tag)
-    db.commit()
-    db.refresh(db_tag)
+    await db.run_sync(versions.bump, current_user.id, versions.TAGS)
+    await db.commit()
+    await db.refresh(db_tag)
     return db_tag
 
+TAG_FIELDS = ("id", "name")
+
 @app.get("/tags", response_model=List[schemas.Tag])
-def list_tags(
+async def list_tags(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    return (
-        db.query(models.Tag)
-        .filter(models.Tag.user_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+    async def build():
+        rows = (await db.execute(
+            select(models.Tag.id, models.Tag.name)
+            .where(models.Tag.user_id == current_user.id)
+            .order_by(models.Tag.id)
+            .offset(skip)
+            .limit(limit)
+        )).all()
+        return responses.rows_to_dicts(TAG_FIELDS, rows)
+    return await _conditional_json(request, db, current_user.id, (versions.TAGS,), build)
 
 @app.get("/tags/{tag_id}", response_model=schemas.Tag)
-def get_tag(
+async def get_tag(
     tag_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    tag = (
-        db.query(models.Tag)
-        .filter(models.Tag.id == tag_id, models.Tag.user_id == current_user.id)
-        .first()
+    tag = await db.scalar(
+        select(models.Tag).where(models.Tag.id == tag_id, models.Tag.user_id == current_user.id)
     )
     if not tag:
         raise HTTPException(status_code=404, detail="Tag not found")
@@ -158,20 +273,46 @@ def get_tag(
 # 👤 CONTACTS
 # ==========================================
 
+CONTACT_FIELDS = ("id", "name", "number")
+
+async def _contact_page(db: AsyncSession, stmt, skip: int, limit: int, after_id: Optional[int]) -> Response:
+    """
+    Página de contatos (com tags) de um SELECT sobre contacts, ordenada por id.
+    Só as colunas do schema + uma query para as tags da página (responses.py).
+    """
+    stmt = stmt.with_only_columns(
+        *[getattr(models.Contact, field) for field in CONTACT_FIELDS]
+    ).order_by(models.Contact.id)
+    if after_id is not None:
+        stmt = stmt.where(models.Contact.id > after_id)
+    page = responses.rows_to_dicts(CONTACT_FIELDS, (await db.execute(stmt.offset(skip).limit(limit))).all())
+
+    tags = {}
+    if page:
+        rows = await db.execute(
+            select(models.contact_tags.c.contact_id, models.Tag.id, models.Tag.name)
+            .join(models.Tag, models.Tag.id == models.contact_tags.c.tag_id)
+            .where(models.contact_tags.c.contact_id.in_([contact["id"] for contact in page]))
+        )
+        for contact_id, tag_id, name in rows.all():
+            tags.setdefault(contact_id, []).append({"id": tag_id, "name": name})
+    for contact in page:
+        contact["tags"] = tags.get(contact["id"], [])
+    return responses.FastJSONResponse(page)
+
 @app.post("/contacts", response_model=schemas.Contact)
-def create_contact(
+async def create_contact(
     contact: schemas.ContactCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
     # Verifica duplicidade
-    existing = (
-        db.query(models.Contact)
-        .filter(
+    existing = await db.scalar(
+        select(models.Contact.id)
+        .where(
             models.Contact.number == contact.number,
             models.Contact.user_id == current_user.id,
         )
-        .first()
     )
     if existing:
         raise HTTPException(status_code=400, detail="Number already registered")
@@ -181,49 +322,77 @@ def create_contact(
         number=contact.number,
         user_id=current_user.id,
     )
+    tags = []
     if contact.tag_ids:
-        tags = (
-            db.query(models.Tag)
-            .filter(
+        tags = (await db.scalars(
+            select(models.Tag)
+            .where(
                 models.Tag.id.in_(contact.tag_ids),
                 models.Tag.user_id == current_user.id,
             )
-            .all()
-        )
-        db_contact.tags = tags
+        )).all()
+    db_contact.tags = list(tags)
     db.add(db_contact)
-    db.commit()
-    db.refresh(db_contact)
+    await db.run_sync(versions.bump, current_user.id, versions.AUDIENCE)
+    await db.commit()
     return db_contact
 
 @app.get("/contacts", response_model=List[schemas.Contact])
-def list_contacts(
+async def list_contacts(
     skip: int = 0,
-    limit: int = 1000,
-    db: Session = Depends(get_db),
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    return (
-        db.query(models.Contact)
-        .filter(models.Contact.user_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
+    # after_id = paginação por cursor (custo constante, ao contrário de offsets altos)
+    stmt = select(models.Contact).where(models.Contact.user_id == current_user.id)
+    return await _contact_page(db, stmt, skip, limit, after_id)
+
+@app.get("/contacts/count", response_model=schemas.ContactCount)
+async def count_contacts(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """Total de contatos do tenant (o /contacts é paginado, não serve para contar)."""
+    async def build():
+        total = await db.scalar(
+            select(func.count(models.Contact.id)).where(models.Contact.user_id == current_user.id)
+        )
+        return {"total": total}
+    return await _conditional_json(request, db, current_user.id, (versions.AUDIENCE,), build)
+
+@app.get("/contacts/search", response_model=List[schemas.Contact])
+async def search_contacts(
+    q: Optional[str] = None,
+    tag_ids: List[int] = Query([]),
+    list_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = Query(50, ge=1, le=500),
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    # q só com dígitos/formatação busca por início ou final do número; senão, por nome
+    query = await db.run_sync(
+        search.search_contacts, current_user.id, q=q, tag_ids=tag_ids, list_id=list_id
     )
+    return await _contact_page(db, query.statement, skip, limit, after_id)
 
 @app.get("/contacts/{contact_id}", response_model=schemas.Contact)
-def get_contact(
+async def get_contact(
     contact_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    contact = (
-        db.query(models.Contact)
-        .filter(
+    contact = await db.scalar(
+        select(models.Contact)
+        .options(selectinload(models.Contact.tags))
+        .where(
             models.Contact.id == contact_id,
             models.Contact.user_id == current_user.id,
         )
-        .first()
     )
     if not contact:
         raise HTTPException(status_code=404, detail="Contact not found")
@@ -233,60 +402,173 @@ def get_contact(
 # 📋 CONTACT LISTS
 # ==========================================
 
+LIST_FIELDS = ("id", "name", "member_count")
+
+def _contact_lists_query(user_id: int):
+    """(id, name, quantidade de membros) das listas em uma única query agregada."""
+    member_count = func.count(models.list_contacts.c.contact_id)
+    return (
+        select(models.ContactList.id, models.ContactList.name, member_count)
+        .outerjoin(models.list_contacts, models.list_contacts.c.list_id == models.ContactList.id)
+        .where(models.ContactList.user_id == user_id)
+        .group_by(models.ContactList.id)
+    )
+
+def _list_summary(list_id: int, name: str, member_count: int) -> schemas.ContactList:
+    return schemas.ContactList(id=list_id, name=name, member_count=member_count)
+
+# member_count muda com qualquer escrita de audiência (imports, membros em massa)
+LIST_SCOPES = (versions.LISTS, versions.AUDIENCE)
+
 @app.get("/lists", response_model=List[schemas.ContactList])
-def list_contact_lists(
+async def list_contact_lists(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    return (
-        db.query(models.ContactList)
-        .filter(models.ContactList.user_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+    async def build():
+        rows = (await db.execute(
+            _contact_lists_query(current_user.id)
+            .order_by(models.ContactList.id)
+            .offset(skip)
+            .limit(limit)
+        )).all()
+        return responses.rows_to_dicts(LIST_FIELDS, rows)
+    return await _conditional_json(request, db, current_user.id, LIST_SCOPES, build)
 
 @app.post("/lists", response_model=schemas.ContactList)
-def create_contact_list(
+async def create_contact_list(
     list_in: schemas.ContactListCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
     new_list = models.ContactList(name=list_in.name, user_id=current_user.id)
     db.add(new_list)
-    db.commit()
-    db.refresh(new_list)
-    return new_list
+    await db.run_sync(versions.bump, current_user.id, versions.LISTS)
+    await db.commit()
+    return _list_summary(new_list.id, new_list.name, 0)
 
 @app.get("/lists/{list_id}", response_model=schemas.ContactList)
-def get_contact_list(
+async def get_contact_list(
     list_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    # Aqui retornará a lista E os contatos dentro dela (definido no schema)
-    lst = (
-        db.query(models.ContactList)
-        .filter(
+    # Só metadados + contagem; os membros saem paginados em /lists/{id}/contacts
+    row = (await db.execute(
+        _contact_lists_query(current_user.id)
+        .where(models.ContactList.id == list_id)
+    )).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="List not found")
+    return _list_summary(*row)
+
+async def _check_list_owner(db: AsyncSession, list_id: int, user_id: int):
+    found = await db.scalar(
+        select(models.ContactList.id)
+        .where(
             models.ContactList.id == list_id,
-            models.ContactList.user_id == current_user.id,
+            models.ContactList.user_id == user_id,
         )
-        .first()
     )
-    if not lst:
+    if not found:
         raise HTTPException(status_code=404, detail="List not found")
-    return lst
+
+@app.get("/lists/{list_id}/contacts", response_model=List[schemas.Contact])
+async def list_contact_list_members(
+    list_id: int,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    await _check_list_owner(db, list_id, current_user.id)
+
+    stmt = (
+        select(models.Contact)
+        .join(models.list_contacts, models.list_contacts.c.contact_id == models.Contact.id)
+        .where(models.list_contacts.c.list_id == list_id)
+    )
+    return await _contact_page(db, stmt, skip, limit, after_id)
+
+async def _membership_selection(db: AsyncSession, user_id: int, change: schemas.ListMembershipChange):
+    """SELECTs dos contatos do pedido (memberships.py), com a expressão validada."""
+    if not (change.contact_ids or change.tag_ids or (change.q or "").strip() or change.definition):
+        raise HTTPException(status_code=400, detail="Provide contact_ids, tag_ids, q or definition")
+    if change.definition:
+        await _validate_audience(db, user_id, change.definition)
+    return await db.run_sync(
+        memberships.selections, user_id,
+        contact_ids=change.contact_ids, tag_ids=change.tag_ids, q=change.q, definition=change.definition,
+    )
+
+@app.post("/lists/{list_id}/contacts", response_model=schemas.ListMembershipResult)
+async def add_list_members(
+    list_id: int,
+    change: schemas.ListMembershipChange,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    await _check_list_owner(db, list_id, current_user.id)
+    statements = await _membership_selection(db, current_user.id, change)
+    added = await db.run_sync(memberships.add, list_id, statements)
+    if added:
+        await db.run_sync(versions.bump, current_user.id, versions.AUDIENCE)
+    await db.commit()
+    member_count = await db.run_sync(memberships.member_count, list_id)
+    return schemas.ListMembershipResult(list_id=list_id, added=added, member_count=member_count)
+
+@app.post("/lists/{list_id}/contacts/remove", response_model=schemas.ListMembershipResult)
+async def remove_list_members(
+    list_id: int,
+    change: schemas.ListMembershipChange,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    await _check_list_owner(db, list_id, current_user.id)
+    statements = await _membership_selection(db, current_user.id, change)
+    removed = await db.run_sync(memberships.remove, list_id, statements)
+    if removed:
+        await db.run_sync(versions.bump, current_user.id, versions.AUDIENCE)
+    await db.commit()
+    member_count = await db.run_sync(memberships.member_count, list_id)
+    return schemas.ListMembershipResult(list_id=list_id, removed=removed, member_count=member_count)
+
+@app.post("/lists/compose", response_model=schemas.ContactList)
+async def compose_contact_list(
+    compose_in: schemas.ListCompose,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    # Nova lista = união/interseção/diferença de listas e tags, num INSERT ... SELECT
+    try:
+        expr = memberships.compose(compose_in.operation, compose_in.sources)
+    except segments.SegmentError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    await _validate_audience(db, current_user.id, expr)
+
+    new_list = models.ContactList(name=compose_in.name, user_id=current_user.id)
+    db.add(new_list)
+    await db.flush()
+    statements = await db.run_sync(memberships.selections, current_user.id, definition=expr)
+    added = await db.run_sync(memberships.add, new_list.id, statements)
+    if added:
+        await db.run_sync(versions.bump, current_user.id, versions.AUDIENCE)
+    await db.run_sync(versions.bump, current_user.id, versions.LISTS)
+    await db.commit()
+    return _list_summary(new_list.id, new_list.name, added)
 
 # ==========================================
 # 📥 CONTACT IMPORT
 # ==========================================
 
 @app.post("/contacts/import", response_model=schemas.ContactImportResponse)
-def import_contacts(
+async def import_contacts(
     payload: schemas.ContactImportRequest = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
     contacts = payload.contacts
@@ -294,25 +576,25 @@ def import_contacts(
         raise HTTPException(status_code=400, detail="No contacts provided")
 
     tags = (
-        db.query(models.Tag)
-        .filter(
-            models.Tag.id.in_(payload.tag_ids),
-            models.Tag.user_id == current_user.id,
-        )
-        .all()
+        (await db.scalars(
+            select(models.Tag)
+            .where(
+                models.Tag.id.in_(payload.tag_ids),
+                models.Tag.user_id == current_user.id,
+            )
+        )).all()
         if payload.tag_ids
         else []
     )
 
     contact_list = None
     if payload.list_id:
-        contact_list = (
-            db.query(models.ContactList)
-            .filter(
+        contact_list = await db.scalar(
+            select(models.ContactList)
+            .where(
                 models.ContactList.id == payload.list_id,
                 models.ContactList.user_id == current_user.id,
             )
-            .first()
         )
         if not contact_list:
             raise HTTPException(status_code=404, detail="List not found")
@@ -321,13 +603,12 @@ def import_contacts(
     skipped = 0
 
     for c in contacts:
-        existing = (
-            db.query(models.Contact)
-            .filter(
+        existing = await db.scalar(
+            select(models.Contact.id)
+            .where(
                 models.Contact.number == c.number,
                 models.Contact.user_id == current_user.id,
             )
-            .first()
         )
         if existing:
             skipped += 1
@@ -337,15 +618,16 @@ def import_contacts(
             name=c.name,
             number=c.number,
             user_id=current_user.id,
+            tags=list(tags),
+            lists=[contact_list] if contact_list else [],
         )
-        new_contact.tags = tags
-        if contact_list:
-            new_contact.lists.append(contact_list)
 
         db.add(new_contact)
         created += 1
 
-    db.commit()
+    if created:
+        await db.run_sync(versions.bump, current_user.id, versions.AUDIENCE)
+    await db.commit()
 
     return schemas.ContactImportResponse(
         imported=created,
@@ -354,69 +636,214 @@ def import_contacts(
         tag_ids=payload.tag_ids,
     )
 # ==========================================
+# 🚫 SUPPRESSIONS
+# ==========================================
+
+SUPPRESSION_FIELDS = ("number", "reason", "detail", "created_at")
+
+@app.post("/suppressions", response_model=schemas.SuppressionAddResponse)
+async def add_suppressions(
+    payload: schemas.SuppressionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    if not payload.numbers:
+        raise HTTPException(status_code=400, detail="No numbers provided")
+    if payload.reason not in suppressions.REASONS:
+        raise HTTPException(status_code=400, detail=f"Reason must be one of {', '.join(suppressions.REASONS)}")
+    added = await db.run_sync(suppressions.add, current_user.id, payload.numbers, payload.reason)
+    await db.commit()
+    return schemas.SuppressionAddResponse(added=added, skipped=len(payload.numbers) - added)
+
+@app.get("/suppressions", response_model=List[schemas.Suppression])
+async def list_suppressions(
+    reason: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    # after = último número da página anterior (paginação por cursor, em ordem de número)
+    stmt = (
+        select(*[getattr(models.Suppression, field) for field in SUPPRESSION_FIELDS])
+        .where(models.Suppression.user_id == current_user.id)
+        .order_by(models.Suppression.number)
+        .limit(limit)
+    )
+    if reason:
+        stmt = stmt.where(models.Suppression.reason == reason)
+    if after:
+        stmt = stmt.where(models.Suppression.number > after)
+    rows = (await db.execute(stmt)).all()
+    return responses.FastJSONResponse(responses.rows_to_dicts(SUPPRESSION_FIELDS, rows))
+
+@app.delete("/suppressions/{number}")
+async def delete_suppression(
+    number: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    if not await db.run_sync(suppressions.remove, current_user.id, number):
+        raise HTTPException(status_code=404, detail="Number not suppressed")
+    await db.commit()
+    return {"status": "removed", "number": models.normalize_number(number)}
+
+# ==========================================
+# 🎯 SEGMENTS
+# ==========================================
+
+async def _validate_audience(db: AsyncSession, user_id: int, expr: dict):
+    try:
+        await db.run_sync(segments.validate, user_id, expr)
+    except segments.SegmentNotFound as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except segments.SegmentError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+async def _get_segment(db: AsyncSession, segment_id: int, user_id: int) -> models.Segment:
+    segment = await db.scalar(
+        select(models.Segment)
+        .where(models.Segment.id == segment_id, models.Segment.user_id == user_id)
+    )
+    if not segment:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    return segment
+
+def _segment_out(segment: models.Segment) -> schemas.Segment:
+    return schemas.Segment(id=segment.id, name=segment.name, definition=json.loads(segment.definition))
+
+@app.post("/segments", response_model=schemas.Segment)
+async def create_segment(
+    segment_in: schemas.SegmentCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    await _validate_audience(db, current_user.id, segment_in.definition)
+    segment = models.Segment(
+        name=segment_in.name,
+        definition=segments.canonical(segment_in.definition),
+        user_id=current_user.id,
+    )
+    db.add(segment)
+    await db.commit()
+    return _segment_out(segment)
+
+@app.get("/segments", response_model=List[schemas.Segment])
+async def list_segments(
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    rows = (await db.scalars(
+        select(models.Segment)
+        .where(models.Segment.user_id == current_user.id)
+        .order_by(models.Segment.id)
+        .offset(skip)
+        .limit(limit)
+    )).all()
+    return [_segment_out(segment) for segment in rows]
+
+@app.post("/segments/preview", response_model=schemas.SegmentCount)
+async def preview_segment(
+    preview: schemas.SegmentPreview,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    # Só a contagem: nada é materializado
+    await _validate_audience(db, current_user.id, preview.definition)
+    total = await db.run_sync(segments.count, current_user.id, preview.definition)
+    return schemas.SegmentCount(count=total)
+
+@app.get("/segments/{segment_id}", response_model=schemas.Segment)
+async def get_segment(
+    segment_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    return _segment_out(await _get_segment(db, segment_id, current_user.id))
+
+@app.get("/segments/{segment_id}/count", response_model=schemas.SegmentCount)
+async def count_segment(
+    segment_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    segment = await _get_segment(db, segment_id, current_user.id)
+    total = await db.run_sync(segments.count, current_user.id, json.loads(segment.definition))
+    return schemas.SegmentCount(segment_id=segment.id, count=total)
+
+@app.get("/segments/{segment_id}/contacts", response_model=List[schemas.Contact])
+async def list_segment_contacts(
+    segment_id: int,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    segment = await _get_segment(db, segment_id, current_user.id)
+    query = await db.run_sync(segments.audience_query, current_user.id, json.loads(segment.definition))
+    return await _contact_page(db, query.statement, skip, limit, after_id)
+
+# ==========================================
 # 📢 CAMPAIGNS
 # ==========================================
 
 @app.post("/campaigns")
-def create_and_start_campaign(
+async def create_and_start_campaign(
     campaign_in: schemas.CampaignCreate, 
-    background_tasks: BackgroundTasks, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    # 1. Valida Conexão
-    conn = (
-        db.query(models.Connection)
-        .filter(
-            models.Connection.id == campaign_in.connection_id,
+    # 1. Valida Conexões (pool com pesos ou conexão única)
+    members_in = campaign_in.connections or (
+        [schemas.CampaignConnectionIn(connection_id=campaign_in.connection_id)]
+        if campaign_in.connection_id else []
+    )
+    if not members_in:
+        raise HTTPException(status_code=400, detail="Provide connection_id or connections")
+    connection_ids = {m.connection_id for m in members_in}
+    if len(connection_ids) != len(members_in):
+        raise HTTPException(status_code=400, detail="Duplicate connection in pool")
+    if any(m.weight < 1 for m in members_in):
+        raise HTTPException(status_code=400, detail="Connection weight must be positive")
+    if not 0 <= campaign_in.priority <= 10:
+        raise HTTPException(status_code=400, detail="Priority must be between 0 and 10")
+    found = await db.scalar(
+        select(func.count(models.Connection.id))
+        .where(
+            models.Connection.id.in_(connection_ids),
             models.Connection.user_id == current_user.id,
         )
-        .first()
     )
-    if not conn:
+    if found != len(connection_ids):
         raise HTTPException(status_code=404, detail="Connection ID not found")
 
-    # 2. Define Lista (Existente ou por Tags)
-    list_id = campaign_in.contact_list_id
-    if not list_id and campaign_in.target_tags_ids:
-        # Cria lista dinâmica
-        new_list = models.ContactList(
-            name=f"Auto-List: {campaign_in.name}",
-            user_id=current_user.id,
-        )
-        contacts_query = (
-            db.query(models.Contact)
-            .filter(
-                models.Contact.user_id == current_user.id,
-                models.Contact.tags.any(
-                    models.Tag.id.in_(campaign_in.target_tags_ids)
-                ),
-            )
-            .all()
-        )
-        
-        if not contacts_query:
-            raise HTTPException(status_code=400, detail="No contacts found for these tags")
-
-        new_list.contacts = contacts_query
-        db.add(new_list)
-        db.flush()
-        list_id = new_list.id
-    
-    if list_id:
-        existing_list = (
-            db.query(models.ContactList)
-            .filter(
-                models.ContactList.id == list_id,
-                models.ContactList.user_id == current_user.id,
-            )
-            .first()
-        )
-        if not existing_list:
-            raise HTTPException(status_code=404, detail="List not found")
+    # 2. Define Audiência (lista, segmento salvo ou tags). Avaliada em SQL no
+    # disparo: nenhuma cópia dos membros é criada.
+    if campaign_in.contact_list_id:
+        audience = {"list": campaign_in.contact_list_id}
+    elif campaign_in.segment_id:
+        segment = await _get_segment(db, campaign_in.segment_id, current_user.id)
+        audience = json.loads(segment.definition)
+    elif campaign_in.target_tags_ids:
+        audience = {"or": [{"tag": tag_id} for tag_id in campaign_in.target_tags_ids]}
+    else:
+        raise HTTPException(status_code=400, detail="Provide a list_id, segment_id or target_tags_ids")
+
+    await _validate_audience(db, current_user.id, audience)
+    # Só o LIMIT 1: a contagem inteira fica para o job de lançamento (jobs.py)
+    if not await db.run_sync(segments.has_contacts, current_user.id, audience):
+        raise HTTPException(status_code=400, detail="No contacts found for this audience")
 
-    if not list_id:
-        raise HTTPException(status_code=400, detail="Provide a list_id or target_tags_ids")
+    try:
+        scheduler.validate_schedule(
+            campaign_in.send_window_start, campaign_in.send_window_end, campaign_in.timezone
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    scheduled_at = scheduler.to_utc_naive(campaign_in.scheduled_at)
 
     # 3. Cria Campanha
     new_campaign = models.Campaign(
@@ -425,112 +852,198 @@ def create_and_start_campaign(
         media_url=campaign_in.media_url,
         media_type=campaign_in.media_type,
         messages_per_minute=campaign_in.messages_per_minute,
-        contact_list_id=list_id,
-        connection_id=conn.id,
+        priority=campaign_in.priority,
+        contact_list_id=campaign_in.contact_list_id,
+        segment_id=campaign_in.segment_id,
+        audience=segments.canonical(audience),
+        total_contacts=null(), # NULL (não o default 0) até o job contar
+        scheduled_at=scheduled_at,
+        send_window_start=campaign_in.send_window_start,
+        send_window_end=campaign_in.send_window_end,
+        timezone=campaign_in.timezone,
+        connection_id=members_in[0].connection_id,
+        connections=[
+            models.CampaignConnection(connection_id=m.connection_id, weight=m.weight)
+            for m in members_in
+        ],
         user_id=current_user.id,
-        status="processing"
+        status=jobs.PREPARING,
     )
     db.add(new_campaign)
-    db.commit()
-    db.refresh(new_campaign)
-    
-    # 4. Envia para Fila
-    target_list = (
-        db.query(models.ContactList)
-        .filter(
-            models.ContactList.id == list_id,
-            models.ContactList.user_id == current_user.id,
-        )
-        .first()
-    )
-    contacts_data = [{"number": c.number, "name": c.name} for c in target_list.contacts]
-    
-    campaign_dict = {
-        "id": new_campaign.id,
-        "message_body": new_campaign.message_body,
-        "media_url": new_campaign.media_url,
-        "media_type": new_campaign.media_type,
-        "messages_per_minute": new_campaign.messages_per_minute
-    }
-    
-    connection_dict = {
-        "api_url": conn.api_url,
-        "api_key": conn.api_key,
-        "instance_name": conn.instance_name
-    }
+    await db.flush()
+
+    # 4. Contagem da audiência num job durável (jobs.py); no fim ele põe a
+    # campanha em scheduled/processing e o scheduler alimenta a fila aos poucos
+    job = await db.run_sync(jobs.enqueue, new_campaign, jobs.LAUNCH_CAMPAIGN)
+    await db.run_sync(versions.bump, current_user.id, versions.CAMPAIGNS)
+    await db.commit()
+
+    return {"status": new_campaign.status, "campaign_id": new_campaign.id, "job_id": job.id}
 
-    background_tasks.add_task(services.publish_campaign_to_queue, campaign_dict, connection_dict, contacts_data)
+# Colunas de schemas.Campaign (connections vem da tabela do pool)
+CAMPAIGN_FIELDS = (
+    "id", "name", "message_body", "media_url", "media_type", "messages_per_minute",
+    "priority", "status", "connection_id", "contact_list_id", "segment_id",
+    "total_contacts", "scheduled_at", "send_window_start", "send_window_end", "timezone",
+)
+
+async def _with_pools(db: AsyncSession, campaigns: List[dict]) -> List[dict]:
+    """Anexa o pool de conexões (connection_id, weight) de cada campanha (uma query só)."""
+    pools = {}
+    if campaigns:
+        members = await db.execute(
+            select(
+                models.CampaignConnection.campaign_id,
+                models.CampaignConnection.connection_id,
+                models.CampaignConnection.weight,
+            )
+            .where(models.CampaignConnection.campaign_id.in_([c["id"] for c in campaigns]))
+        )
+        for campaign_id, connection_id, weight in members.all():
+            pools.setdefault(campaign_id, []).append({"connection_id": connection_id, "weight": weight})
+    for campaign in campaigns:
+        campaign["connections"] = pools.get(campaign["id"], [])
+    return campaigns
 
-    return {"status": "started", "campaign_id": new_campaign.id, "total_contacts": len(contacts_data)}
+def _campaigns_query(user_id: int):
+    return (
+        select(*[getattr(models.Campaign, field) for field in CAMPAIGN_FIELDS])
+        .where(models.Campaign.user_id == user_id)
+    )
 
 @app.get("/campaigns", response_model=List[schemas.Campaign])
-def list_campaigns(
+async def list_campaigns(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    return (
-        db.query(models.Campaign)
-        .filter(models.Campaign.user_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+    async def build():
+        rows = (await db.execute(
+            _campaigns_query(current_user.id)
+            .order_by(models.Campaign.id)
+            .offset(skip)
+            .limit(limit)
+        )).all()
+        return await _with_pools(db, responses.rows_to_dicts(CAMPAIGN_FIELDS, rows))
+    return await _conditional_json(request, db, current_user.id, (versions.CAMPAIGNS,), build)
 
 @app.get("/campaigns/{campaign_id}", response_model=schemas.Campaign)
-def get_campaign(
+async def get_campaign(
+    campaign_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    async def exists():
+        found = await db.scalar(
+            select(models.Campaign.id)
+            .where(
+                models.Campaign.id == campaign_id,
+                models.Campaign.user_id == current_user.id,
+            )
+        )
+        if not found:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+
+    async def build():
+        rows = (await db.execute(
+            _campaigns_query(current_user.id).where(models.Campaign.id == campaign_id)
+        )).all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        return (await _with_pools(db, responses.rows_to_dicts(CAMPAIGN_FIELDS, rows)))[0]
+    return await _conditional_json(request, db, current_user.id, (versions.CAMPAIGNS,), build, exists)
+
+FINISHED_STATUSES = ("completed", "cancelled")
+
+async def _stop_campaign(db: AsyncSession, campaign: models.Campaign, status: str) -> int:
+    """
+    Pause/cancel em O(1): o scheduler para de alimentar, o novo epoch faz os
+    workers largarem o que já está na fila e, na fila embutida, as mensagens
+    pendentes são apagadas de uma vez. Devolve quantas saíram da fila.
+    """
+    campaign.status = status
+    campaign.feed_epoch = (campaign.feed_epoch or 0) + 1
+    campaign.next_send_at = None
+    # Slots reservados para o que foi descartado: o resume recomeça do agora
+    await db.execute(
+        update(models.CampaignConnection)
+        .where(models.CampaignConnection.campaign_id == campaign.id)
+        .values(next_send_at=None)
+    )
+    # Retidas pelo breaker voltariam com o epoch antigo; o resume as reenvia pelo cursor
+    await db.execute(delete(models.ParkedMessage).where(models.ParkedMessage.campaign_id == campaign.id))
+    # Preparo em andamento: o runner larga o job no próximo checkpoint
+    await db.run_sync(jobs.cancel_open, campaign.id)
+    await db.run_sync(versions.bump, campaign.user_id, versions.CAMPAIGNS)
+    await db.run_sync(versions.bump, campaign.user_id, versions.CONNECTIONS)
+    await db.commit()
+    try:
+        return await run_in_threadpool(queues.purge_campaign, campaign.id)
+    except Exception as e:
+        # O epoch já garante o descarte; a limpeza da fila é só atalho
+        print(f"Erro ao limpar a fila da campanha {campaign.id}: {e}")
+        return 0
+
+@app.post("/campaigns/{campaign_id}/pause")
+async def pause_campaign(
     campaign_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    campaign = (
-        db.query(models.Campaign)
-        .filter(
+    campaign = await db.scalar(
+        select(models.Campaign)
+        .where(
             models.Campaign.id == campaign_id,
             models.Campaign.user_id == current_user.id,
         )
-        .first()
     )
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
-    return campaign
 
-@app.post("/campaigns/{campaign_id}/pause")
-def pause_campaign(
+    if campaign.status in FINISHED_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Campaign is already {campaign.status}")
+
+    purged = await _stop_campaign(db, campaign, "paused")
+    return {"status": "paused", "campaign_id": campaign.id, "purged": purged}
+
+@app.post("/campaigns/{campaign_id}/cancel")
+async def cancel_campaign(
     campaign_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    campaign = (
-        db.query(models.Campaign)
-        .filter(
+    campaign = await db.scalar(
+        select(models.Campaign)
+        .where(
             models.Campaign.id == campaign_id,
             models.Campaign.user_id == current_user.id,
         )
-        .first()
     )
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
 
-    campaign.status = "paused"
-    db.commit()
-    return {"status": "paused", "campaign_id": campaign.id}
+    if campaign.status in FINISHED_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Campaign is already {campaign.status}")
+
+    # Definitivo: não há resume, o que já foi enviado fica nos logs
+    purged = await _stop_campaign(db, campaign, "cancelled")
+    return {"status": "cancelled", "campaign_id": campaign.id, "purged": purged}
 
 @app.post("/campaigns/{campaign_id}/resume")
-def resume_campaign(
+async def resume_campaign(
     campaign_id: int,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    campaign = (
-        db.query(models.Campaign)
-        .filter(
+    campaign = await db.scalar(
+        select(models.Campaign)
+        .where(
             models.Campaign.id == campaign_id,
             models.Campaign.user_id == current_user.id,
         )
-        .first()
     )
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
@@ -538,117 +1051,223 @@ def resume_campaign(
     if campaign.status != "paused":
         raise HTTPException(status_code=400, detail="Only paused campaigns can be resumed")
 
-    contact_list = (
-        db.query(models.ContactList)
-        .filter(
-            models.ContactList.id == campaign.contact_list_id,
-            models.ContactList.user_id == current_user.id,
-        )
-        .first()
-    )
-    if not contact_list:
-        raise HTTPException(status_code=404, detail="Contact list not found")
-
-    processed_numbers = {
-        row[0]
-        for row in db.query(models.CampaignLog.contact_number)
-        .filter(models.CampaignLog.campaign_id == campaign.id)
-        .distinct()
-        .all()
-    }
-    contacts_data = [
-        {"number": c.number, "name": c.name}
-        for c in contact_list.contacts
-        if c.number not in processed_numbers
-    ]
-
-    conn = (
-        db.query(models.Connection)
-        .filter(
+    conn = await db.scalar(
+        select(models.Connection.id)
+        .where(
             models.Connection.id == campaign.connection_id,
             models.Connection.user_id == current_user.id,
         )
-        .first()
     )
     if not conn:
         raise HTTPException(status_code=404, detail="Connection not found")
 
-    campaign.status = "processing"
-    db.commit()
+    # O rewind do cursor (voltar para as mensagens descartadas durante o
+    # pause) varre a audiência: roda no job de resume (jobs.py)
+    campaign.status = jobs.PREPARING
+    # Epoch novo: o worker que ainda tem "paused" em cache (CampaignStateCache)
+    # vê as mensagens do resume como mais novas e relê a campanha em vez de largá-las
+    campaign.feed_epoch = (campaign.feed_epoch or 0) + 1
+    job = await db.run_sync(jobs.enqueue, campaign, jobs.RESUME_CAMPAIGN)
+    await db.run_sync(versions.bump, current_user.id, versions.CAMPAIGNS)
+    await db.commit()
 
-    campaign_dict = {
-        "id": campaign.id,
-        "message_body": campaign.message_body,
-        "media_url": campaign.media_url,
-        "media_type": campaign.media_type,
-        "messages_per_minute": campaign.messages_per_minute
-    }
+    return {"status": "resumed", "campaign_id": campaign.id, "job_id": job.id}
 
-    connection_dict = {
-        "api_url": conn.api_url,
-        "api_key": conn.api_key,
-        "instance_name": conn.instance_name
-    }
+@app.get("/campaigns/{campaign_id}/jobs", response_model=List[schemas.Job])
+async def list_campaign_jobs(
+    campaign_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """Jobs de preparo (lançamento e resumes) da campanha, do mais recente ao mais antigo."""
+    rows = (await db.execute(
+        select(*[getattr(models.Job, field) for field in jobs.JOB_FIELDS])
+        .where(
+            models.Job.campaign_id == campaign_id,
+            models.Job.user_id == current_user.id,
+        )
+        .order_by(models.Job.id.desc())
+    )).all()
+    return responses.FastJSONResponse([jobs.decode(row) for row in responses.rows_to_dicts(jobs.JOB_FIELDS, rows)])
 
-    background_tasks.add_task(services.publish_campaign_to_queue, campaign_dict, connection_dict, contacts_data)
+# ==========================================
+# ⚙️ JOBS
+# ==========================================
 
-    return {"status": "resumed", "campaign_id": campaign.id, "total_contacts": len(contacts_data)}
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """Status e progresso (0-100) de um job; o checkpoint mostra onde ele retoma se o runner cair."""
+    rows = (await db.execute(
+        select(*[getattr(models.Job, field) for field in jobs.JOB_FIELDS])
+        .where(models.Job.id == job_id, models.Job.user_id == current_user.id)
+    )).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return responses.FastJSONResponse(jobs.decode(responses.rows_to_dicts(jobs.JOB_FIELDS, rows)[0]))
 
 # ==========================================
 # 📊 STATS & LOGS
 # ==========================================
 
+def _archived_logs_or_404(campaign_id: int):
+    """Logs de uma campanha arquivada (retention.py), lidos do arquivo compactado."""
+    try:
+        return list(retention.archived_logs(campaign_id))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Archived logs not found")
+
 @app.get("/campaigns/{campaign_id}/stats")
-def get_campaign_stats(
+async def get_campaign_stats(
     campaign_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    campaign = (
-        db.query(models.Campaign)
-        .filter(
+    campaign = await db.scalar(
+        select(models.Campaign)
+        .options(
+            selectinload(models.Campaign.connections).selectinload(models.CampaignConnection.connection)
+        )
+        .where(
             models.Campaign.id == campaign_id,
             models.Campaign.user_id == current_user.id,
         )
-        .first()
     )
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
     
-    stats = db.query(
-        models.CampaignLog.status, 
-        func.count(models.CampaignLog.id)
-    ).filter(
-        models.CampaignLog.campaign_id == campaign_id
-    ).group_by(
-        models.CampaignLog.status
-    ).all()
-    
-    result = {status: count for status, count in stats}
+    if campaign.logs_archived_at:
+        # Logs já foram para o arquivo: a contagem vem do rollup
+        result = await db.run_sync(retention.rollup_stats, campaign_id)
+    else:
+        stats = await db.execute(
+            select(models.CampaignLog.status, func.count(models.CampaignLog.id))
+            .where(models.CampaignLog.campaign_id == campaign_id)
+            .group_by(models.CampaignLog.status)
+        )
+        result = {status: count for status, count in stats.all()}
     total = sum(result.values())
+
+    # Taxa efetiva (adaptativa) de cada conexão do pool
+    ceiling = max(campaign.messages_per_minute or 1, 1)
+    connections = [
+        {
+            "connection_id": member.connection_id,
+            "weight": member.weight,
+            "is_healthy": member.connection.is_healthy is not False,
+            "breaker_state": member.connection.breaker_state,
+            "effective_rate": ratecontrol.effective_rate(member.connection, ceiling),
+        }
+        for member in campaign.connections
+    ]
     
     return {
         "campaign_name": campaign.name,
         "total_processed": total,
         "details": result,
-        "status": campaign.status
+        "status": campaign.status,
+        # Recibos do webhook (entregue/lido no WhatsApp, não só aceito pela Evolution)
+        "delivered": campaign.delivered_count or 0,
+        "read": campaign.read_count or 0,
+        "messages_per_minute": campaign.messages_per_minute,
+        "effective_rate": sum(c["effective_rate"] for c in connections if c["is_healthy"]),
+        "connections": connections,
     }
 
-@app.get("/campaigns/{campaign_id}/logs")
-def get_campaign_logs(
+@app.get("/campaigns/{campaign_id}/timings")
+async def get_campaign_timings(
     campaign_id: int,
-    db: Session = Depends(get_db),
+    connection_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    campaign = (
-        db.query(models.Campaign)
-        .filter(models.Campaign.id == campaign_id)
-        .first()
+    """Percentis (ms) de cada etapa do envio, no total e por conexão."""
+    campaign = await db.scalar(
+        select(models.Campaign)
+        .where(
+            models.Campaign.id == campaign_id,
+            models.Campaign.user_id == current_user.id,
+        )
     )
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+
+    if campaign.logs_archived_at:
+        rows = [
+            (log["connection_id"], log["timings"])
+            for log in await run_in_threadpool(_archived_logs_or_404, campaign_id)
+            if log["timings"] and (connection_id is None or log["connection_id"] == connection_id)
+        ][-timings.TIMINGS_SAMPLE_LIMIT:]
+    else:
+        stmt = select(models.CampaignLog.connection_id, models.CampaignLog.timings).where(
+            models.CampaignLog.campaign_id == campaign_id,
+            models.CampaignLog.timings.isnot(None),
+        )
+        if connection_id is not None:
+            stmt = stmt.where(models.CampaignLog.connection_id == connection_id)
+        rows = (await db.execute(
+            stmt.order_by(models.CampaignLog.id.desc()).limit(timings.TIMINGS_SAMPLE_LIMIT)
+        )).all()
+
+    samples, by_connection = [], {}
+    for conn_id, value in rows:
+        sample = timings.decode(value)
+        if sample is None:
+            continue
+        samples.append(sample)
+        by_connection.setdefault(conn_id, []).append(sample)
+
+    return {
+        "campaign_id": campaign_id,
+        "samples": len(samples),
+        "spans": timings.summarize(samples),
+        "connections": [
+            {"connection_id": conn_id, "samples": len(items), "spans": timings.summarize(items)}
+            for conn_id, items in sorted(by_connection.items(), key=lambda item: item[0] or 0)
+        ],
+    }
+
+@app.get("/campaigns/{campaign_id}/logs")
+async def get_campaign_logs(
+    campaign_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    campaign = await db.get(models.Campaign, campaign_id)
     if not campaign or campaign.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Campaign not found")
-    return (
-        db.query(models.CampaignLog)
-        .filter(models.CampaignLog.campaign_id == campaign_id)
-        .all()
-    )
+    if campaign.logs_archived_at:
+        # Leitura/descompressão do arquivo é bloqueante
+        return responses.FastJSONResponse(await run_in_threadpool(_archived_logs_or_404, campaign_id))
+    # Mesmas colunas do arquivo: o formato não muda depois da retenção
+    rows = (await db.execute(
+        select(*[getattr(models.CampaignLog, field) for field in retention.LOG_FIELDS])
+        .where(models.CampaignLog.campaign_id == campaign_id)
+    )).all()
+    return responses.FastJSONResponse(responses.rows_to_dicts(retention.LOG_FIELDS, rows))
+
+# ==========================================
+# 📬 WEBHOOKS
+# ==========================================
+
+@app.post("/webhooks/evolution", status_code=202)
+@app.post("/webhooks/evolution/{event}", status_code=202)
+async def evolution_webhook(request: Request, token: Optional[str] = None):
+    """
+    Recibos MESSAGES_UPDATE da Evolution (o "webhook by events" acrescenta o
+    evento na URL). Só enfileira no buffer e responde: o banco é atualizado
+    em lote pelo flusher (receipts.py).
+    """
+    if not receipts.RECEIPTS_WEBHOOK_TOKEN:
+        raise HTTPException(status_code=503, detail="Webhook disabled: RECEIPTS_WEBHOOK_TOKEN not configured")
+    if not hmac.compare_digest(token or "", receipts.RECEIPTS_WEBHOOK_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid webhook token")
+    try:
+        parsed = receipts.parse(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    metrics.RECEIPTS.labels("received").inc(len(parsed))
+    return {"accepted": receipts.BUFFER.add(parsed)}
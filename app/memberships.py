@@ -0,0 +1,93 @@
+"""
+Membros de listas em massa, direto no banco.
+
+Adicionar, remover e compor listas nunca traz contatos para o Python: cada
+operação é um único `INSERT INTO list_contacts ... SELECT` (ON CONFLICT DO
+NOTHING, então repetir é inofensivo) ou `DELETE ... WHERE contact_id IN
+(SELECT ...)`, e devolve só quantas linhas mudaram.
+
+A seleção de contatos reaproveita o que já existe:
+- contact_ids: ids explícitos (sempre restritos ao tenant);
+- tag_ids / q: os filtros do /contacts/search (search.py);
+- definition: uma expressão de segmento (segments.py), que também é como as
+  operações de conjunto são montadas: união = "or", interseção = "and",
+  diferença = primeira fonte "and not" (união das demais).
+Critérios diferentes no mesmo pedido se combinam com AND.
+"""
+from sqlalchemy import delete, func, literal
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+import search
+import segments
+
+OPERATIONS = ("union", "intersection", "difference")
+# Listas grandes de ids explícitos vão em lotes (limite de parâmetros do SQLite)
+ID_CHUNK = 10000
+
+
+def _insert(db):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(models.list_contacts)
+
+
+def compose(operation, sources):
+    """Operação de conjunto sobre [{"list": id} | {"tag": id}, ...] -> expressão de segmento."""
+    if operation not in OPERATIONS:
+        raise segments.SegmentError(f"Operation must be one of {', '.join(OPERATIONS)}")
+    if not sources:
+        raise segments.SegmentError("Provide at least one source")
+    if operation == "union":
+        return {"or": list(sources)}
+    if operation == "intersection":
+        return {"and": list(sources)}
+    if len(sources) == 1:
+        return sources[0]
+    return {"and": [sources[0], {"not": {"or": list(sources[1:])}}]}
+
+
+def selections(db, user_id, contact_ids=None, tag_ids=None, q=None, definition=None):
+    """SELECTs de contacts.id da seleção (mais de um só quando há muitos ids explícitos)."""
+    query = search.search_contacts(db, user_id, q=q, tag_ids=tag_ids)
+    if definition:
+        query = query.filter(segments.compile_expression(definition))
+    query = query.with_entities(models.Contact.id)
+    if not contact_ids:
+        return [query.statement]
+    ids = sorted(set(contact_ids))
+    return [
+        query.filter(models.Contact.id.in_(ids[offset:offset + ID_CHUNK])).statement
+        for offset in range(0, len(ids), ID_CHUNK)
+    ]
+
+
+def add(db, list_id, statements):
+    """Põe na lista os contatos selecionados (sem commit); devolve quantos entraram."""
+    table = models.list_contacts
+    added = 0
+    for stmt in statements:
+        # Mesmo SELECT, projetando (list_id, contacts.id); ele sempre tem WHERE
+        # (tenant), o que o SQLite exige antes de ON CONFLICT num INSERT ... SELECT
+        source = stmt.with_only_columns(literal(list_id), models.Contact.id)
+        insert = _insert(db).from_select([table.c.list_id, table.c.contact_id], source)
+        added += db.execute(insert.on_conflict_do_nothing(index_elements=["list_id", "contact_id"])).rowcount
+    return added
+
+
+def remove(db, list_id, statements):
+    """Tira da lista os contatos selecionados (sem commit); devolve quantos saíram."""
+    table = models.list_contacts
+    removed = 0
+    for stmt in statements:
+        removed += db.execute(
+            delete(table)
+            .where(table.c.list_id == list_id, table.c.contact_id.in_(stmt))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    return removed
+
+
+def member_count(db, list_id):
+    return db.query(func.count(models.list_contacts.c.contact_id)).filter(
+        models.list_contacts.c.list_id == list_id
+    ).scalar()
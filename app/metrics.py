@@ -0,0 +1,100 @@
+"""
+Métricas Prometheus da API, do worker, do scheduler e do runner de jobs.
+
+A API expõe `/metrics`; worker, scheduler e jobs sobem um listener HTTP próprio
+em METRICS_PORT (cada container/processo tem o seu). Rótulos ficam restritos
+a valores de cardinalidade baixa: rota (template, não a URL), método, status
+e id da conexão.
+"""
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest, start_http_server
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+
+# Latências típicas de HTTP/banco: de milissegundos até o timeout de 30s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 900, 3600)
+
+# --- API ---
+REQUEST_LATENCY = Histogram(
+    "heimdall_http_request_duration_seconds", "Latência das rotas da API",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+DB_SESSION_SECONDS = Histogram(
+    "heimdall_db_session_seconds", "Tempo de vida da sessão de banco por requisição",
+    buckets=LATENCY_BUCKETS,
+)
+# GETs condicionais (httpcache.py): not_modified, hit, miss
+RESPONSE_CACHE = Counter(
+    "heimdall_response_cache_total", "GETs condicionais: 304, corpo do cache ou montado de novo",
+    ["result"],
+)
+# Recibos do webhook da Evolution: received, applied, unmatched (sem log), overflow (buffer cheio)
+RECEIPTS = Counter(
+    "heimdall_receipts_total", "Recibos de entrega/leitura recebidos pelo webhook",
+    ["result"],
+)
+
+# --- Fila (scheduler / publicação) ---
+MESSAGES_PUBLISHED = Counter(
+    "heimdall_messages_published_total", "Mensagens publicadas na fila",
+)
+PUBLISH_BATCH_SECONDS = Histogram(
+    "heimdall_publish_batch_seconds", "Tempo para publicar um lote na fila",
+    buckets=LATENCY_BUCKETS,
+)
+RECIPIENTS_SKIPPED = Counter(
+    "heimdall_recipients_skipped_total", "Destinatários pulados na alimentação (suprimidos ou duplicados)",
+    ["reason"],
+)
+MESSAGES_RETRIED = Counter(
+    "heimdall_messages_retried_total", "Mensagens retidas pelo breaker devolvidas à fila",
+    ["connection_id"],
+)
+
+# --- Worker ---
+SENDS = Counter(
+    "heimdall_sends_total", "Envios para a Evolution API por conexão e resultado",
+    ["connection_id", "status"],
+)
+EVOLUTION_LATENCY = Histogram(
+    "heimdall_evolution_request_seconds", "Latência das chamadas à Evolution API",
+    ["connection_id"], buckets=LATENCY_BUCKETS,
+)
+QUEUE_LAG = Histogram(
+    "heimdall_queue_lag_seconds", "Atraso entre o slot agendado (not_before) e o envio",
+    buckets=LAG_BUCKETS,
+)
+LOG_FLUSH_SECONDS = Histogram(
+    "heimdall_log_flush_seconds", "Tempo para gravar o log de envio (commit incluso)",
+    buckets=LATENCY_BUCKETS,
+)
+MESSAGES_PARKED = Counter(
+    "heimdall_messages_parked_total", "Mensagens retidas por breaker aberto",
+    ["connection_id"],
+)
+# Mensagens que saem da fila sem envio: pausa, epoch antigo ou erro no processamento
+MESSAGES_DROPPED = Counter(
+    "heimdall_messages_dropped_total", "Mensagens descartadas sem envio (dead-letter)",
+    ["reason"],
+)
+
+
+# --- Jobs (jobs.py) ---
+# result: completed, failed, cancelled, retried
+JOBS = Counter(
+    "heimdall_jobs_total", "Jobs de preparo de campanha finalizados por tipo e resultado",
+    ["kind", "result"],
+)
+
+
+def render():
+    """Corpo e content-type da exposição no formato texto do Prometheus."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_listener(port=None):
+    port = port or METRICS_PORT
+    start_http_server(port)
+    print(f" [*] Métricas em :{port}/metrics")
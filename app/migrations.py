@@ -0,0 +1,615 @@
+"""
+Migrações versionadas do schema.
+
+Cada revisão é uma função idempotente registrada em REVISIONS. As versões
+aplicadas ficam na tabela `schema_migrations`, então subir a API várias vezes
+só executa o que ainda falta. Vários containers subindo ao mesmo tempo se
+revezam num lock (advisory lock no PostgreSQL, BEGIN IMMEDIATE no SQLite):
+quem chega depois espera e relê as versões aplicadas antes de continuar.
+
+Uso:
+    python migrations.py upgrade   # aplica as revisões pendentes
+    python migrations.py status    # lista aplicadas / pendentes
+    python migrations.py check     # lista queries quentes sem suporte de índice
+"""
+import sys
+import time
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.exc import OperationalError
+
+import database
+import models
+
+MIGRATIONS_TABLE = "schema_migrations"
+# Chave do pg_advisory_lock das migrações (qualquer bigint fixo)
+ADVISORY_LOCK_KEY = 7261843
+LOCK_RETRY_SECONDS = 0.5
+
+
+# ==========================================
+# 🔧 HELPERS
+# ==========================================
+
+def _dialect(conn):
+    return conn.engine.dialect.name
+
+
+def _has_column(conn, table, column):
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def _has_primary_key(conn, table):
+    return bool(inspect(conn).get_pk_constraint(table).get("constrained_columns"))
+
+
+def _drop_invalid_index(conn, name):
+    """
+    CREATE INDEX CONCURRENTLY que falha no meio deixa um índice inválido com o
+    nome; com IF NOT EXISTS ele nunca seria refeito. Só PostgreSQL.
+    """
+    invalid = conn.execute(text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).first()
+    if invalid:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def _create_index(conn, name, table, columns, unique=False):
+    """
+    Cria índice se não existir. No PostgreSQL usa CONCURRENTLY para não travar
+    escrita em tabelas grandes (exige rodar fora de transação, ver upgrade()).
+    """
+    unique_sql = "UNIQUE " if unique else ""
+    cols = ", ".join(columns)
+    if _dialect(conn) == "postgresql":
+        _drop_invalid_index(conn, name)
+        conn.execute(text(
+            f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({cols})"
+        ))
+    else:
+        conn.execute(text(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({cols})"))
+
+
+def _add_association_pk(conn, table, columns, reverse_index):
+    """
+    Adiciona PK composta a uma tabela associativa já existente, descartando
+    linhas duplicadas/nulas que a ausência de PK permitia.
+    """
+    if _has_primary_key(conn, table):
+        return
+
+    first, second = columns
+    if _dialect(conn) == "postgresql":
+        # Dedup em um único DELETE; o índice único é construído sem travar
+        # escrita e depois promovido a PK (operação só de catálogo).
+        conn.execute(text(f"DELETE FROM {table} WHERE {first} IS NULL OR {second} IS NULL"))
+        conn.execute(text(
+            f"DELETE FROM {table} a USING {table} b "
+            f"WHERE a.ctid < b.ctid AND a.{first} = b.{first} AND a.{second} = b.{second}"
+        ))
+        _create_index(conn, f"{table}_pkey_idx", table, columns, unique=True)
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {first} SET NOT NULL"))
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {second} SET NOT NULL"))
+        conn.execute(text(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY USING INDEX {table}_pkey_idx"
+        ))
+    else:
+        # SQLite não altera PK: reconstrói a tabela (cópia única, INSERT OR IGNORE
+        # descarta duplicatas) dentro da mesma transação.
+        tmp = f"{table}__new"
+        ref_first = models.Base.metadata.tables[table].c[first].foreign_keys
+        ref_second = models.Base.metadata.tables[table].c[second].foreign_keys
+        fk_first = next(iter(ref_first)).target_fullname.replace(".", "(") + ")"
+        fk_second = next(iter(ref_second)).target_fullname.replace(".", "(") + ")"
+        conn.execute(text(f"DROP TABLE IF EXISTS {tmp}"))
+        conn.execute(text(
+            f"CREATE TABLE {tmp} ("
+            f"{first} INTEGER NOT NULL REFERENCES {fk_first}, "
+            f"{second} INTEGER NOT NULL REFERENCES {fk_second}, "
+            f"PRIMARY KEY ({first}, {second})) WITHOUT ROWID"
+        ))
+        conn.execute(text(
+            f"INSERT OR IGNORE INTO {tmp} ({first}, {second}) "
+            f"SELECT {first}, {second} FROM {table} "
+            f"WHERE {first} IS NOT NULL AND {second} IS NOT NULL"
+        ))
+        conn.execute(text(f"DROP TABLE {table}"))
+        conn.execute(text(f"ALTER TABLE {tmp} RENAME TO {table}"))
+
+    _create_index(conn, reverse_index, table, [second, first])
+
+
+# ==========================================
+# 📜 REVISÕES
+# ==========================================
+
+def _rev_0001_baseline(conn):
+    # Bancos novos nascem direto no schema atual; em bancos antigos só cria o que falta.
+    models.Base.metadata.create_all(bind=conn)
+
+
+def _rev_0002_hot_path_indexes(conn):
+    _add_association_pk(conn, "contact_tags", ["contact_id", "tag_id"], "ix_contact_tags_tag_id_contact_id")
+    _add_association_pk(conn, "list_contacts", ["list_id", "contact_id"], "ix_list_contacts_contact_id_list_id")
+
+    _create_index(conn, "ix_campaign_logs_campaign_id_status", "campaign_logs", ["campaign_id", "status"])
+    _create_index(conn, "ix_campaign_logs_campaign_id_contact_number", "campaign_logs", ["campaign_id", "contact_number"])
+    _create_index(conn, "ix_campaigns_user_id", "campaigns", ["user_id"])
+    _create_index(conn, "ix_connections_user_id", "connections", ["user_id"])
+    _create_index(conn, "ix_contact_lists_user_id", "contact_lists", ["user_id"])
+
+    # Atualiza estatísticas para o planner enxergar os índices novos
+    # (no SQLite, `optimize` só roda ANALYZE onde as estatísticas fazem diferença)
+    conn.execute(text("ANALYZE" if _dialect(conn) == "postgresql" else "PRAGMA optimize"))
+
+
+def _backfill_number_digits(conn, batch_size=5000):
+    # Em lotes por id: a memória não cresce com a tabela. No PostgreSQL
+    # (AUTOCOMMIT) cada lote é uma transação curta; no SQLite a revisão inteira
+    # roda numa transação só (ver upgrade()).
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text(
+                "SELECT id, number FROM contacts "
+                "WHERE id > :last_id AND number_digits IS NULL ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": batch_size},
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for contact_id, number in rows:
+            digits = models.normalize_number(number)
+            updates.append({"id": contact_id, "digits": digits, "reversed": digits[::-1]})
+        conn.execute(
+            text("UPDATE contacts SET number_digits = :digits, number_reversed = :reversed WHERE id = :id"),
+            updates,
+        )
+        last_id = rows[-1][0]
+
+
+def _backfill_log_contacts(conn, batch_size=5000):
+    """
+    campaign_logs.contact_id dos logs antigos, que só guardavam o número:
+    casa (tenant da campanha, número normalizado) com contacts.number_digits.
+    Número repetido no tenant fica com o menor id (o contato canônico do
+    filtro de duplicados); log sem contato correspondente continua NULL.
+    """
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text(
+                "SELECT l.id, l.contact_number, c.user_id FROM campaign_logs l "
+                "JOIN campaigns c ON c.id = l.campaign_id "
+                "WHERE l.id > :last_id AND l.contact_id IS NULL ORDER BY l.id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": batch_size},
+        ).fetchall()
+        if not rows:
+            break
+        wanted = {}
+        for _, number, user_id in rows:
+            wanted.setdefault(user_id, set()).add(models.normalize_number(number))
+        found = {}
+        lookup = text(
+            "SELECT number_digits, MIN(id) FROM contacts "
+            "WHERE user_id = :user_id AND number_digits IN :digits GROUP BY number_digits"
+        ).bindparams(bindparam("digits", expanding=True))
+        for user_id, digits in wanted.items():
+            digits = sorted(digits - {""})
+            for offset in range(0, len(digits), 500):
+                for key, contact_id in conn.execute(lookup, {"user_id": user_id, "digits": digits[offset:offset + 500]}):
+                    found[(user_id, key)] = contact_id
+        updates = [
+            {"id": log_id, "contact_id": found[(user_id, models.normalize_number(number))]}
+            for log_id, number, user_id in rows
+            if (user_id, models.normalize_number(number)) in found
+        ]
+        if updates:
+            conn.execute(text("UPDATE campaign_logs SET contact_id = :contact_id WHERE id = :id"), updates)
+        last_id = rows[-1][0]
+
+
+def _rev_0003_contact_search(conn):
+    for column in ("number_digits", "number_reversed"):
+        if not _has_column(conn, "contacts", column):
+            conn.execute(text(f"ALTER TABLE contacts ADD COLUMN {column} VARCHAR"))
+    _backfill_number_digits(conn)
+
+    if _dialect(conn) == "postgresql":
+        _create_index(conn, "ix_contacts_user_id_number_digits", "contacts",
+                      ["user_id", "number_digits text_pattern_ops"])
+        _create_index(conn, "ix_contacts_user_id_number_reversed", "contacts",
+                      ["user_id", "number_reversed text_pattern_ops"])
+        # Nome: trigram com GIN atende LIKE '%trecho%' sem varrer a tabela
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        _drop_invalid_index(conn, "ix_contacts_name_trgm")
+        conn.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contacts_name_trgm "
+            "ON contacts USING gin (lower(name) gin_trgm_ops)"
+        ))
+    else:
+        _create_index(conn, "ix_contacts_user_id_number_digits", "contacts", ["user_id", "number_digits"])
+        _create_index(conn, "ix_contacts_user_id_number_reversed", "contacts", ["user_id", "number_reversed"])
+        # Nome: FTS5 com conteúdo externo (não duplica os nomes) mantido por triggers
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contacts_fts'"
+        )).first()
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+            "name, content='contacts', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+            "INSERT INTO contacts_fts(rowid, name) VALUES (new.id, new.name); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+            "INSERT INTO contacts_fts(contacts_fts, rowid, name) VALUES ('delete', old.id, old.name); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE OF name ON contacts BEGIN "
+            "INSERT INTO contacts_fts(contacts_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+            "INSERT INTO contacts_fts(rowid, name) VALUES (new.id, new.name); END"
+        ))
+        if not exists:
+            conn.execute(text("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')"))
+
+
+def _rev_0004_segments(conn):
+    models.Base.metadata.create_all(
+        bind=conn,
+        tables=[models.Segment.__table__, models.DataVersion.__table__],
+    )
+    if not _has_column(conn, "campaigns", "segment_id"):
+        conn.execute(text("ALTER TABLE campaigns ADD COLUMN segment_id INTEGER REFERENCES segments(id)"))
+    if not _has_column(conn, "campaigns", "audience"):
+        conn.execute(text("ALTER TABLE campaigns ADD COLUMN audience TEXT"))
+
+
+def _rev_0005_feeder(conn):
+    columns = [
+        ("total_contacts", "INTEGER DEFAULT 0"),
+        ("scheduled_at", "TIMESTAMP"),
+        ("send_window_start", "VARCHAR"),
+        ("send_window_end", "VARCHAR"),
+        ("timezone", "VARCHAR DEFAULT 'UTC'"),
+        ("feed_cursor", "INTEGER DEFAULT 0"),
+        ("feed_epoch", "INTEGER DEFAULT 0"),
+        ("next_send_at", "TIMESTAMP"),
+    ]
+    for column, ddl in columns:
+        if not _has_column(conn, "campaigns", column):
+            conn.execute(text(f"ALTER TABLE campaigns ADD COLUMN {column} {ddl}"))
+    if not _has_column(conn, "campaign_logs", "contact_id"):
+        conn.execute(text("ALTER TABLE campaign_logs ADD COLUMN contact_id INTEGER"))
+    _create_index(conn, "ix_campaign_logs_campaign_id_contact_id", "campaign_logs", ["campaign_id", "contact_id"])
+    _backfill_log_contacts(conn)
+
+    # Campanhas antigas publicavam a audiência inteira no lançamento: o cursor
+    # vai para depois dela, senão o scheduler alimentaria tudo de novo. As
+    # pausadas retomam pelo rewind, que volta até o primeiro contato sem envio
+    # (logs antigos entram no ledger, ver 0011); as em andamento já estão
+    # inteiras na fila e terminam por lá.
+    conn.execute(text(
+        "UPDATE campaigns SET feed_cursor = COALESCE("
+        "(SELECT MAX(id) FROM contacts WHERE contacts.user_id = campaigns.user_id), 0) "
+        "WHERE status IN ('processing', 'paused') AND COALESCE(feed_cursor, 0) = 0"
+    ))
+    conn.execute(text("UPDATE campaigns SET status = 'completed' WHERE status = 'processing'"))
+
+
+def _rev_0006_connection_pools(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.CampaignConnection.__table__])
+    columns = [
+        ("messages_per_minute", "INTEGER"),
+        ("is_healthy", "BOOLEAN DEFAULT TRUE"),
+        ("unhealthy_since", "TIMESTAMP"),
+        ("next_send_at", "TIMESTAMP"),
+    ]
+    for column, ddl in columns:
+        if not _has_column(conn, "connections", column):
+            conn.execute(text(f"ALTER TABLE connections ADD COLUMN {column} {ddl}"))
+    if not _has_column(conn, "campaign_logs", "connection_id"):
+        conn.execute(text("ALTER TABLE campaign_logs ADD COLUMN connection_id INTEGER"))
+
+    # Campanhas existentes viram pools de uma conexão só
+    conn.execute(text(
+        "INSERT INTO campaign_connections (campaign_id, connection_id, weight) "
+        "SELECT c.id, c.connection_id, 1 FROM campaigns c "
+        "WHERE c.connection_id IS NOT NULL AND NOT EXISTS ("
+        "SELECT 1 FROM campaign_connections cc WHERE cc.campaign_id = c.id)"
+    ))
+
+
+def _rev_0007_adaptive_rate(conn):
+    if not _has_column(conn, "connections", "min_messages_per_minute"):
+        conn.execute(text("ALTER TABLE connections ADD COLUMN min_messages_per_minute INTEGER"))
+    if not _has_column(conn, "connections", "effective_rate"):
+        conn.execute(text("ALTER TABLE connections ADD COLUMN effective_rate FLOAT"))
+
+
+def _rev_0008_circuit_breaker(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.ParkedMessage.__table__])
+    if not _has_column(conn, "connections", "instance_state"):
+        conn.execute(text("ALTER TABLE connections ADD COLUMN instance_state VARCHAR"))
+    if not _has_column(conn, "connections", "probed_at"):
+        conn.execute(text("ALTER TABLE connections ADD COLUMN probed_at TIMESTAMP"))
+
+
+def _rev_0009_message_timings(conn):
+    if not _has_column(conn, "campaign_logs", "timings"):
+        conn.execute(text("ALTER TABLE campaign_logs ADD COLUMN timings VARCHAR"))
+
+
+def _rev_0010_campaign_priority(conn):
+    if not _has_column(conn, "campaigns", "priority"):
+        conn.execute(text("ALTER TABLE campaigns ADD COLUMN priority INTEGER DEFAULT 0"))
+
+
+def _rev_0011_dispatch_ledger(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.DispatchLedger.__table__])
+    # Envios anteriores ao ledger também contam (resume não pode repetir ninguém).
+    # Logs de antes do alimentador não têm contact_id: casa pelo número
+    # normalizado (no-op se a 0005 já preencheu)
+    _backfill_log_contacts(conn)
+    conn.execute(text(
+        "INSERT INTO dispatch_ledger (campaign_id, contact_id, status) "
+        "SELECT campaign_id, contact_id, MAX(status) FROM campaign_logs "
+        "WHERE campaign_id IS NOT NULL AND contact_id IS NOT NULL "
+        "GROUP BY campaign_id, contact_id "
+        "ON CONFLICT DO NOTHING"
+    ))
+
+
+def _rev_0012_log_retention(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.CampaignLogRollup.__table__])
+    if not _has_column(conn, "campaigns", "logs_archived_at"):
+        conn.execute(text("ALTER TABLE campaigns ADD COLUMN logs_archived_at TIMESTAMP"))
+
+
+def _rev_0013_delivery_receipts(conn):
+    for column, ddl in (
+        ("message_id", "VARCHAR"),
+        ("delivered_at", "TIMESTAMP"),
+        ("read_at", "TIMESTAMP"),
+    ):
+        if not _has_column(conn, "campaign_logs", column):
+            conn.execute(text(f"ALTER TABLE campaign_logs ADD COLUMN {column} {ddl}"))
+    for column in ("delivered_count", "read_count"):
+        if not _has_column(conn, "campaigns", column):
+            conn.execute(text(f"ALTER TABLE campaigns ADD COLUMN {column} INTEGER DEFAULT 0"))
+    _create_index(conn, "ix_campaign_logs_message_id", "campaign_logs", ["message_id"])
+
+
+def _rev_0014_suppressions(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.Suppression.__table__])
+
+
+def _rev_0015_data_version_timestamps(conn):
+    if not _has_column(conn, "data_versions", "updated_at"):
+        conn.execute(text("ALTER TABLE data_versions ADD COLUMN updated_at TIMESTAMP"))
+
+
+def _rev_0016_jobs(conn):
+    models.Base.metadata.create_all(bind=conn, tables=[models.Job.__table__])
+
+
+REVISIONS = [
+    ("0001", "schema inicial", _rev_0001_baseline),
+    ("0002", "índices dos filtros quentes e PKs das tabelas associativas", _rev_0002_hot_path_indexes),
+    ("0003", "busca de contatos por número normalizado e nome", _rev_0003_contact_search),
+    ("0004", "segmentos de audiência e versões de dados", _rev_0004_segments),
+    ("0005", "alimentador just-in-time da fila (agenda e janelas)", _rev_0005_feeder),
+    ("0006", "pools de conexões por campanha", _rev_0006_connection_pools),
+    ("0007", "taxa adaptativa por conexão", _rev_0007_adaptive_rate),
+    ("0008", "circuit breaker por conexão e mensagens retidas", _rev_0008_circuit_breaker),
+    ("0009", "spans de latência por mensagem", _rev_0009_message_timings),
+    ("0010", "prioridade de campanha", _rev_0010_campaign_priority),
+    ("0011", "ledger de despacho idempotente", _rev_0011_dispatch_ledger),
+    ("0012", "retenção de logs (rollups e arquivo)", _rev_0012_log_retention),
+    ("0013", "recibos de entrega/leitura do webhook", _rev_0013_delivery_receipts),
+    ("0014", "lista de supressão por tenant", _rev_0014_suppressions),
+    ("0015", "data e hora da última escrita por escopo (ETag/Last-Modified)", _rev_0015_data_version_timestamps),
+    ("0016", "jobs duráveis de lançamento/resume", _rev_0016_jobs),
+]
+
+
+# ==========================================
+# 🚀 RUNNER
+# ==========================================
+
+def _ensure_migrations_table(engine):
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            # Só vale em banco vazio (antes da primeira tabela): a retenção
+            # devolve espaço com incremental_vacuum, sem VACUUM completo
+            conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+            "version VARCHAR(32) PRIMARY KEY, "
+            "description VARCHAR(255), "
+            "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        ))
+
+
+def applied_versions(engine):
+    _ensure_migrations_table(engine)
+    with engine.connect() as conn:
+        return _applied(conn)
+
+
+def _applied(conn):
+    return {row[0] for row in conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}"))}
+
+
+def _record(conn, version, description):
+    conn.execute(
+        text(f"INSERT INTO {MIGRATIONS_TABLE} (version, description) VALUES (:v, :d)"),
+        {"v": version, "d": description},
+    )
+
+
+def _begin_immediate(conn):
+    """Trava o SQLite para escrita já no BEGIN; espera enquanto outro processo migra."""
+    while True:
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            conn.rollback()
+            time.sleep(LOCK_RETRY_SECONDS)
+
+
+def _upgrade_postgres(engine):
+    # Lock de sessão numa conexão à parte: as revisões usam outras conexões
+    # (AUTOCOMMIT, por causa do CREATE INDEX CONCURRENTLY)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        try:
+            done = applied_versions(engine)
+            for version, description, fn in REVISIONS:
+                if version in done:
+                    continue
+                print(f"🛠️ Aplicando migração {version}: {description}")
+                # Cada passo da revisão é idempotente, então uma falha no meio
+                # é retomada na próxima execução.
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    fn(conn)
+                with engine.begin() as conn:
+                    _record(conn, version, description)
+        finally:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+
+
+def _upgrade_sqlite(engine):
+    # Uma transação BEGIN IMMEDIATE por revisão: quem esperou o lock relê as
+    # versões lá dentro e pula o que o outro processo já aplicou
+    for version, description, fn in REVISIONS:
+        with engine.connect() as conn:
+            _begin_immediate(conn)
+            try:
+                if version not in _applied(conn):
+                    print(f"🛠️ Aplicando migração {version}: {description}")
+                    fn(conn)
+                    _record(conn, version, description)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+
+def upgrade(engine=None):
+    """Aplica, em ordem, as revisões ainda não registradas (um processo por vez)."""
+    engine = engine or database.engine
+    # Caminho comum (nada pendente) sem pegar lock
+    if {version for version, _, _ in REVISIONS} <= applied_versions(engine):
+        return
+    if engine.dialect.name == "postgresql":
+        _upgrade_postgres(engine)
+    else:
+        _upgrade_sqlite(engine)
+
+
+# ==========================================
+# 🔍 CHECK DE ÍNDICES
+# ==========================================
+
+# Queries dos caminhos quentes (API + worker). Parâmetros são valores fictícios:
+# só o plano importa. SQL pode ser um dict por dialeto quando a forma indexável difere.
+HOT_QUERIES = [
+    ("campaign stats", "SELECT status, count(id) FROM campaign_logs WHERE campaign_id = :id GROUP BY status", {"id": 1}),
+    ("campaign logs", "SELECT * FROM campaign_logs WHERE campaign_id = :id", {"id": 1}),
+    ("resume processed numbers", "SELECT DISTINCT contact_number FROM campaign_logs WHERE campaign_id = :id", {"id": 1}),
+    ("list campaigns", "SELECT * FROM campaigns WHERE user_id = :id", {"id": 1}),
+    ("list connections", "SELECT * FROM connections WHERE user_id = :id", {"id": 1}),
+    ("list contact lists", "SELECT * FROM contact_lists WHERE user_id = :id", {"id": 1}),
+    ("contacts by user", "SELECT * FROM contacts WHERE user_id = :id", {"id": 1}),
+    ("contact by number", "SELECT * FROM contacts WHERE user_id = :id AND number = :n", {"id": 1, "n": "0"}),
+    ("contact number prefix", {
+        "sqlite": "SELECT id FROM contacts WHERE user_id = :id AND number_digits >= :p AND number_digits < :e",
+        "postgresql": "SELECT id FROM contacts WHERE user_id = :id AND number_digits LIKE :p || '%'",
+    }, {"id": 1, "p": "55", "e": "55:"}),
+    ("contact number suffix", {
+        "sqlite": "SELECT id FROM contacts WHERE user_id = :id AND number_reversed >= :p AND number_reversed < :e",
+        "postgresql": "SELECT id FROM contacts WHERE user_id = :id AND number_reversed LIKE :p || '%'",
+    }, {"id": 1, "p": "00", "e": "00:"}),
+    ("tags of contact", "SELECT tag_id FROM contact_tags WHERE contact_id = :id", {"id": 1}),
+    ("contacts of tag", "SELECT contact_id FROM contact_tags WHERE tag_id = :id", {"id": 1}),
+    ("contacts of list", "SELECT contact_id FROM list_contacts WHERE list_id = :id", {"id": 1}),
+    ("lists of contact", "SELECT list_id FROM list_contacts WHERE contact_id = :id", {"id": 1}),
+    ("parked messages of connection", "SELECT id, payload FROM parked_messages WHERE connection_id = :id ORDER BY id", {"id": 1}),
+    ("suppressions of user", "SELECT number FROM suppressions WHERE user_id = :id", {"id": 1}),
+    ("duplicate numbers of user", "SELECT number_digits, MIN(id) FROM contacts WHERE user_id = :id GROUP BY number_digits", {"id": 1}),
+    ("next job", "SELECT id FROM jobs WHERE status = :s ORDER BY id LIMIT 1", {"s": "queued"}),
+    ("receipt by message id", "SELECT campaign_id FROM campaign_logs WHERE message_id IN (:m)", {"m": "0"}),
+]
+
+
+def _sqlite_unindexed(conn, sql, params):
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+    details = [row[-1] for row in rows]
+    return [d for d in details if d.startswith("SCAN") and "INDEX" not in d]
+
+
+def _postgres_unindexed(conn, sql, params):
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+    found = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            found.append(f"Seq Scan on {node.get('Relation Name')}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return found
+
+
+def check_index_usage(engine=None):
+    """
+    Retorna [(nome, [trechos do plano sem índice])] para as HOT_QUERIES que
+    caem em full scan.
+    """
+    engine = engine or database.engine
+    problems = []
+    with engine.connect() as conn:
+        postgres = engine.dialect.name == "postgresql"
+        if postgres:
+            # Em tabelas pequenas o planner prefere Seq Scan mesmo com índice;
+            # desligando, um Seq Scan restante significa "não há índice utilizável".
+            conn.execute(text("SET enable_seqscan = off"))
+        for name, sql, params in HOT_QUERIES:
+            if isinstance(sql, dict):
+                sql = sql[engine.dialect.name]
+            scans = _postgres_unindexed(conn, sql, params) if postgres else _sqlite_unindexed(conn, sql, params)
+            if scans:
+                problems.append((name, scans))
+    return problems
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+
+    if command == "upgrade":
+        upgrade()
+    elif command == "status":
+        done = applied_versions(database.engine)
+        for version, description, _ in REVISIONS:
+            mark = "✅" if version in done else "⏳"
+            print(f"{mark} {version} {description}")
+    elif command == "check":
+        problems = check_index_usage()
+        if not problems:
+            print("✅ Todas as queries quentes usam índice")
+        for name, scans in problems:
+            print(f"❌ {name}: {'; '.join(scans)}")
+        sys.exit(1 if problems else 0)
+    else:
+        print(__doc__)
+        sys.exit(2)
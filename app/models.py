@@ -1,17 +1,28 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Text, DateTime, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, Text, DateTime, UniqueConstraint, Index, Boolean, Float
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from database import Base
 
+
+def normalize_number(number):
+    """Mantém só os dígitos do telefone (chave de busca/deduplicação)."""
+    return "".join(ch for ch in (number or "") if ch.isdigit())
+
 # Tabelas Associativas
+# A PK composta já cobre a busca por contato (contact_tags) / por lista (list_contacts);
+# o índice invertido cobre o caminho contrário. Sem rowid no SQLite: a PK é a própria tabela.
 contact_tags = Table('contact_tags', Base.metadata,
-    Column('contact_id', Integer, ForeignKey('contacts.id')),
-    Column('tag_id', Integer, ForeignKey('tags.id'))
+    Column('contact_id', Integer, ForeignKey('contacts.id'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_contact_tags_tag_id_contact_id', 'tag_id', 'contact_id'),
+    sqlite_with_rowid=False,
 )
 
 list_contacts = Table('list_contacts', Base.metadata,
-    Column('list_id', Integer, ForeignKey('contact_lists.id')),
-    Column('contact_id', Integer, ForeignKey('contacts.id'))
+    Column('list_id', Integer, ForeignKey('contact_lists.id'), primary_key=True),
+    Column('contact_id', Integer, ForeignKey('contacts.id'), primary_key=True),
+    Index('ix_list_contacts_contact_id_list_id', 'contact_id', 'list_id'),
+    sqlite_with_rowid=False,
 )
 
 class User(Base):
@@ -28,6 +39,7 @@ class User(Base):
     contacts = relationship("Contact", back_populates="owner")
     tags = relationship("Tag", back_populates="owner")
     lists = relationship("ContactList", back_populates="owner")
+    segments = relationship("Segment", back_populates="owner")
     campaigns = relationship("Campaign", back_populates="owner")
 
 class Connection(Base):
@@ -37,23 +49,52 @@ class Connection(Base):
     api_url = Column(String)      
     api_key = Column(String)      
     instance_name = Column(String) 
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Limite próprio do número (somado entre todas as campanhas que o usam)
+    messages_per_minute = Column(Integer, nullable=True)
+    # Controle adaptativo (ratecontrol.py): piso configurado e taxa efetiva atual
+    min_messages_per_minute = Column(Integer, nullable=True)
+    effective_rate = Column(Float, nullable=True)
+    # Circuit breaker (breaker.py): is_healthy=False é o breaker aberto
+    is_healthy = Column(Boolean, default=True)
+    unhealthy_since = Column(DateTime, nullable=True)
+    instance_state = Column(String, nullable=True) # último connectionState da Evolution
+    probed_at = Column(DateTime, nullable=True)
+    next_send_at = Column(DateTime, nullable=True) # próximo slot livre do número (UTC)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     owner = relationship("User", back_populates="connections")
     campaigns = relationship("Campaign", back_populates="connection")
 
+    @property
+    def breaker_state(self):
+        return "closed" if self.is_healthy is not False else "open"
+
 class Contact(Base):
     __tablename__ = "contacts"
     __table_args__ = (
         UniqueConstraint("user_id", "number", name="uq_contacts_user_number"),
+        # Busca por prefixo (dígitos) e por sufixo (dígitos invertidos), sempre por tenant
+        # (no PostgreSQL, text_pattern_ops deixa LIKE 'prefixo%' usar o índice em qualquer collation)
+        Index("ix_contacts_user_id_number_digits", "user_id", "number_digits",
+              postgresql_ops={"number_digits": "text_pattern_ops"}),
+        Index("ix_contacts_user_id_number_reversed", "user_id", "number_reversed",
+              postgresql_ops={"number_reversed": "text_pattern_ops"}),
     )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     number = Column(String, index=True)
+    number_digits = Column(String)    # Só dígitos: "+55 (11) 9999-0000" -> "551199990000"
+    number_reversed = Column(String)  # number_digits invertido (busca por final do número)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     owner = relationship("User", back_populates="contacts")
     tags = relationship("Tag", secondary=contact_tags, back_populates="contacts")
     lists = relationship("ContactList", secondary=list_contacts, back_populates="contacts")
 
+    @validates("number")
+    def _normalize_number(self, key, value):
+        self.number_digits = normalize_number(value)
+        self.number_reversed = self.number_digits[::-1]
+        return value
+
 class Tag(Base):
     __tablename__ = "tags"
     __table_args__ = (
@@ -69,10 +110,50 @@ class ContactList(Base):
     __tablename__ = "contact_lists"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     owner = relationship("User", back_populates="lists")
     contacts = relationship("Contact", secondary=list_contacts, back_populates="lists")
 
+class Segment(Base):
+    """Audiência salva: expressão AND/OR/NOT sobre tags e listas (ver segments.py)."""
+    __tablename__ = "segments"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    definition = Column(Text) # JSON, ex: {"and": [{"tag": 1}, {"not": {"list": 2}}]}
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    owner = relationship("User", back_populates="segments")
+
+class DataVersion(Base):
+    """Contador por tenant/escopo, incrementado a cada escrita (invalidação de cache)."""
+    __tablename__ = "data_versions"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    scope = Column(String, primary_key=True) # ex: "audience" = contact_tags/list_contacts/contacts
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True) # último bump (UTC): Last-Modified dos GETs
+
+class Suppression(Base):
+    """Número que o tenant não quer (ou não consegue) mais contatar (ver suppressions.py)."""
+    __tablename__ = "suppressions"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    number = Column(String, primary_key=True) # só dígitos (normalize_number)
+    reason = Column(String, nullable=False) # opt_out, invalid
+    detail = Column(Text, nullable=True) # ex: resposta da Evolution que marcou o número inválido
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class CampaignConnection(Base):
+    """Conexão do pool de envio de uma campanha, com peso na divisão dos contatos."""
+    __tablename__ = "campaign_connections"
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), primary_key=True)
+    connection_id = Column(Integer, ForeignKey("connections.id"), primary_key=True)
+    weight = Column(Integer, nullable=False, default=1)
+    next_send_at = Column(DateTime, nullable=True) # próximo slot da campanha neste número (UTC)
+
+    campaign = relationship("Campaign", back_populates="connections")
+    connection = relationship("Connection")
+
 class Campaign(Base):
     __tablename__ = "campaigns"
     id = Column(Integer, primary_key=True, index=True)
@@ -81,27 +162,123 @@ class Campaign(Base):
     media_url = Column(String, nullable=True)
     media_type = Column(String, nullable=True) # image, video, document
     messages_per_minute = Column(Integer, default=10)
-    status = Column(String, default="draft")
+    status = Column(String, default="draft") # preparing, scheduled, processing, paused, completed, cancelled, failed
+    priority = Column(Integer, default=0) # peso no rodízio do scheduler (maior = mais urgente)
     
-    contact_list_id = Column(Integer, ForeignKey('contact_lists.id'))
+    contact_list_id = Column(Integer, ForeignKey('contact_lists.id'), nullable=True)
+    segment_id = Column(Integer, ForeignKey('segments.id'), nullable=True)
+    # Snapshot JSON da expressão de audiência no lançamento (lista, tags ou segmento)
+    audience = Column(Text, nullable=True)
+    total_contacts = Column(Integer, default=0)
+
+    # Agenda (UTC) e janela diária de envio ("HH:MM" no fuso `timezone`)
+    scheduled_at = Column(DateTime, nullable=True)
+    send_window_start = Column(String, nullable=True)
+    send_window_end = Column(String, nullable=True)
+    timezone = Column(String, default="UTC")
+
+    # Estado do alimentador just-in-time (scheduler.py)
+    feed_cursor = Column(Integer, default=0)  # último contacts.id publicado
+    feed_epoch = Column(Integer, default=0)   # +1 no pause/cancel/resume: mensagens antigas viram descartáveis
+    next_send_at = Column(DateTime, nullable=True) # próximo slot de envio (UTC)
     
-    connection_id = Column(Integer, ForeignKey('connections.id'))
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    connection_id = Column(Integer, ForeignKey('connections.id')) # conexão principal (1ª do pool)
+    # Logs movidos para o arquivo compactado (retention.py); stats vêm do rollup
+    logs_archived_at = Column(DateTime, nullable=True)
+    # Contadores dos recibos do webhook (receipts.py), aplicados em lote
+    delivered_count = Column(Integer, default=0)
+    read_count = Column(Integer, default=0)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     owner = relationship("User", back_populates="campaigns")
     connection = relationship("Connection", back_populates="campaigns")
+    connections = relationship("CampaignConnection", back_populates="campaign", order_by="CampaignConnection.connection_id")
 
     logs = relationship("CampaignLog", back_populates="campaign")
 
+class Job(Base):
+    """Tarefa durável executada pelo runner (jobs.py): preparo de lançamento/resume de campanha."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Runner procura a próxima pendente (ou com lease vencido) em ordem de id
+        Index("ix_jobs_status_id", "status", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False) # launch_campaign, resume_campaign
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=True, index=True)
+    status = Column(String, nullable=False, default="queued") # queued, running, completed, failed, cancelled
+    progress = Column(Float, nullable=False, default=0) # 0 a 100
+    checkpoint = Column(Text, nullable=True) # JSON com o ponto de retomada
+    result = Column(Text, nullable=True) # JSON
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    locked_by = Column(String, nullable=True) # runner dono do lease
+    locked_until = Column(DateTime, nullable=True) # lease vencido = runner morreu: outro retoma
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class CampaignLogRollup(Base):
+    """Contagem por status de uma campanha cujos logs foram arquivados."""
+    __tablename__ = "campaign_log_rollups"
+
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+    first_at = Column(DateTime(timezone=True), nullable=True)
+    last_at = Column(DateTime(timezone=True), nullable=True)
+
+class DispatchLedger(Base):
+    """Uma linha por (campanha, contato) despachado: garante no máximo um envio (ledger.py)."""
+    __tablename__ = "dispatch_ledger"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    campaign_id = Column(Integer, primary_key=True)
+    contact_id = Column(Integer, primary_key=True)
+    status = Column(String, nullable=False) # claimed, sent, failed, skipped
+    claimed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ParkedMessage(Base):
+    """Mensagem retida enquanto o breaker da conexão está aberto."""
+    __tablename__ = "parked_messages"
+    __table_args__ = (
+        Index("ix_parked_messages_connection_id_id", "connection_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    connection_id = Column(Integer, ForeignKey("connections.id"), nullable=False)
+    campaign_id = Column(Integer, nullable=True)
+    payload = Column(Text, nullable=False) # JSON da mensagem, como saiu da fila
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class CampaignLog(Base):
     __tablename__ = "campaign_logs"
+    __table_args__ = (
+        # Stats (GROUP BY status) e logs filtram sempre por campanha
+        Index("ix_campaign_logs_campaign_id_status", "campaign_id", "status"),
+        # Resume busca os números já processados da campanha
+        Index("ix_campaign_logs_campaign_id_contact_number", "campaign_id", "contact_number"),
+        # Resume localiza contatos publicados e não processados
+        Index("ix_campaign_logs_campaign_id_contact_id", "campaign_id", "contact_id"),
+        # Recibos da Evolution (receipts.py) chegam pelo id da mensagem
+        Index("ix_campaign_logs_message_id", "message_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     campaign_id = Column(Integer, ForeignKey("campaigns.id"))
+    contact_id = Column(Integer, nullable=True)
+    connection_id = Column(Integer, nullable=True)
     contact_number = Column(String)
     contact_name = Column(String)
     
     status = Column(String) # "sent", "failed", "pending"
     error_message = Column(Text, nullable=True)
+    # Spans de latência em ms, compactos (timings.py)
+    timings = Column(String, nullable=True)
+    message_id = Column(String, nullable=True) # key.id devolvido pela Evolution
+    delivered_at = Column(DateTime, nullable=True) # recibos do webhook (UTC)
+    read_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     campaign = relationship("Campaign", back_populates="logs")
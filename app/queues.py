@@ -0,0 +1,227 @@
+"""
+Abstração da fila de mensagens.
+
+QUEUE_BACKEND escolhe a implementação:
+- "rabbitmq" (padrão): RabbitMQ via pika, fila durável e mensagens persistentes.
+- "embedded": fila em SQLite (WAL) num arquivo local, sem broker. Cada mensagem
+  recebida fica arrendada (lease) por QUEUE_VISIBILITY_TIMEOUT segundos; sem ack
+  nesse prazo (worker morreu), volta a ficar visível; depois de
+  QUEUE_MAX_ATTEMPTS entregas vai para a tabela queue_dead_letters. Serve para
+  instalações de um nó só, testes e benchmarks.
+
+As duas expõem a mesma interface: publish(bodies), consume(handler),
+sleep(seconds) e close(). O handler recebe o corpo (str/bytes) e a mensagem é
+confirmada quando ele retorna — ou levanta exceção, como o worker sempre fez.
+
+Pause/cancel chamam purge_campaign(): a fila embutida apaga as mensagens da
+campanha num DELETE só; no RabbitMQ (fila compartilhada, sem remoção seletiva)
+os workers descartam pelo epoch na saída da fila, antes de esperar o slot.
+"""
+import os
+import sqlite3
+import time
+
+QUEUE_BACKEND = os.getenv('QUEUE_BACKEND', 'rabbitmq')
+QUEUE_NAME = 'whatsapp_campaigns'
+
+RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'localhost')
+RABBITMQ_USER = os.getenv('RABBITMQ_USER', 'guest')
+RABBITMQ_PASS = os.getenv('RABBITMQ_PASS', 'guest')
+
+EMBEDDED_QUEUE_PATH = os.getenv('EMBEDDED_QUEUE_PATH', './data/queue.db')
+# Precisa cobrir a espera pelo slot (FEED_LOOKAHEAD_SECONDS) + o timeout do envio
+QUEUE_VISIBILITY_TIMEOUT = float(os.getenv('QUEUE_VISIBILITY_TIMEOUT', '300'))
+QUEUE_POLL_INTERVAL = float(os.getenv('QUEUE_POLL_INTERVAL', '0.5'))
+# Entregas sem ack além disso (mensagem que derruba o worker) vão para queue_dead_letters
+QUEUE_MAX_ATTEMPTS = int(os.getenv('QUEUE_MAX_ATTEMPTS', '5'))
+
+
+# ==========================================
+# 🐇 RABBITMQ
+# ==========================================
+
+class RabbitMQQueue:
+    def __init__(self, name=QUEUE_NAME):
+        import pika
+
+        self._pika = pika
+        self.name = name
+        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
+        parameters = pika.ConnectionParameters(host=RABBITMQ_HOST, credentials=credentials)
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue=name, durable=True)
+
+    def publish(self, bodies):
+        properties = self._pika.BasicProperties(delivery_mode=2)
+        for body in bodies:
+            self.channel.basic_publish(exchange='', routing_key=self.name, body=body, properties=properties)
+
+    def consume(self, handler, prefetch=1):
+        def on_message(ch, method, properties, body):
+            try:
+                handler(body)
+            finally:
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+
+        self.channel.basic_qos(prefetch_count=prefetch)
+        self.channel.basic_consume(queue=self.name, on_message_callback=on_message)
+        self.channel.start_consuming()
+
+    def sleep(self, seconds):
+        # sleep do pika mantém os heartbeats da conexão em dia; dentro do
+        # handler (espera pelo slot) também é seguro: o pika não despacha
+        # outra mensagem de forma aninhada
+        self.connection.sleep(seconds)
+
+    def close(self):
+        if self.connection.is_open:
+            self.connection.close()
+
+
+# ==========================================
+# 🗄️ EMBUTIDA (SQLITE)
+# ==========================================
+
+class Message:
+    def __init__(self, id, body, lease):
+        self.id = id
+        self.body = body
+        self.lease = lease # visible_at do arrendamento: confirma só quem ainda o detém
+
+
+class EmbeddedQueue:
+    def __init__(self, name=QUEUE_NAME, path=None):
+        self.name = name
+        path = path or EMBEDDED_QUEUE_PATH
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Autocommit: as transações são abertas explicitamente (BEGIN IMMEDIATE)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS queue_messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "queue TEXT NOT NULL, "
+            "body TEXT NOT NULL, "
+            "visible_at REAL NOT NULL DEFAULT 0, "
+            "attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS ix_queue_messages_queue_id ON queue_messages (queue, id)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS queue_dead_letters ("
+            "id INTEGER PRIMARY KEY, "
+            "queue TEXT NOT NULL, "
+            "body TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL, "
+            "failed_at REAL NOT NULL)"
+        )
+
+    def publish(self, bodies):
+        rows = [(self.name, body.decode() if isinstance(body, bytes) else body) for body in bodies]
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.executemany("INSERT INTO queue_messages (queue, body) VALUES (?, ?)", rows)
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def receive(self):
+        """
+        Arrenda a próxima mensagem visível (FIFO) ou devolve None. As que já
+        esgotaram as entregas saem do caminho para queue_dead_letters.
+        """
+        now = time.time()
+        lease = now + QUEUE_VISIBILITY_TIMEOUT
+        dead = []
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = self.db.execute(
+                    "SELECT id, body, attempts FROM queue_messages "
+                    "WHERE queue = ? AND visible_at <= ? ORDER BY id LIMIT 1",
+                    (self.name, now),
+                ).fetchone()
+                if not row or row[2] < QUEUE_MAX_ATTEMPTS:
+                    break
+                self.db.execute(
+                    "INSERT INTO queue_dead_letters (id, queue, body, attempts, failed_at) VALUES (?, ?, ?, ?, ?)",
+                    (row[0], self.name, row[1], row[2], now),
+                )
+                self.db.execute("DELETE FROM queue_messages WHERE id = ?", (row[0],))
+                dead.append(row[0])
+            if row:
+                self.db.execute(
+                    "UPDATE queue_messages SET visible_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (lease, row[0]),
+                )
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        if dead:
+            print(f"☠️ {len(dead)} mensagens sem ack após {QUEUE_MAX_ATTEMPTS} entregas movidas para queue_dead_letters: {dead}")
+        return Message(row[0], row[1], lease) if row else None
+
+    def ack(self, message):
+        self.db.execute(
+            "DELETE FROM queue_messages WHERE id = ? AND visible_at = ?",
+            (message.id, message.lease),
+        )
+
+    def purge_campaign(self, campaign_id):
+        """Apaga as mensagens pendentes (ou arrendadas) de uma campanha; devolve quantas."""
+        # A fila só guarda o lookahead do scheduler: o filtro no JSON varre pouca coisa
+        cursor = self.db.execute(
+            "DELETE FROM queue_messages WHERE queue = ? AND json_extract(body, '$.campaign_id') = ?",
+            (self.name, campaign_id),
+        )
+        return cursor.rowcount
+
+    def depth(self):
+        # Esgotadas ainda não recolhidas pelo receive() não contam
+        return self.db.execute(
+            "SELECT count(*) FROM queue_messages "
+            "WHERE queue = ? AND (attempts < ? OR visible_at > ?)",
+            (self.name, QUEUE_MAX_ATTEMPTS, time.time()),
+        ).fetchone()[0]
+
+    def consume(self, handler, prefetch=1):
+        # prefetch não se aplica: uma mensagem arrendada por vez
+        while True:
+            message = self.receive()
+            if message is None:
+                time.sleep(QUEUE_POLL_INTERVAL)
+                continue
+            try:
+                handler(message.body)
+            finally:
+                self.ack(message)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def close(self):
+        self.db.close()
+
+
+def purge_campaign(campaign_id, name=QUEUE_NAME):
+    """Remove da fila as mensagens de uma campanha, se o backend permitir (0 se não)."""
+    if QUEUE_BACKEND != "embedded":
+        return 0
+    queue = EmbeddedQueue(name)
+    try:
+        return queue.purge_campaign(campaign_id)
+    finally:
+        queue.close()
+
+
+def get_queue(name=QUEUE_NAME):
+    """Abre a fila do backend configurado (o chamador fecha com close())."""
+    if QUEUE_BACKEND == "embedded":
+        return EmbeddedQueue(name)
+    if QUEUE_BACKEND == "rabbitmq":
+        return RabbitMQQueue(name)
+    raise ValueError(f"Unknown QUEUE_BACKEND '{QUEUE_BACKEND}'")
@@ -0,0 +1,82 @@
+"""
+Controle adaptativo de taxa por conexão (AIMD).
+
+O worker alimenta o controlador com cada resposta da Evolution API:
+- resposta saudável: aumento aditivo (+ADAPTIVE_INCREASE_STEP msgs/min);
+- pressão (429, 5xx, erro de rede ou latência subindo): corte multiplicativo
+  (x ADAPTIVE_DECREASE_FACTOR), no máximo um corte por cooldown para que uma
+  rajada de erros não derrube a taxa até o piso de uma vez.
+
+A taxa fica entre o piso da conexão e o teto (messages_per_minute da
+campanha). O worker grava a taxa efetiva em `connections.effective_rate` e o
+scheduler usa esse valor para espaçar os slots.
+"""
+import os
+import time
+
+ADAPTIVE_RATE_ENABLED = os.getenv('ADAPTIVE_RATE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ADAPTIVE_RATE_FLOOR = float(os.getenv('ADAPTIVE_RATE_FLOOR', '1'))
+ADAPTIVE_INCREASE_STEP = float(os.getenv('ADAPTIVE_INCREASE_STEP', '0.5'))
+ADAPTIVE_DECREASE_FACTOR = float(os.getenv('ADAPTIVE_DECREASE_FACTOR', '0.5'))
+ADAPTIVE_DECREASE_COOLDOWN = float(os.getenv('ADAPTIVE_DECREASE_COOLDOWN', '10'))
+# Latência acima de FATOR x média móvel (e do mínimo absoluto) conta como pressão
+ADAPTIVE_LATENCY_RISE_FACTOR = float(os.getenv('ADAPTIVE_LATENCY_RISE_FACTOR', '2.0'))
+ADAPTIVE_LATENCY_MIN_SECONDS = float(os.getenv('ADAPTIVE_LATENCY_MIN_SECONDS', '1.0'))
+LATENCY_EWMA_ALPHA = 0.2
+
+
+def clamp_rate(rate, floor, ceiling):
+    floor = min(floor, ceiling)
+    return max(floor, min(rate, ceiling))
+
+
+def effective_rate(conn, ceiling):
+    """Taxa (msgs/min) que o scheduler deve usar para a campanha nesta conexão."""
+    if not ADAPTIVE_RATE_ENABLED or conn.effective_rate is None:
+        return ceiling
+    floor = conn.min_messages_per_minute or ADAPTIVE_RATE_FLOOR
+    return clamp_rate(conn.effective_rate, floor, ceiling)
+
+
+class AIMDController:
+    def __init__(self, rate, floor, ceiling):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.rate = clamp_rate(rate, floor, ceiling)
+        self.latency_ewma = None
+        self.last_decrease = 0.0
+
+    def is_pressure(self, status_code, latency):
+        if status_code is None or status_code == 429 or status_code >= 500:
+            return True
+        if self.latency_ewma is None:
+            return False
+        return (
+            latency > ADAPTIVE_LATENCY_MIN_SECONDS
+            and latency > self.latency_ewma * ADAPTIVE_LATENCY_RISE_FACTOR
+        )
+
+    def observe(self, status_code, latency, ceiling=None, now=None):
+        """
+        Registra uma resposta (status_code=None para erro de rede) e devolve a
+        nova taxa. `ceiling` acompanha o teto da campanha da mensagem.
+        """
+        now = now or time.monotonic()
+        if ceiling:
+            self.ceiling = ceiling
+
+        if self.is_pressure(status_code, latency):
+            if now - self.last_decrease >= ADAPTIVE_DECREASE_COOLDOWN:
+                self.rate *= ADAPTIVE_DECREASE_FACTOR
+                self.last_decrease = now
+        elif status_code < 400:
+            self.rate += ADAPTIVE_INCREASE_STEP
+
+        if status_code is not None and status_code < 400:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+
+        self.rate = clamp_rate(self.rate, self.floor, self.ceiling)
+        return self.rate
@@ -0,0 +1,190 @@
+"""
+Recibos de entrega/leitura da Evolution API (webhook MESSAGES_UPDATE).
+
+O endpoint só interpreta o corpo e guarda (message_id -> status) num buffer em
+memória: responde na hora, sem tocar no banco. Um flusher no lifespan da API
+drena o buffer a cada RECEIPTS_FLUSH_INTERVAL segundos (antes, se passar de
+RECEIPTS_BATCH_SIZE) e aplica o lote de uma vez:
+- um UPDATE ... WHERE message_id IN (...) AND delivered_at IS NULL RETURNING
+  campaign_id para entregas e outro para leituras (leitura implica entrega);
+- os contadores das campanhas sobem pelo número de linhas que mudaram, então
+  recibos repetidos não contam duas vezes.
+
+Vários recibos da mesma mensagem dentro de um lote viram um só (o mais
+avançado). Recibo que chega antes do log existir (o worker ainda não gravou)
+volta para o buffer por até RECEIPTS_MAX_ATTEMPTS rodadas.
+"""
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timezone
+
+import orjson
+from sqlalchemy import func, select, update
+
+import database
+import metrics
+import models
+
+RECEIPTS_FLUSH_INTERVAL = float(os.getenv('RECEIPTS_FLUSH_INTERVAL', '1'))
+RECEIPTS_BATCH_SIZE = int(os.getenv('RECEIPTS_BATCH_SIZE', '5000'))
+# Acima disso o webhook descarta (protege a memória da API num pico sem banco)
+RECEIPTS_BUFFER_MAX = int(os.getenv('RECEIPTS_BUFFER_MAX', '200000'))
+RECEIPTS_MAX_ATTEMPTS = int(os.getenv('RECEIPTS_MAX_ATTEMPTS', '5'))
+# Obrigatório para receber recibos: a URL do webhook precisa trazer
+# ?token=<valor>. Sem ele o endpoint fica desligado (503), senão qualquer um
+# marcaria mensagens de qualquer tenant como entregues/lidas
+RECEIPTS_WEBHOOK_TOKEN = os.getenv('RECEIPTS_WEBHOOK_TOKEN', '')
+IN_CHUNK = 500
+
+DELIVERED = 1
+READ = 2
+# Evolution v1 manda o nome do status; v2/Baileys pode mandar o código numérico
+STATUSES = {
+    "DELIVERY_ACK": DELIVERED, "READ": READ, "PLAYED": READ,
+    3: DELIVERED, 4: READ, 5: READ,
+}
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def parse(raw):
+    """Corpo do webhook -> [(message_id, DELIVERED|READ)]; ignora outros eventos."""
+    body = orjson.loads(raw)
+    events = body if isinstance(body, list) else [body]
+    receipts = []
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+        name = str(event.get("event") or "messages.update").lower().replace("_", ".")
+        if name != "messages.update":
+            continue
+        data = event.get("data")
+        for item in data if isinstance(data, list) else [data]:
+            if not isinstance(item, dict):
+                continue
+            status = item.get("status")
+            rank = STATUSES.get(status.upper() if isinstance(status, str) else status)
+            # v1: data.key.id; v2: data.keyId
+            message_id = item.get("keyId") or (item.get("key") or {}).get("id")
+            if rank and message_id:
+                receipts.append((str(message_id), rank))
+    return receipts
+
+
+class ReceiptBuffer:
+    """message_id -> [status mais avançado, tentativas]; só usado no event loop."""
+
+    def __init__(self, max_size=RECEIPTS_BUFFER_MAX):
+        self.max_size = max_size
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, receipts, attempts=0):
+        accepted = 0
+        for message_id, rank in receipts:
+            entry = self.pending.get(message_id)
+            if entry:
+                entry[0] = max(entry[0], rank)
+            elif len(self.pending) >= self.max_size:
+                metrics.RECEIPTS.labels("overflow").inc()
+                continue
+            else:
+                self.pending[message_id] = [rank, attempts]
+            accepted += 1
+        if len(self.pending) >= RECEIPTS_BATCH_SIZE:
+            self.ready.set()
+        return accepted
+
+    def drain(self):
+        batch, self.pending = self.pending, {}
+        return batch
+
+    def retry(self, batch):
+        """Devolve recibos sem log (ainda) para a próxima rodada, até o limite."""
+        for message_id, (rank, attempts) in batch.items():
+            if attempts + 1 >= RECEIPTS_MAX_ATTEMPTS:
+                metrics.RECEIPTS.labels("unmatched").inc()
+                continue
+            self.add([(message_id, rank)], attempts + 1)
+
+
+BUFFER = ReceiptBuffer()
+
+
+def apply(db, batch, now=None):
+    """Aplica um lote {message_id: [status, tentativas]} (com commit); devolve os ids encontrados."""
+    now = now or _utcnow()
+    log = models.CampaignLog
+    message_ids = list(batch)
+    matched = set()
+    delivered, read = Counter(), Counter()
+
+    for offset in range(0, len(message_ids), IN_CHUNK):
+        chunk = message_ids[offset:offset + IN_CHUNK]
+        matched.update(db.execute(select(log.message_id).where(log.message_id.in_(chunk))).scalars())
+        delivered.update(db.execute(
+            update(log)
+            .where(log.message_id.in_(chunk), log.delivered_at.is_(None))
+            .values(delivered_at=now)
+            .returning(log.campaign_id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+        reads = [message_id for message_id in chunk if batch[message_id][0] >= READ]
+        if reads:
+            read.update(db.execute(
+                update(log)
+                .where(log.message_id.in_(reads), log.read_at.is_(None))
+                .values(read_at=now)
+                .returning(log.campaign_id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+
+    campaign = models.Campaign
+    for column, counts in ((campaign.delivered_count, delivered), (campaign.read_count, read)):
+        for campaign_id, total in counts.items():
+            db.execute(
+                update(campaign)
+                .where(campaign.id == campaign_id)
+                .values({column: func.coalesce(column, 0) + total})
+                .execution_options(synchronize_session=False)
+            )
+    db.commit()
+    return matched
+
+
+async def flush(buffer=BUFFER):
+    """Drena o buffer e aplica o lote numa sessão assíncrona; devolve quantos recibos."""
+    batch = buffer.drain()
+    if not batch:
+        return 0
+    try:
+        async with database.AsyncSessionLocal() as db:
+            matched = await db.run_sync(apply, batch)
+    except Exception as e:
+        print(f"Erro ao aplicar recibos: {e}")
+        buffer.retry(batch)
+        return 0
+    metrics.RECEIPTS.labels("applied").inc(len(matched))
+    buffer.retry({message_id: entry for message_id, entry in batch.items() if message_id not in matched})
+    return len(batch)
+
+
+async def run_flusher(buffer=BUFFER):
+    """Loop do lifespan: aplica o buffer a cada intervalo ou quando encher um lote."""
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(buffer.ready.wait(), RECEIPTS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            buffer.ready.clear()
+            await flush(buffer)
+    finally:
+        # Desligando: o que ainda está no buffer vai para o banco
+        await flush(buffer)
@@ -0,0 +1,28 @@
+"""
+Resposta JSON rápida para as listagens.
+
+Os endpoints de lista selecionam só as colunas do schema (tuplas, sem montar
+objetos ORM) e devolvem dicts prontos nesta resposta, serializada com orjson.
+Como o FastAPI não reprocessa um Response devolvido pelo endpoint, o
+response_model continua documentando o formato no OpenAPI sem validar linha a
+linha dados que vieram do próprio banco.
+"""
+import orjson
+from fastapi.responses import Response
+
+
+def dumps(content) -> bytes:
+    # datetime sai em ISO 8601, como no encoder padrão do FastAPI
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def rows_to_dicts(fields, rows):
+    """[(1, 'a'), ...] + ('id', 'name') -> [{'id': 1, 'name': 'a'}, ...]."""
+    return [dict(zip(fields, row)) for row in rows]
@@ -0,0 +1,255 @@
+"""
+Retenção dos logs de campanha.
+
+Campanhas concluídas (ou canceladas) há mais de LOG_RETENTION_DAYS saem da tabela quente
+`campaign_logs`:
+- as linhas vão, em ordem de id, para ARCHIVE_DIR/campaign_{id}.ndjson.gz (uma
+  linha JSON por log, gravado num .tmp e renomeado depois do fsync);
+- a contagem por status fica em `campaign_log_rollups`, que o /stats passa a ler;
+- os logs e o ledger de despacho são apagados e `campaigns.logs_archived_at`
+  é marcado na mesma transação.
+
+Se algo falhar antes do commit os logs continuam no banco e a próxima rodada
+regrava o arquivo. No fim a rodada devolve o espaço sem parar as escritas:
+- PostgreSQL: VACUUM ANALYZE campaign_logs (não bloqueia escrita);
+- SQLite: PRAGMA incremental_vacuum em passos de RETENTION_VACUUM_PAGES
+  páginas, cada um uma transação curta. Um VACUUM completo travaria o arquivo
+  inteiro enquanto worker, API e flusher de recibos escrevem, e os logs que
+  batessem em "database is locked" se perderiam; ele só roda pelo comando
+  `vacuum`, numa janela de manutenção. Bancos criados antes do modo
+  incremental precisam desse VACUUM completo uma vez para convertê-los.
+O scheduler roda isso a cada RETENTION_INTERVAL_SECONDS; o /logs continua
+respondendo a partir do arquivo.
+
+Uso:
+    python retention.py run      # arquiva o que passou do prazo e devolve o espaço
+    python retention.py status   # lista campanhas elegíveis e arquivadas
+    python retention.py vacuum   # VACUUM completo (SQLite: trava o banco; rode com os serviços parados)
+"""
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, text
+
+import database
+import models
+
+LOG_RETENTION_DAYS = float(os.getenv('LOG_RETENTION_DAYS', '30'))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', './data/archive')
+# 0 desliga a rodada automática do scheduler
+RETENTION_INTERVAL_SECONDS = float(os.getenv('RETENTION_INTERVAL_SECONDS', '3600'))
+RETENTION_VACUUM = os.getenv('RETENTION_VACUUM', 'true').lower() != 'false'
+# Páginas liberadas por passo do incremental_vacuum (SQLite)
+RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', '1000'))
+SQLITE_INCREMENTAL = 2 # PRAGMA auto_vacuum
+ARCHIVE_BATCH = 5000
+
+LOG_FIELDS = (
+    "id", "campaign_id", "contact_id", "connection_id", "contact_number",
+    "contact_name", "status", "error_message", "timings", "created_at",
+    "message_id", "delivered_at", "read_at",
+)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def archive_path(campaign_id):
+    return os.path.join(ARCHIVE_DIR, f"campaign_{campaign_id}.ndjson.gz")
+
+
+# ==========================================
+# 📦 ARQUIVAMENTO
+# ==========================================
+
+def eligible_campaigns(db, now=None):
+    """Concluídas/canceladas, ainda não arquivadas e sem log mais novo que o prazo."""
+    cutoff = (now or _utcnow()) - timedelta(days=LOG_RETENTION_DAYS)
+    last_log = (
+        db.query(func.max(models.CampaignLog.created_at))
+        .filter(models.CampaignLog.campaign_id == models.Campaign.id)
+        .correlate(models.Campaign)
+        .scalar_subquery()
+    )
+    return (
+        db.query(models.Campaign)
+        .filter(
+            models.Campaign.status.in_(("completed", "cancelled")),
+            models.Campaign.logs_archived_at.is_(None),
+            last_log < cutoff,
+        )
+        .order_by(models.Campaign.id)
+        .all()
+    )
+
+
+def _write_archive(db, campaign_id):
+    """Grava os logs da campanha no arquivo compactado; devolve quantas linhas."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = archive_path(campaign_id)
+    tmp = path + ".tmp"
+    columns = [getattr(models.CampaignLog, field) for field in LOG_FIELDS]
+    rows = (
+        db.query(*columns)
+        .filter(models.CampaignLog.campaign_id == campaign_id)
+        .order_by(models.CampaignLog.id)
+        .yield_per(ARCHIVE_BATCH)
+    )
+    count = 0
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+            for row in rows:
+                record = dict(zip(LOG_FIELDS, row))
+                for field in ("created_at", "delivered_at", "read_at"):
+                    if record[field] is not None:
+                        record[field] = record[field].isoformat()
+                out.write((json.dumps(record, ensure_ascii=False) + "\n").encode())
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def archive_campaign(db, campaign, now=None):
+    """Arquiva, consolida e apaga os logs de uma campanha (com commit)."""
+    count = _write_archive(db, campaign.id)
+
+    stats = (
+        db.query(
+            models.CampaignLog.status,
+            func.count(models.CampaignLog.id),
+            func.min(models.CampaignLog.created_at),
+            func.max(models.CampaignLog.created_at),
+        )
+        .filter(models.CampaignLog.campaign_id == campaign.id)
+        .group_by(models.CampaignLog.status)
+        .all()
+    )
+    db.query(models.CampaignLogRollup).filter(
+        models.CampaignLogRollup.campaign_id == campaign.id
+    ).delete(synchronize_session=False)
+    db.add_all([
+        models.CampaignLogRollup(
+            campaign_id=campaign.id, status=status, count=total, first_at=first_at, last_at=last_at,
+        )
+        for status, total, first_at, last_at in stats
+    ])
+    db.query(models.CampaignLog).filter(
+        models.CampaignLog.campaign_id == campaign.id
+    ).delete(synchronize_session=False)
+    # Campanha encerrada não volta a enviar: o ledger dela não protege mais nada
+    db.query(models.DispatchLedger).filter(
+        models.DispatchLedger.campaign_id == campaign.id
+    ).delete(synchronize_session=False)
+    campaign.logs_archived_at = now or _utcnow()
+    db.commit()
+    return count
+
+
+def vacuum(engine=None, full=False):
+    """
+    Devolve ao sistema o espaço dos logs apagados (fora de transação). No
+    SQLite, sem `full`, só em passos incrementais; devolve quantas páginas.
+    """
+    engine = engine or database.engine
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("VACUUM ANALYZE campaign_logs"))
+            return 0
+        if full:
+            # Converte bancos antigos para o modo incremental no mesmo VACUUM
+            conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+            conn.execute(text("VACUUM"))
+            return 0
+        if conn.execute(text("PRAGMA auto_vacuum")).scalar() != SQLITE_INCREMENTAL:
+            print("ℹ️ Banco sem auto_vacuum incremental: o espaço é reaproveitado, mas só "
+                  "volta ao disco com `python retention.py vacuum` (serviços parados)")
+            return 0
+        start = free = conn.execute(text("PRAGMA freelist_count")).scalar()
+        while free:
+            conn.execute(text(f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})"))
+            remaining = conn.execute(text("PRAGMA freelist_count")).scalar()
+            if remaining >= free:
+                break
+            free = remaining
+        return start - free
+
+
+def run(now=None):
+    """Uma rodada completa; devolve [(campaign_id, linhas arquivadas)]."""
+    db = database.SessionLocal()
+    archived = []
+    try:
+        for campaign in eligible_campaigns(db, now):
+            try:
+                archived.append((campaign.id, archive_campaign(db, campaign, now)))
+            except Exception as e:
+                db.rollback()
+                print(f"Erro ao arquivar os logs da campanha {campaign.id}: {e}")
+    finally:
+        db.close()
+
+    if archived and RETENTION_VACUUM:
+        vacuum()
+    for campaign_id, count in archived:
+        print(f"🗄️ Campanha {campaign_id}: {count} logs arquivados em {archive_path(campaign_id)}")
+    return archived
+
+
+# ==========================================
+# 🔎 LEITURA
+# ==========================================
+
+def archived_logs(campaign_id):
+    """Logs arquivados de uma campanha, na ordem original (dicts)."""
+    with gzip.open(archive_path(campaign_id), "rt", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                record = json.loads(line)
+                # Arquivos antigos não têm os campos acrescentados depois
+                yield {field: record.get(field) for field in LOG_FIELDS}
+
+
+def rollup_stats(db, campaign_id):
+    """{status: count} consolidado de uma campanha arquivada."""
+    rows = (
+        db.query(models.CampaignLogRollup.status, models.CampaignLogRollup.count)
+        .filter(models.CampaignLogRollup.campaign_id == campaign_id)
+        .all()
+    )
+    return {status: count for status, count in rows}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+
+    if command == "run":
+        archived = run()
+        if not archived:
+            print("✅ Nenhuma campanha com logs para arquivar")
+    elif command == "vacuum":
+        vacuum(full=True)
+        print("✅ VACUUM completo concluído")
+    elif command == "status":
+        db = database.SessionLocal()
+        try:
+            for campaign in eligible_campaigns(db):
+                print(f"⏳ {campaign.id} {campaign.name}: logs elegíveis para arquivo")
+            archived = (
+                db.query(models.Campaign)
+                .filter(models.Campaign.logs_archived_at.isnot(None))
+                .order_by(models.Campaign.id)
+                .all()
+            )
+            for campaign in archived:
+                print(f"🗄️ {campaign.id} {campaign.name}: arquivada em {campaign.logs_archived_at:%Y-%m-%d %H:%M}")
+        finally:
+            db.close()
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,634 @@
+"""
+Scheduler: alimenta a fila just-in-time.
+
+Em vez de publicar a audiência inteira no lançamento, cada campanha em
+`processing` recebe só as mensagens cujo slot de envio cai dentro dos próximos
+FEED_LOOKAHEAD_SECONDS. A profundidade da fila fica proporcional à taxa de
+envio (msgs/min x lookahead), não ao tamanho da audiência, e pausar/cancelar
+só precisa parar de alimentar.
+
+Cada mensagem leva `not_before` (slot calculado aqui) e `epoch` (versão da
+campanha: o pause incrementa e o worker descarta as mensagens antigas).
+
+Campanhas com várias conexões dividem os contatos por rendezvous hashing
+ponderado entre as conexões com breaker fechado: a escolha é determinística
+por contato (sobrevive a pause/resume) e, se uma conexão cai, só a fatia dela
+é redistribuída. A cada ciclo o scheduler também sonda as instâncias com
+breaker aberto e devolve à fila as mensagens retidas (breaker.py). Cada slot respeita o ritmo da campanha naquela conexão e o
+limite próprio da conexão (compartilhado entre campanhas).
+
+Contatos com número suprimido ou repetido na audiência são pulados aqui
+(suppressions.py): viram log "skipped" e entrada no ledger, sem ir para a fila.
+
+De tempos em tempos o scheduler também arquiva os logs de campanhas
+concluídas (retention.py).
+"""
+import hashlib
+import math
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import and_, exists
+
+import breaker
+import ledger
+import metrics
+import models
+import queues
+import ratecontrol
+import retention
+import segments
+import services
+import suppressions
+import versions
+from database import SessionLocal
+
+FEED_INTERVAL_SECONDS = float(os.getenv('FEED_INTERVAL_SECONDS', '5'))
+FEED_LOOKAHEAD_SECONDS = float(os.getenv('FEED_LOOKAHEAD_SECONDS', '60'))
+FEED_BATCH_MAX = int(os.getenv('FEED_BATCH_MAX', '500'))
+# Contatos retidos por campanha à espera de uma conexão cheia do pool; no
+# limite a campanha para de ler adiante e segue o ritmo da conexão lenta
+FEED_HOLD_MAX = int(os.getenv('FEED_HOLD_MAX', '5000'))
+# Capacidade total dos workers (msgs/min) dividida entre tenants; 0 = sem limite global
+DISPATCH_MAX_PER_MINUTE = float(os.getenv('DISPATCH_MAX_PER_MINUTE', '0'))
+# Campanhas de um mesmo tenant alimentando ao mesmo tempo; 0 = sem limite
+TENANT_MAX_ACTIVE_CAMPAIGNS = int(os.getenv('TENANT_MAX_ACTIVE_CAMPAIGNS', '0'))
+# Intervalo mínimo entre duas varreduras de duplicados da mesma campanha
+RECIPIENT_FILTER_REFRESH_SECONDS = float(os.getenv('RECIPIENT_FILTER_REFRESH_SECONDS', '60'))
+
+# Estado do rodízio ponderado (o scheduler é um processo só)
+_tenant_credit = {}
+_campaign_credit = {}
+_dispatch_next_at = None
+# campaign_id -> (versão audience, versão suppressions, carregado em (monotonic), RecipientFilter)
+_recipient_filters = {}
+# Contatos retidos porque a conexão deles estava cheia (CampaignFeed):
+# campaign_id -> (feed_epoch, feed_cursor gravado, último id lido, [(id, number, name)])
+_held_contacts = {}
+
+
+def utcnow():
+    # Datas são gravadas em UTC sem tzinfo (SQLite não guarda fuso)
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_utc_naive(value):
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_hhmm(value):
+    """'08:30' -> (8, 30). Lança ValueError se inválido."""
+    hours, minutes = value.split(":")
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(value)
+    return hours, minutes
+
+
+def validate_schedule(send_window_start, send_window_end, tz_name):
+    """Lança ValueError com mensagem legível se agenda/janela forem inválidas."""
+    if bool(send_window_start) != bool(send_window_end):
+        raise ValueError("send_window_start and send_window_end must be set together")
+    if send_window_start:
+        try:
+            parse_hhmm(send_window_start)
+            parse_hhmm(send_window_end)
+        except ValueError:
+            raise ValueError("Send window must use HH:MM")
+    try:
+        ZoneInfo(tz_name or "UTC")
+    except Exception:
+        raise ValueError(f"Unknown timezone '{tz_name}'")
+
+
+def window_end(campaign, now):
+    """
+    Se `now` (UTC) está dentro da janela diária, devolve o fim dela (UTC);
+    fora da janela devolve None. Sem janela configurada: sem limite.
+    Janelas que cruzam a meia-noite (ex: 22:00-06:00) são suportadas.
+    """
+    if not campaign.send_window_start or not campaign.send_window_end:
+        return datetime.max
+
+    tz = ZoneInfo(campaign.timezone or "UTC")
+    local_now = now.replace(tzinfo=timezone.utc).astimezone(tz)
+    start_h, start_m = parse_hhmm(campaign.send_window_start)
+    end_h, end_m = parse_hhmm(campaign.send_window_end)
+
+    start = local_now.replace(hour=start_h, minute=start_m, second=0, microsecond=0)
+    end = local_now.replace(hour=end_h, minute=end_m, second=0, microsecond=0)
+    if end <= start:
+        # Janela noturna: ou estamos na parte de antes da meia-noite, ou na de depois
+        if local_now >= start:
+            end += timedelta(days=1)
+        else:
+            start -= timedelta(days=1)
+
+    if start <= local_now < end:
+        return to_utc_naive(end)
+    return None
+
+
+def campaign_payload(campaign):
+    return {
+        "id": campaign.id,
+        "message_body": campaign.message_body,
+        "media_url": campaign.media_url,
+        "media_type": campaign.media_type,
+        "messages_per_minute": campaign.messages_per_minute,
+    }
+
+
+def connection_payload(conn):
+    return {
+        "id": conn.id,
+        "min_messages_per_minute": conn.min_messages_per_minute,
+        "api_url": conn.api_url,
+        "api_key": conn.api_key,
+        "instance_name": conn.instance_name,
+    }
+
+
+def pending_contacts(db, campaign, limit, after=None):
+    """
+    Próximos contatos da audiência depois do cursor (ou de `after`), em ordem
+    de id. Quem já
+    tem linha no ledger (enviado, reivindicado ou pulado) fica de fora: depois
+    de um rewind o cursor volta para trás deles e nem o log de "skipped" nem a
+    mensagem podem sair de novo.
+    """
+    expr = segments.campaign_expression(campaign)
+    ledger = models.DispatchLedger
+    return (
+        segments.audience_query(
+            db, campaign.user_id, expr,
+            models.Contact.id, models.Contact.number, models.Contact.name,
+        )
+        .filter(models.Contact.id > (campaign.feed_cursor if after is None else after or 0))
+        .filter(~exists().where(and_(
+            ledger.campaign_id == campaign.id,
+            ledger.contact_id == models.Contact.id,
+        )))
+        .order_by(models.Contact.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def rewind_cursor(db, campaign):
+    """
+    Volta o cursor para antes do primeiro contato publicado e ainda não
+    processado (mensagens descartadas pelo worker durante o pause).
+    """
+    # O ledger conta como processado também o que foi reivindicado e não
+    # terminou (worker caiu no meio): no máximo um envio por contato
+    ledger = models.DispatchLedger
+    processed = exists().where(and_(
+        ledger.campaign_id == campaign.id,
+        ledger.contact_id == models.Contact.id,
+    ))
+    first_missing = (
+        segments.audience_query(
+            db, campaign.user_id, segments.campaign_expression(campaign), models.Contact.id,
+        )
+        .filter(models.Contact.id <= (campaign.feed_cursor or 0), ~processed)
+        .order_by(models.Contact.id)
+        .limit(1)
+        .scalar()
+    )
+    if first_missing is not None:
+        campaign.feed_cursor = first_missing - 1
+
+
+def recipient_filter(db, campaign):
+    """
+    Filtro de destinatários da campanha. Suprimidos novos entram no ciclo
+    seguinte (a carga é só a lista do tenant); a varredura de duplicados, que
+    agrupa a audiência inteira, roda no máximo a cada
+    RECIPIENT_FILTER_REFRESH_SECONDS, por mais que a versão "audience" suba.
+    """
+    audience, suppressed = suppressions.filter_versions(db, campaign.user_id)
+    cached = _recipient_filters.get(campaign.id)
+    now = time.monotonic()
+    if cached is None or (cached[0] != audience and now - cached[2] >= RECIPIENT_FILTER_REFRESH_SECONDS):
+        loaded = suppressions.RecipientFilter.load(db, campaign)
+        _recipient_filters[campaign.id] = (audience, suppressed, now, loaded)
+        return loaded
+    loaded = cached[3]
+    if cached[1] != suppressed:
+        loaded.suppressed = suppressions.load_suppressed(db, campaign.user_id)
+        _recipient_filters[campaign.id] = (cached[0], suppressed, cached[2], loaded)
+    return loaded
+
+
+def is_available(conn):
+    # Breaker aberto: a conexão só volta quando a sondagem (breaker.py) fechar
+    return conn.breaker_state == "closed"
+
+
+def _rendezvous_score(contact_id, member):
+    digest = hashlib.blake2b(f"{contact_id}:{member.connection_id}".encode(), digest_size=8).digest()
+    # (0, 1) exclusivo, para o log
+    h = (int.from_bytes(digest, "big") + 1) / (2 ** 64 + 2)
+    return -member.weight / math.log(h)
+
+
+def assign_connection(contact_id, members):
+    """Membro do pool para o contato (rendezvous ponderado: estável e proporcional ao peso)."""
+    return max(members, key=lambda member: _rendezvous_score(contact_id, member))
+
+
+def _slot_for(member, now):
+    conn = member.connection
+    return max(now, member.next_send_at or now, conn.next_send_at or now)
+
+
+def priority_weight(campaign):
+    """Peso da campanha no rodízio: prioridade 0 vale 1, prioridade 5 vale 6..."""
+    return 1 + max(campaign.priority or 0, 0)
+
+
+class CampaignFeed:
+    """
+    Alimentação de uma campanha dentro de um ciclo. Entrega um contato por vez,
+    em ordem de id, para o despachante intercalar campanhas e tenants.
+
+    Cada membro do pool tem a própria capacidade até o horizonte: o contato
+    cuja conexão está cheia fica retido (entre ciclos, em _held_contacts) e os
+    seguintes continuam indo para as conexões livres, de modo que o pool rende
+    a soma das taxas e não a da conexão mais lenta. O feed_cursor gravado fica
+    antes do primeiro retido; se o scheduler reiniciar, o que foi publicado
+    depois dele é relido e republicado, e o ledger descarta a repetição no worker.
+    """
+
+    def __init__(self, db, campaign, now):
+        self.db = db
+        self.campaign = campaign
+        self.now = now
+        self.weight = priority_weight(campaign)
+        self.members = []
+        self.rows = deque()
+        self.held = []
+        self.exhausted = False
+        self.published = 0
+        self.skipped = []
+        self._consumed_since_read = 0
+        self.active = False
+
+        limit_at = window_end(campaign, now)
+        if limit_at is None:
+            # Fora da janela: o ritmo recomeça do zero quando ela abrir
+            campaign.next_send_at = None
+            return
+
+        self.members = [m for m in campaign.connections if is_available(m.connection)]
+        self.horizon = min(now + timedelta(seconds=FEED_LOOKAHEAD_SECONDS), limit_at)
+        ceiling = max(campaign.messages_per_minute or 1, 1)
+        # Intervalo da campanha em cada conexão, pela taxa adaptativa da conexão
+        self.intervals = {
+            m.connection_id: 60 / ratecontrol.effective_rate(m.connection, ceiling)
+            for m in self.members
+        }
+
+        # Retidos de ciclos anteriores valem enquanto ninguém mexeu no cursor
+        # (pause/resume trocam o epoch; o rewind do resume recoloca o cursor)
+        held = _held_contacts.get(campaign.id)
+        if held and held[:2] == (campaign.feed_epoch or 0, campaign.feed_cursor or 0):
+            self.rows.extend(held[3])
+            self.read_cursor = held[2]
+        else:
+            self.read_cursor = campaign.feed_cursor or 0
+        self._loaded_until = self.read_cursor
+
+        # Quantos slots cabem até o horizonte somando o pool (limita a leitura)
+        wanted = sum(self._capacity(member) for member in self.members)
+        if wanted:
+            self.active = True
+            self.filter = recipient_filter(db, campaign)
+            self.batch = min(wanted, FEED_BATCH_MAX)
+            self._read()
+        self.campaign_data = campaign_payload(campaign)
+
+    def _capacity(self, member):
+        """Slots livres do membro até o horizonte."""
+        slot = _slot_for(member, self.now)
+        if slot >= self.horizon:
+            return 0
+        return int((self.horizon - slot).total_seconds() // self.intervals[member.connection_id]) + 1
+
+    def _read(self):
+        rows = pending_contacts(self.db, self.campaign, self.batch, after=self._loaded_until)
+        self.rows.extend(rows)
+        self.exhausted = not rows
+        if rows:
+            self._loaded_until = rows[-1][0]
+        self._consumed_since_read = 0
+
+    def _consume(self, contact_id):
+        self.read_cursor = max(self.read_cursor, contact_id)
+        self._consumed_since_read += 1
+
+    def peek(self):
+        """
+        Slot do próximo contato que tem conexão livre, ou None se a campanha
+        não envia mais neste ciclo. Suprimidos/repetidos saem da frente e os de
+        conexão cheia ficam retidos.
+        """
+        if not self.active:
+            return None
+        while True:
+            if not any(_slot_for(m, self.now) < self.horizon for m in self.members):
+                return None
+            if not self.rows:
+                # Relê se a leitura acabou em pulados/retidos
+                if self.exhausted or not self._consumed_since_read:
+                    return None
+                self._read()
+                continue
+            contact_id, number, name = self.rows[0]
+            reason = self.filter.check(contact_id, number)
+            if reason:
+                self.rows.popleft()
+                self.skipped.append((contact_id, number, name, reason))
+                self._consume(contact_id)
+                continue
+            member = assign_connection(contact_id, self.members)
+            slot = _slot_for(member, self.now)
+            if slot < self.horizon:
+                return slot
+            if len(self.held) >= FEED_HOLD_MAX:
+                return None
+            self.held.append(self.rows.popleft())
+            self._consume(contact_id)
+
+    def take(self, not_before):
+        contact_id, number, name = self.rows.popleft()
+        member = assign_connection(contact_id, self.members)
+        conn = member.connection
+        message = services.build_message(
+            self.campaign_data, connection_payload(conn),
+            {"id": contact_id, "number": number, "name": name},
+            not_before=not_before.replace(tzinfo=timezone.utc).timestamp(),
+            epoch=self.campaign.feed_epoch or 0,
+        )
+        member.next_send_at = not_before + timedelta(seconds=self.intervals[member.connection_id])
+        if conn.messages_per_minute:
+            conn.next_send_at = not_before + timedelta(seconds=60 / conn.messages_per_minute)
+        self.campaign.next_send_at = max(self.campaign.next_send_at or self.now, member.next_send_at)
+        self._consume(contact_id)
+        self.published += 1
+        return message
+
+    def _advance_cursor(self):
+        """Grava o cursor antes do primeiro retido e guarda os retidos para o próximo ciclo."""
+        campaign = self.campaign
+        # Retidos de ciclos anteriores que este ciclo nem chegou a olhar
+        held = sorted(self.held + [row for row in self.rows if row[0] <= self.read_cursor])
+        campaign.feed_cursor = held[0][0] - 1 if held else self.read_cursor
+        if held:
+            _held_contacts[campaign.id] = (
+                campaign.feed_epoch or 0, campaign.feed_cursor, self.read_cursor, held,
+            )
+        else:
+            _held_contacts.pop(campaign.id, None)
+        return held
+
+    def finish(self):
+        campaign = self.campaign
+        if not self.active:
+            return
+        held = self._advance_cursor()
+        if self.skipped:
+            # Pulados ficam registrados (stats/logs) e no ledger, na transação do cursor
+            self.db.execute(models.CampaignLog.__table__.insert(), [
+                {
+                    "campaign_id": campaign.id, "contact_id": contact_id,
+                    "contact_number": number, "contact_name": name,
+                    "status": "skipped", "error_message": reason,
+                }
+                for contact_id, number, name, reason in self.skipped
+            ])
+            ledger.skip(self.db, campaign.id, [contact_id for contact_id, _, _, _ in self.skipped])
+            for reason in (suppressions.SUPPRESSED, suppressions.DUPLICATE):
+                count = sum(1 for item in self.skipped if item[3] == reason)
+                if count:
+                    metrics.RECIPIENTS_SKIPPED.labels(reason).inc(count)
+        # Audiência esgotada: conclui quando o último slot já passou
+        if self.exhausted and not held and (not campaign.next_send_at or campaign.next_send_at <= self.now):
+            campaign.status = "completed"
+            versions.bump(self.db, campaign.user_id, versions.CAMPAIGNS)
+            print(f"🏁 Campanha {campaign.id} concluída")
+
+
+def select_feeds(campaigns):
+    """Aplica a cota por tenant: só as N campanhas mais prioritárias de cada um alimentam."""
+    if not TENANT_MAX_ACTIVE_CAMPAIGNS:
+        return list(campaigns)
+    by_tenant = {}
+    for campaign in campaigns:
+        by_tenant.setdefault(campaign.user_id, []).append(campaign)
+    selected = []
+    for items in by_tenant.values():
+        items.sort(key=lambda c: (-(c.priority or 0), c.id))
+        selected.extend(items[:TENANT_MAX_ACTIVE_CAMPAIGNS])
+    return selected
+
+
+def _smooth_pick(weights, credit):
+    """Round-robin ponderado suave (nginx): escolhe uma chave de `weights`."""
+    total = 0
+    best = None
+    for key, weight in weights.items():
+        total += weight
+        credit[key] = credit.get(key, 0) + weight
+        if best is None or credit[key] > credit[best]:
+            best = key
+    credit[best] -= total
+    return best
+
+
+def _feed_failed(feeds, feed, error):
+    """Tira do ciclo a campanha que falhou; as outras (e os outros tenants) seguem."""
+    feeds.remove(feed)
+    print(f"Erro ao alimentar a campanha {feed.campaign.id}: {error}")
+
+
+def open_feeds(db, campaigns, now):
+    """Um CampaignFeed por campanha; a que falhar ao abrir fica de fora do ciclo."""
+    feeds = []
+    for campaign in campaigns:
+        try:
+            feeds.append(CampaignFeed(db, campaign, now))
+        except Exception as e:
+            print(f"Erro ao alimentar a campanha {campaign.id}: {e}")
+    return feeds
+
+
+def dispatch(feeds, now):
+    """
+    Intercala as campanhas prontas: rodízio ponderado entre tenants (peso da
+    campanha mais prioritária de cada um) e, dentro do tenant, entre campanhas
+    pela prioridade. Com DISPATCH_MAX_PER_MINUTE, os slots também respeitam a
+    capacidade global dos workers. Devolve as mensagens em ordem de slot.
+    """
+    global _dispatch_next_at
+    interval = timedelta(seconds=60 / DISPATCH_MAX_PER_MINUTE) if DISPATCH_MAX_PER_MINUTE else None
+    horizon = now + timedelta(seconds=FEED_LOOKAHEAD_SECONDS)
+    clock = max(now, _dispatch_next_at or now)
+
+    # Créditos de quem saiu de cena não devem influenciar o próximo ciclo
+    live_tenants = {feed.campaign.user_id for feed in feeds}
+    live_campaigns = {feed.campaign.id for feed in feeds}
+    for credit, live in ((_tenant_credit, live_tenants), (_campaign_credit, live_campaigns)):
+        for key in list(credit):
+            if key not in live:
+                del credit[key]
+
+    messages = []
+    feeds = list(feeds)
+    while len(messages) < FEED_BATCH_MAX:
+        slots = {}
+        for feed in list(feeds):
+            try:
+                slot = feed.peek()
+            except Exception as e:
+                _feed_failed(feeds, feed, e)
+                continue
+            if slot is not None:
+                slots[feed] = slot
+        if not slots:
+            break
+
+        if interval:
+            if clock >= horizon:
+                break
+            ready = [feed for feed, slot in slots.items() if slot <= clock]
+            if not ready:
+                # Ninguém pronto no slot global: avança até a próxima campanha
+                clock = min(slots.values())
+                continue
+        else:
+            ready = list(slots)
+
+        by_tenant = {}
+        for feed in ready:
+            by_tenant.setdefault(feed.campaign.user_id, {})[feed.campaign.id] = feed
+        user_id = _smooth_pick(
+            {uid: max(f.weight for f in items.values()) for uid, items in by_tenant.items()},
+            _tenant_credit,
+        )
+        tenant_feeds = by_tenant[user_id]
+        campaign_id = _smooth_pick({cid: f.weight for cid, f in tenant_feeds.items()}, _campaign_credit)
+        feed = tenant_feeds[campaign_id]
+
+        not_before = max(slots[feed], clock) if interval else slots[feed]
+        try:
+            messages.append((not_before, feed.take(not_before)))
+        except Exception as e:
+            _feed_failed(feeds, feed, e)
+            continue
+        if interval:
+            clock = not_before + interval
+
+    if interval:
+        _dispatch_next_at = clock
+    messages.sort(key=lambda item: item[0])
+    return [message for _, message in messages]
+
+
+def tick(queue=None):
+    db = SessionLocal()
+    try:
+        now = utcnow()
+
+        # Agendadas cujo horário chegou
+        due = (
+            db.query(models.Campaign)
+            .filter(
+                models.Campaign.status == "scheduled",
+                models.Campaign.scheduled_at <= now,
+            )
+            .all()
+        )
+        for campaign in due:
+            campaign.status = "processing"
+            versions.bump(db, campaign.user_id, versions.CAMPAIGNS)
+        if due:
+            db.commit()
+
+        active = (
+            db.query(models.Campaign)
+            .filter(models.Campaign.status == "processing")
+            .order_by(models.Campaign.id)
+            .all()
+        )
+        active_ids = {campaign.id for campaign in active}
+        for cache in (_recipient_filters, _held_contacts):
+            for campaign_id in set(cache) - active_ids:
+                del cache[campaign_id]
+        feeds = open_feeds(db, select_feeds(active), now)
+        messages = dispatch(feeds, now)
+        if messages:
+            services.publish_messages(messages, queue=queue)
+        for feed in feeds:
+            feed.finish()
+        # Cursores só avançam depois do publish
+        db.commit()
+        for feed in feeds:
+            if feed.published:
+                print(f"📤 Campanha {feed.campaign.id}: {feed.published} mensagens na fila (cursor {feed.campaign.feed_cursor})")
+            if feed.skipped:
+                print(f"🚫 Campanha {feed.campaign.id}: {len(feed.skipped)} contatos pulados (suprimidos/repetidos)")
+
+        try:
+            breaker.probe_open_connections(
+                db, now, now + timedelta(seconds=FEED_LOOKAHEAD_SECONDS), queue=queue,
+            )
+        except Exception as e:
+            db.rollback()
+            print(f"Erro na sondagem das conexões: {e}")
+    finally:
+        db.close()
+
+
+def maybe_run_retention(last_run):
+    """Arquiva logs antigos a cada RETENTION_INTERVAL_SECONDS; devolve o horário da última rodada."""
+    if retention.RETENTION_INTERVAL_SECONDS <= 0:
+        return last_run
+    current = time.monotonic()
+    if last_run is not None and current - last_run < retention.RETENTION_INTERVAL_SECONDS:
+        return last_run
+    try:
+        retention.run()
+    except Exception as e:
+        print(f"Erro na retenção de logs: {e}")
+    return current
+
+
+def start_scheduler():
+    metrics.start_listener()
+    retention_ran_at = None
+    while True:
+        queue = None
+        try:
+            queue = queues.get_queue()
+            print(f' [*] Heimdall Scheduler ativo (fila {queues.QUEUE_BACKEND}, lookahead {FEED_LOOKAHEAD_SECONDS:.0f}s)')
+            while True:
+                tick(queue)
+                retention_ran_at = maybe_run_retention(retention_ran_at)
+                queue.sleep(FEED_INTERVAL_SECONDS)
+        except Exception as e:
+            print(f"Erro no scheduler: {e}")
+            time.sleep(5)
+        finally:
+            if queue:
+                queue.close()
+
+
+if __name__ == "__main__":
+    start_scheduler()
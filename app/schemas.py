@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional, Any
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Optional, Any, Dict
 from datetime import datetime
 
 # --- Auth ---
@@ -33,12 +33,22 @@ class ConnectionBase(BaseModel):
     api_url: str
     api_key: str
     instance_name: str
+    messages_per_minute: Optional[int] = None # limite do número, somando todas as campanhas
+    min_messages_per_minute: Optional[int] = None # piso do controle adaptativo
 
 class ConnectionCreate(ConnectionBase):
     pass
 
 class Connection(ConnectionBase):
     id: int
+    is_healthy: bool = True
+    effective_rate: Optional[float] = None # taxa adaptativa atual (msgs/min)
+    # Circuit breaker: "closed" (enviando) ou "open" (mensagens retidas, sondando)
+    breaker_state: str = "closed"
+    unhealthy_since: Optional[datetime] = None # quando o breaker abriu
+    instance_state: Optional[str] = None # último connectionState da Evolution
+    probed_at: Optional[datetime] = None
+    parked_messages: int = 0
     class Config:
         orm_mode = True
 
@@ -77,15 +87,49 @@ class ContactListCreate(ContactListBase):
 
 class ContactList(ContactListBase):
     id: int
-    contacts: List[Contact] = [] # Retorna os contatos da lista
+    member_count: int = 0 # Contatos ficam em GET /lists/{id}/contacts (paginado)
     class Config:
         orm_mode = True
 
+class ListMembershipChange(BaseModel):
+    # Critérios combinados com AND; pelo menos um é obrigatório
+    contact_ids: List[int] = []
+    tag_ids: List[int] = [] # qualquer uma das tags
+    q: Optional[str] = None # nome ou número, como em /contacts/search
+    definition: Optional[Dict[str, Any]] = None # expressão de segmento
+
+class ListMembershipResult(BaseModel):
+    list_id: int
+    added: int = 0
+    removed: int = 0
+    member_count: int
+
+class ListCompose(ContactListBase):
+    operation: str # union, intersection, difference
+    sources: List[Dict[str, Any]] # [{"list": 1}, {"tag": 2}, ...]
+
+# --- Segments ---
+class SegmentPreview(BaseModel):
+    definition: Dict[str, Any]
+
+class SegmentCreate(SegmentPreview):
+    name: str
+
+class Segment(SegmentCreate):
+    id: int
+
+class SegmentCount(BaseModel):
+    segment_id: Optional[int] = None
+    count: int
+
 # --- Contact Import ---
 class ContactImportItem(BaseModel):
     name: str
     number: str
 
+class ContactCount(BaseModel):
+    total: int
+
 class ContactImportRequest(BaseModel):
     contacts: List[ContactImportItem]
     tag_ids: List[int] = []
@@ -97,16 +141,46 @@ class ContactImportResponse(BaseModel):
     list_id: Optional[int] = None
     tag_ids: List[int] = []
 
+# --- Suppressions ---
+class SuppressionCreate(BaseModel):
+    numbers: List[str]
+    reason: str = "opt_out" # opt_out ou invalid
+
+class Suppression(BaseModel):
+    number: str # só dígitos
+    reason: str
+    detail: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class SuppressionAddResponse(BaseModel):
+    added: int
+    skipped: int # já estavam na lista (ou sem dígitos)
+
 # --- Campaign ---
+class CampaignConnectionIn(BaseModel):
+    connection_id: int
+    weight: int = 1
+
+class CampaignConnection(CampaignConnectionIn):
+    class Config:
+        orm_mode = True
+
 class CampaignCreate(BaseModel):
     name: str
     message_body: str
     media_url: Optional[str] = None
     media_type: Optional[str] = None
-    messages_per_minute: int = 10
+    messages_per_minute: int = Field(10, ge=1)
+    priority: int = 0 # 0 (normal) a 10 (urgente): peso no rodízio entre campanhas
     contact_list_id: Optional[int] = None
     target_tags_ids: Optional[List[int]] = None
-    connection_id: int
+    segment_id: Optional[int] = None
+    connection_id: Optional[int] = None
+    connections: Optional[List[CampaignConnectionIn]] = None # pool com pesos (substitui connection_id)
+    scheduled_at: Optional[datetime] = None     # início futuro (com fuso ou UTC)
+    send_window_start: Optional[str] = None     # "HH:MM" no fuso `timezone`
+    send_window_end: Optional[str] = None
+    timezone: str = "UTC"
 
 class Campaign(BaseModel):
     id: int
@@ -115,9 +189,33 @@ class Campaign(BaseModel):
     media_url: Optional[str] = None
     media_type: Optional[str] = None
     messages_per_minute: int
+    priority: int = 0
     status: str
-    connection_id: int
-    contact_list_id: int
+    connection_id: Optional[int] = None
+    connections: List[CampaignConnection] = []
+    contact_list_id: Optional[int] = None
+    segment_id: Optional[int] = None
+    total_contacts: Optional[int] = None
+    scheduled_at: Optional[datetime] = None
+    send_window_start: Optional[str] = None
+    send_window_end: Optional[str] = None
+    timezone: Optional[str] = None
     # connection: Connection  <-- Opcional: Se quiser aninhar os dados da conexão
     class Config:
         orm_mode = True
+
+class Job(BaseModel):
+    id: int
+    kind: str # launch_campaign, resume_campaign
+    campaign_id: Optional[int] = None
+    status: str # queued, running, completed, failed, cancelled
+    progress: float # 0 a 100
+    checkpoint: Optional[dict] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    attempts: int
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    class Config:
+        orm_mode = True
@@ -0,0 +1,106 @@
+"""
+Busca de contatos no servidor.
+
+- Número: prefixo ou sufixo sobre os dígitos normalizados (number_digits /
+  number_reversed), sempre via índice (user_id, coluna).
+- Nome: FTS5 no SQLite, trigram (pg_trgm) no PostgreSQL.
+
+Os índices/estruturas são criados pela migração 0003.
+"""
+import re
+
+from sqlalchemy import Integer, and_, func, literal_column, or_, select, text
+
+import models
+
+# Só dígitos e formatação de telefone -> busca por número
+NUMBER_QUERY = re.compile(r"^[\d\s+()\-.]+$")
+NAME_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def _is_postgres(db):
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _digits_prefix(db, column, digits):
+    if _is_postgres(db):
+        return column.like(f"{digits}%")
+    # LIKE do SQLite ignora caixa e não usa o índice; intervalo sim.
+    # ':' é o caractere seguinte a '9' na ordem binária.
+    return and_(column >= digits, column < digits + ":")
+
+
+def number_filter(db, q):
+    """Contatos cujo número começa OU termina com os dígitos de `q`."""
+    digits = models.normalize_number(q)
+    if not digits:
+        return None
+    return or_(
+        _digits_prefix(db, models.Contact.number_digits, digits),
+        _digits_prefix(db, models.Contact.number_reversed, digits[::-1]),
+    )
+
+
+def name_filter(db, q):
+    """
+    Todos os termos de `q` precisam casar. No PostgreSQL devolve uma condição
+    (trigram); no SQLite devolve a subquery do FTS5 (prefixo de palavra), que
+    deve ser usada em JOIN para o planner partir do índice de texto.
+    """
+    tokens = NAME_TOKEN.findall(q)
+    if not tokens:
+        return None
+
+    if _is_postgres(db):
+        name = func.lower(models.Contact.name)
+        return and_(*[
+            name.like(f"%{_escape_like(token.lower())}%", escape="\\")
+            for token in tokens
+        ])
+
+    fts_query = " ".join(f'"{token}"*' for token in tokens)
+    return text(
+        "SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH :fts"
+    ).bindparams(fts=fts_query).columns(rowid=Integer).subquery("fts")
+
+
+def search_contacts(db, user_id, q=None, tag_ids=None, list_id=None):
+    """
+    Monta a query de busca (sem paginação/ordenação). Filtros são combinados
+    com AND; tag_ids segue a semântica de campanha ("qualquer uma das tags").
+    """
+    query = db.query(models.Contact)
+    tenant = models.Contact.user_id == user_id
+
+    q = (q or "").strip()
+    if q:
+        is_number = bool(NUMBER_QUERY.match(q))
+        condition = number_filter(db, q) if is_number else name_filter(db, q)
+        if condition is None:
+            return query.filter(False)
+        if is_number or _is_postgres(db):
+            query = query.filter(condition)
+        else:
+            # Parte do FTS e chega no contato pela PK; o "+" impede o SQLite de
+            # preferir o índice de user_id (varreria o tenant inteiro).
+            query = query.join(condition, models.Contact.id == condition.c.rowid)
+            tenant = literal_column("+contacts.user_id") == user_id
+    query = query.filter(tenant)
+
+    if tag_ids:
+        query = query.filter(models.Contact.id.in_(
+            select(models.contact_tags.c.contact_id)
+            .where(models.contact_tags.c.tag_id.in_(tag_ids))
+        ))
+
+    if list_id:
+        query = query.filter(models.Contact.id.in_(
+            select(models.list_contacts.c.contact_id)
+            .where(models.list_contacts.c.list_id == list_id)
+        ))
+
+    return query
@@ -0,0 +1,137 @@
+"""
+Motor de segmentos: expressões booleanas sobre tags e listas, avaliadas em SQL.
+
+Gramática (JSON):
+    {"tag": 1}                      contatos com a tag 1
+    {"list": 2}                     contatos da lista 2
+    {"and": [expr, ...]}            interseção
+    {"or": [expr, ...]}             união
+    {"not": expr}                   complemento (dentro dos contatos do tenant)
+
+Cada folha vira um `contacts.id IN (SELECT ...)` servido pelos índices das
+tabelas associativas, então nenhuma audiência é materializada em linhas novas.
+Contagens ficam em cache em memória, invalidadas pela versão "audience" do
+tenant (versions.py).
+"""
+import json
+from collections import OrderedDict
+
+from sqlalchemy import and_, func, not_, or_, select
+
+import models
+import versions
+
+MAX_DEPTH = 16
+COUNT_CACHE_SIZE = 1024
+
+# (user_id, expressão canônica) -> (versão da audiência, contagem)
+_count_cache = OrderedDict()
+
+
+class SegmentError(ValueError):
+    """Expressão malformada (400)."""
+
+
+class SegmentNotFound(SegmentError):
+    """Expressão referencia tag/lista inexistente ou de outro tenant (404)."""
+
+
+def canonical(expr):
+    return json.dumps(expr, sort_keys=True, separators=(",", ":"))
+
+
+def _walk(expr, depth=0):
+    """Valida a expressão e devolve os ids de tags e listas referenciados."""
+    if depth > MAX_DEPTH:
+        raise SegmentError("Segment expression is too deep")
+    if not isinstance(expr, dict) or len(expr) != 1:
+        raise SegmentError("Each node must be an object with a single key")
+
+    (op, arg), = expr.items()
+    if op in ("tag", "list"):
+        if not isinstance(arg, int) or isinstance(arg, bool):
+            raise SegmentError(f"'{op}' expects an integer id")
+        return ({arg}, set()) if op == "tag" else (set(), {arg})
+    if op in ("and", "or"):
+        if not isinstance(arg, list) or not arg:
+            raise SegmentError(f"'{op}' expects a non-empty list")
+        tags, lists = set(), set()
+        for child in arg:
+            child_tags, child_lists = _walk(child, depth + 1)
+            tags |= child_tags
+            lists |= child_lists
+        return tags, lists
+    if op == "not":
+        return _walk(arg, depth + 1)
+    raise SegmentError(f"Unknown operator '{op}'")
+
+
+def validate(db, user_id, expr):
+    """Garante que a expressão é válida e só referencia tags/listas do tenant."""
+    tag_ids, list_ids = _walk(expr)
+    if tag_ids:
+        found = db.query(func.count(models.Tag.id)).filter(
+            models.Tag.id.in_(tag_ids), models.Tag.user_id == user_id
+        ).scalar()
+        if found != len(tag_ids):
+            raise SegmentNotFound("Tag not found")
+    if list_ids:
+        found = db.query(func.count(models.ContactList.id)).filter(
+            models.ContactList.id.in_(list_ids), models.ContactList.user_id == user_id
+        ).scalar()
+        if found != len(list_ids):
+            raise SegmentNotFound("List not found")
+
+
+def compile_expression(expr):
+    """Traduz a expressão em uma condição SQLAlchemy sobre contacts.id."""
+    (op, arg), = expr.items()
+    if op == "tag":
+        return models.Contact.id.in_(
+            select(models.contact_tags.c.contact_id).where(models.contact_tags.c.tag_id == arg)
+        )
+    if op == "list":
+        return models.Contact.id.in_(
+            select(models.list_contacts.c.contact_id).where(models.list_contacts.c.list_id == arg)
+        )
+    if op == "and":
+        return and_(*[compile_expression(child) for child in arg])
+    if op == "or":
+        return or_(*[compile_expression(child) for child in arg])
+    return not_(compile_expression(arg))
+
+
+def audience_query(db, user_id, expr, *columns):
+    """Query dos contatos da audiência (entidades ou só as colunas pedidas)."""
+    query = db.query(*columns) if columns else db.query(models.Contact)
+    return query.filter(models.Contact.user_id == user_id, compile_expression(expr))
+
+
+def count(db, user_id, expr):
+    """Tamanho da audiência, servido do cache enquanto a versão não mudar."""
+    key = (user_id, canonical(expr))
+    version = versions.current(db, user_id, versions.AUDIENCE)
+
+    cached = _count_cache.get(key)
+    if cached and cached[0] == version:
+        _count_cache.move_to_end(key)
+        return cached[1]
+
+    total = audience_query(db, user_id, expr, func.count(models.Contact.id)).scalar()
+    _count_cache[key] = (version, total)
+    _count_cache.move_to_end(key)
+    while len(_count_cache) > COUNT_CACHE_SIZE:
+        _count_cache.popitem(last=False)
+    return total
+
+
+def has_contacts(db, user_id, expr):
+    """A audiência tem ao menos um contato? (LIMIT 1, não conta tudo)"""
+    return audience_query(db, user_id, expr, models.Contact.id).limit(1).scalar() is not None
+
+
+def campaign_expression(campaign):
+    """Expressão de audiência da campanha (campanhas antigas só têm contact_list_id)."""
+    if campaign.audience:
+        return json.loads(campaign.audience)
+    return {"list": campaign.contact_list_id}
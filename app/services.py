@@ -1,48 +1,65 @@
-import pika
 import json
-import os
+import time
 
-RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'localhost')
-RABBITMQ_USER = os.getenv('RABBITMQ_USER', 'guest')
-RABBITMQ_PASS = os.getenv('RABBITMQ_PASS', 'guest')
+import metrics
+import queues
 
-def get_rabbitmq_connection():
-    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-    parameters = pika.ConnectionParameters(host=RABBITMQ_HOST, credentials=credentials)
-    return pika.BlockingConnection(parameters)
+QUEUE_NAME = queues.QUEUE_NAME
 
-def publish_campaign_to_queue(campaign_data: dict, connection_data: dict, contacts: list):
+def build_message(campaign_data: dict, connection_data: dict, contact: dict, not_before=None, epoch=0):
     """
-    Publica as mensagens na fila, injetando os dados da conexão (instância)
-    dentro de cada mensagem para o worker saber quem deve disparar.
+    Monta a mensagem de um contato, injetando os dados da conexão (instância)
+    para o worker saber quem deve disparar.
+
+    not_before (epoch em segundos) é o slot de envio calculado pelo scheduler;
+    sem ele o worker cai no ritmo antigo (delay_seconds após cada envio).
     """
-    connection = get_rabbitmq_connection()
-    channel = connection.channel()
-    channel.queue_declare(queue='whatsapp_campaigns', durable=True)
-
-    for contact in contacts:
-        message_payload = {
-            "campaign_id": campaign_data.get('id'),
-            "phone": contact['number'],
-            "name": contact['name'],
-            "message": campaign_data['message_body'],
-            "media_url": campaign_data['media_url'],
-            "media_type": campaign_data['media_type'],
-            "delay_seconds": 60 / campaign_data['messages_per_minute'],
-            
-            # Dados da Instância para o Worker usar
-            "connection": {
-                "base_url": connection_data['api_url'],
-                "api_key": connection_data['api_key'],
-                "instance": connection_data['instance_name']
-            }
+    return {
+        "campaign_id": campaign_data.get('id'),
+        "contact_id": contact.get('id'),
+        "phone": contact['number'],
+        "name": contact['name'],
+        "message": campaign_data['message_body'],
+        "media_url": campaign_data['media_url'],
+        "media_type": campaign_data['media_type'],
+        # Mesmo piso do scheduler: campanha antiga com 0/NULL não derruba o ciclo
+        "delay_seconds": 60 / max(campaign_data['messages_per_minute'] or 1, 1),
+        "not_before": not_before,
+        "epoch": epoch,
+
+        # Dados da Instância para o Worker usar
+        "connection": {
+            "id": connection_data.get('id'),
+            "min_messages_per_minute": connection_data.get('min_messages_per_minute'),
+            "base_url": connection_data['api_url'],
+            "api_key": connection_data['api_key'],
+            "instance": connection_data['instance_name']
         }
-        
-        channel.basic_publish(
-            exchange='',
-            routing_key='whatsapp_campaigns',
-            body=json.dumps(message_payload),
-            properties=pika.BasicProperties(delivery_mode=2)
-        )
-    
-    connection.close()
\ No newline at end of file
+    }
+
+def publish_messages(messages: list, queue=None):
+    """Publica mensagens prontas; reaproveita a fila se o chamador já tiver uma aberta."""
+    started = time.perf_counter()
+    owned = queue is None
+    if owned:
+        queue = queues.get_queue()
+
+    bodies = []
+    for message_payload in messages:
+        # Início do span "queue" (timings.py) medido pelo worker
+        message_payload["enqueued_at"] = time.time()
+        bodies.append(json.dumps(message_payload))
+    try:
+        queue.publish(bodies)
+    finally:
+        if owned:
+            queue.close()
+    metrics.MESSAGES_PUBLISHED.inc(len(messages))
+    metrics.PUBLISH_BATCH_SECONDS.observe(time.perf_counter() - started)
+
+def publish_campaign_to_queue(campaign_data: dict, connection_data: dict, contacts: list):
+    """
+    Publica a audiência inteira de uma vez. O fluxo normal de campanhas passa
+    pelo scheduler (scheduler.py), que alimenta a fila aos poucos.
+    """
+    publish_messages([build_message(campaign_data, connection_data, c) for c in contacts])
@@ -0,0 +1,154 @@
+"""
+Lista de supressão por tenant e deduplicação de destinatários.
+
+`suppressions` guarda, por tenant, números (só dígitos) que não recebem mais
+campanhas: opt-outs cadastrados pela API e números que a Evolution recusou
+por não existirem no WhatsApp (o worker colhe esses sozinho, ver harvest()).
+
+Os dois filtros são aplicados pelo scheduler na alimentação, sem query por
+destinatário. Cada campanha ativa tem um RecipientFilter carregado uma vez e
+mantido em memória; o scheduler recarrega os suprimidos quando a versão
+"suppressions" do tenant (versions.py) muda e refaz os duplicados quando a
+versão "audience" muda, no máximo a cada RECIPIENT_FILTER_REFRESH_SECONDS
+(uma importação grande sobe a versão a cada lote):
+- o conjunto de números suprimidos do tenant;
+- os números que aparecem em mais de um contato da audiência (listas e tags
+  sobrepostas, "+55 (11) 9..." e "55119..."), cada um com o menor contacts.id
+  que o tem. Só esse contato recebe; os demais são pulados como "duplicate".
+
+Como o contato canônico é fixo (menor id), o filtro não tem estado de "já
+visto": pause/resume, rewind do cursor e reinício do scheduler não mudam o
+resultado, e a memória cresce com os duplicados, não com a audiência.
+"""
+import json
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+import segments
+import versions
+
+OPT_OUT = "opt_out"
+INVALID = "invalid"
+REASONS = (OPT_OUT, INVALID)
+
+SUPPRESSED = "suppressed"
+DUPLICATE = "duplicate"
+INSERT_CHUNK = 1000
+
+
+def _insert(db):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(models.Suppression.__table__)
+
+
+def add(db, user_id, numbers, reason, detail=None):
+    """Suprime os números (sem commit); devolve quantos ainda não estavam na lista."""
+    keys = {models.normalize_number(number) for number in numbers}
+    keys.discard("")
+    keys = sorted(keys)
+    added = 0
+    for offset in range(0, len(keys), INSERT_CHUNK):
+        stmt = _insert(db).values([
+            {"user_id": user_id, "number": key, "reason": reason, "detail": detail}
+            for key in keys[offset:offset + INSERT_CHUNK]
+        ])
+        added += db.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "number"])).rowcount
+    if added:
+        versions.bump(db, user_id, versions.SUPPRESSIONS)
+    return added
+
+
+def remove(db, user_id, number):
+    """Tira o número da lista (sem commit); False se ele não estava lá."""
+    removed = db.query(models.Suppression).filter(
+        models.Suppression.user_id == user_id,
+        models.Suppression.number == models.normalize_number(number),
+    ).delete(synchronize_session=False)
+    if removed:
+        versions.bump(db, user_id, versions.SUPPRESSIONS)
+    return bool(removed)
+
+
+# ==========================================
+# 🚫 COLHEITA DE NÚMEROS INVÁLIDOS
+# ==========================================
+
+def is_invalid_number(status_code, body):
+    """
+    Falha permanente da Evolution para o número: 400 com
+    {"response": {"message": [{"exists": false, ...}]}}. Outros 4xx (texto,
+    mídia, instância) não dizem nada sobre o destinatário.
+    """
+    if status_code != 400:
+        return False
+    try:
+        messages = (json.loads(body).get("response") or {}).get("message")
+    except (ValueError, AttributeError):
+        return False
+    return isinstance(messages, list) and any(
+        isinstance(item, dict) and item.get("exists") is False for item in messages
+    )
+
+
+def harvest(db, campaign_id, number, detail=None):
+    """Suprime como inválido o número que falhou numa campanha (sem commit)."""
+    user_id = db.query(models.Campaign.user_id).filter(models.Campaign.id == campaign_id).scalar()
+    if user_id is None:
+        return 0
+    return add(db, user_id, [number], INVALID, detail)
+
+
+# ==========================================
+# 🧹 FILTRO DE DESTINATÁRIOS
+# ==========================================
+
+def load_suppressed(db, user_id):
+    """Números suprimidos do tenant."""
+    return {
+        number for number, in db.query(models.Suppression.number)
+        .filter(models.Suppression.user_id == user_id)
+    }
+
+
+class RecipientFilter:
+    """Números suprimidos + contato canônico dos números repetidos de uma audiência."""
+
+    def __init__(self, suppressed, canonical):
+        self.suppressed = suppressed
+        self.canonical = canonical
+
+    @classmethod
+    def load(cls, db, campaign):
+        suppressed = load_suppressed(db, campaign.user_id)
+        digits = models.Contact.number_digits
+        canonical = dict(
+            segments.audience_query(
+                db, campaign.user_id, segments.campaign_expression(campaign),
+                digits, func.min(models.Contact.id),
+            )
+            .filter(digits.isnot(None), digits != "")
+            .group_by(digits)
+            .having(func.count(models.Contact.id) > 1)
+            .all()
+        )
+        return cls(suppressed, canonical)
+
+    def check(self, contact_id, number):
+        """Motivo para não enviar ao contato (SUPPRESSED, DUPLICATE) ou None."""
+        key = models.normalize_number(number)
+        if key in self.suppressed:
+            return SUPPRESSED
+        first = self.canonical.get(key)
+        if first is not None and first != contact_id:
+            return DUPLICATE
+        return None
+
+
+def filter_versions(db, user_id):
+    """Chave de validade de um RecipientFilter carregado para o tenant."""
+    return (
+        versions.current(db, user_id, versions.AUDIENCE),
+        versions.current(db, user_id, versions.SUPPRESSIONS),
+    )
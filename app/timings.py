@@ -0,0 +1,56 @@
+"""
+Decomposição de latência por mensagem.
+
+O worker mede cada etapa do processamento e grava os tempos junto do log
+(`campaign_logs.timings`) como inteiros em milissegundos separados por
+vírgula, na ordem de SPANS — poucos bytes por linha, sem tabela extra.
+
+    queue   publicação (enqueued_at) -> saída da fila
+    wait    espera até o slot agendado (not_before)
+    late    atraso do envio em relação ao slot
+    check   consultas de breaker / status da campanha
+    render  montagem do texto e do corpo da requisição
+    http    chamada à Evolution API
+    log     commit do log anterior deste worker (o próprio commit não cabe na linha)
+"""
+import math
+import os
+
+SPANS = ("queue", "wait", "late", "check", "render", "http", "log")
+PERCENTILES = (50, 90, 99)
+# Amostras mais recentes consideradas no resumo de uma campanha
+TIMINGS_SAMPLE_LIMIT = int(os.getenv('TIMINGS_SAMPLE_LIMIT', '10000'))
+
+
+def encode(spans):
+    """{'http': 0.85, ...} (segundos) -> '0,0,0,3,0,850,12'."""
+    return ",".join(str(max(int(round(spans.get(name, 0) * 1000)), 0)) for name in SPANS)
+
+
+def decode(value):
+    """'0,0,0,3,0,850,12' -> {'queue': 0, ..., 'log': 12} (ms); None se vazio/inválido."""
+    if not value:
+        return None
+    try:
+        parts = [int(part) for part in value.split(",")]
+    except ValueError:
+        return None
+    return dict(zip(SPANS, parts))
+
+
+def percentile(sorted_values, pct):
+    """Percentil por rank mais próximo (lista já ordenada)."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(samples):
+    """Lista de dicts decodificados -> {span: {p50, p90, p99, max}} em ms."""
+    summary = {}
+    for name in SPANS:
+        values = sorted(sample[name] for sample in samples if name in sample)
+        summary[name] = {f"p{pct}": percentile(values, pct) for pct in PERCENTILES}
+        summary[name]["max"] = values[-1] if values else None
+    return summary
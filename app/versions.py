@@ -0,0 +1,82 @@
+"""
+Contadores de versão por tenant/escopo (tabela data_versions).
+
+Quem escreve chama bump() dentro da própria transação; quem cacheia guarda a
+versão junto do valor e descarta a entrada quando current() mudar. O
+updated_at de cada escopo vira o Last-Modified dos GETs condicionais
+(httpcache.py).
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+
+# contacts / contact_tags / list_contacts: tudo que muda o resultado de uma audiência
+AUDIENCE = "audience"
+# suppressions: números bloqueados do tenant (filtro de destinatários do scheduler)
+SUPPRESSIONS = "suppressions"
+# Escopos dos GETs condicionais: o que aparece em /connections, /tags, /lists e /campaigns
+CONNECTIONS = "connections"
+TAGS = "tags"
+LISTS = "lists"
+CAMPAIGNS = "campaigns"
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _insert(db):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(models.DataVersion.__table__)
+
+
+def _upsert(stmt):
+    table = models.DataVersion.__table__
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.scope],
+        set_={"version": table.c.version + 1, "updated_at": stmt.excluded.updated_at},
+    )
+
+
+def bump(db, user_id, scope):
+    """Incrementa a versão do escopo (sem commit: vai junto com a escrita)."""
+    db.execute(_upsert(
+        _insert(db).values(user_id=user_id, scope=scope, version=1, updated_at=_utcnow())
+    ))
+
+
+def bump_owner(db, model, row_id, scope):
+    """bump() do dono da linha, sem buscar o user_id antes (worker/scheduler)."""
+    source = select(model.user_id, literal(scope), literal(1), literal(_utcnow())).where(model.id == row_id)
+    db.execute(_upsert(
+        _insert(db).from_select(["user_id", "scope", "version", "updated_at"], source)
+    ))
+
+
+def current(db, user_id, scope):
+    version = (
+        db.query(models.DataVersion.version)
+        .filter(
+            models.DataVersion.user_id == user_id,
+            models.DataVersion.scope == scope,
+        )
+        .scalar()
+    )
+    return version or 0
+
+
+def snapshot(db, user_id, scopes):
+    """{escopo: (versão, updated_at)} numa consulta só (escopos nunca escritos ficam (0, None))."""
+    rows = (
+        db.query(models.DataVersion.scope, models.DataVersion.version, models.DataVersion.updated_at)
+        .filter(
+            models.DataVersion.user_id == user_id,
+            models.DataVersion.scope.in_(scopes),
+        )
+        .all()
+    )
+    found = {scope: (version, updated_at) for scope, version, updated_at in rows}
+    return {scope: found.get(scope, (0, None)) for scope in scopes}
@@ -1,4 +1,4 @@
-import pika
+import functools
 import json
 import time
 import requests
@@ -6,12 +6,97 @@ import os
 import mimetypes
 from urllib.parse import urlparse, unquote # <--- NOVOS IMPORTS
 from database import SessionLocal
-from models import CampaignLog, Campaign
+from models import CampaignLog, Campaign, Connection
+import ratecontrol
+import breaker
+import metrics
+import timings
+import queues
+import ledger
+import suppressions
+import versions
 
-# --- Configurações ---
-RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'localhost')
-RABBITMQ_USER = os.getenv('RABBITMQ_USER', 'guest')
-RABBITMQ_PASS = os.getenv('RABBITMQ_PASS', 'guest')
+_consecutive_failures = {}
+_rate_controllers = {}
+_persisted_rates = {}
+_breakers = breaker.BreakerCache()
+_last_log_flush = 0.0 # segundos do último commit de log (span 'log' da próxima linha)
+_legacy_next_send = 0.0 # cadência das mensagens sem slot (monotonic)
+
+# Mensagens entregues ao worker sem ack (só RabbitMQ). O processamento é
+# sequencial: subir isso não aumenta a vazão, só o buffer local; para enviar
+# mais, rode mais workers (o ledger torna isso seguro)
+WORKER_PREFETCH = int(os.getenv('WORKER_PREFETCH', '1'))
+# Quanto tempo o worker confia no status/epoch lido de uma campanha antes de esperar o slot
+CAMPAIGN_STATE_CACHE_SECONDS = float(os.getenv('CAMPAIGN_STATE_CACHE_SECONDS', '2'))
+STOPPED_STATUSES = ("paused", "cancelled")
+
+def drop_reason(status, feed_epoch, epoch):
+    """Motivo para descartar uma mensagem da campanha (None = segue para o envio)."""
+    if status in STOPPED_STATUSES:
+        return status
+    if epoch is not None and epoch != (feed_epoch or 0):
+        # Publicada antes de um pause/cancel: o scheduler republica a partir do cursor
+        return "stale_epoch"
+    return None
+
+class CampaignStateCache:
+    """
+    (status, feed_epoch) das campanhas visto por um worker. Serve para largar as
+    mensagens de uma campanha pausada/cancelada assim que saem da fila, sem
+    esperar o slot de cada uma nem fazer uma query por mensagem.
+    """
+
+    def __init__(self, ttl=CAMPAIGN_STATE_CACHE_SECONDS):
+        self.ttl = ttl
+        self._states = {}
+
+    def get(self, campaign_id, epoch=None, now=None):
+        now = now or time.monotonic()
+        cached = self._states.get(campaign_id)
+        # Mensagem com epoch mais novo que o cache (resume recente): o cache está velho
+        fresh = cached and now - cached[1] < self.ttl
+        if fresh and cached[0] and (epoch is None or epoch <= (cached[0][1] or 0)):
+            return cached[0]
+        db = SessionLocal()
+        try:
+            state = (
+                db.query(Campaign.status, Campaign.feed_epoch)
+                .filter(Campaign.id == campaign_id)
+                .first()
+            )
+        finally:
+            db.close()
+        state = tuple(state) if state else None
+        self._states[campaign_id] = (state, now)
+        return state
+
+    def set(self, campaign_id, status, feed_epoch):
+        self._states[campaign_id] = ((status, feed_epoch), time.monotonic())
+
+_campaign_states = CampaignStateCache()
+
+def campaign_drop_reason(campaign_id, epoch):
+    """drop_reason() com o estado em cache da campanha."""
+    state = _campaign_states.get(campaign_id, epoch) if campaign_id else None
+    return drop_reason(state[0], state[1], epoch) if state else None
+
+def wait_for_slot(not_before, campaign_id=None, epoch=None, sleep=time.sleep):
+    """
+    Dorme até o slot, reolhando a campanha a cada CAMPAIGN_STATE_CACHE_SECONDS
+    para um pause/cancel não esperar o lookahead inteiro. `sleep` é o da fila
+    (no RabbitMQ, connection.sleep: a espera não trava os heartbeats). Devolve
+    (segundos esperados, motivo de descarte ou None).
+    """
+    started = time.time()
+    while True:
+        remaining = not_before - time.time()
+        if remaining <= 0:
+            return time.time() - started, None
+        sleep(min(remaining, CAMPAIGN_STATE_CACHE_SECONDS) if campaign_id else remaining)
+        reason = campaign_drop_reason(campaign_id, epoch)
+        if reason:
+            return time.time() - started, reason
 
 def get_db():
     db = SessionLocal()
@@ -20,22 +105,123 @@ def get_db():
     finally:
         db.close()
 
-def save_log(campaign_id, phone, name, status, error=None):
+def save_log(campaign_id, phone, name, status, error=None, contact_id=None, connection_id=None, effective_rate=None, timing=None, message_id=None, invalid_number=False):
+    global _last_log_flush
+    started = time.perf_counter()
     db = SessionLocal()
     try:
         log = CampaignLog(
             campaign_id=campaign_id,
+            contact_id=contact_id,
+            connection_id=connection_id,
             contact_number=phone,
             contact_name=name,
             status=status,
-            error_message=str(error) if error else None
+            error_message=str(error) if error else None,
+            timings=timing,
+            message_id=message_id,
         )
         db.add(log)
+        if campaign_id and contact_id:
+            # Resultado no ledger, atômico com o log
+            ledger.record(db, campaign_id, contact_id, status)
+        if invalid_number and campaign_id:
+            # Número fora do WhatsApp: entra na supressão do tenant para as próximas campanhas
+            if suppressions.harvest(db, campaign_id, phone, detail=str(error) if error else None):
+                print(f"🚫 {phone} suprimido (número inválido)")
+        connection_changed = False
+        if effective_rate is not None and connection_id:
+            # Taxa adaptativa vai na mesma transação do log (sem commit extra)
+            db.query(Connection).filter(Connection.id == connection_id).update(
+                {"effective_rate": effective_rate}, synchronize_session=False
+            )
+            connection_changed = True
+        if status == "sent" and connection_id:
+            # Envio ok fecha o breaker (no-op se já estava fechado)
+            connection_changed |= bool(db.query(Connection).filter(
+                Connection.id == connection_id, Connection.is_healthy.is_(False)
+            ).update({"is_healthy": True, "unhealthy_since": None}, synchronize_session=False))
+        if connection_changed:
+            # GET /connections mostra taxa e breaker: invalida a ETag do tenant
+            versions.bump_owner(db, Connection, connection_id, versions.CONNECTIONS)
         db.commit()
     except Exception as e:
         print(f"Erro ao salvar log: {e}")
     finally:
         db.close()
+        _last_log_flush = time.perf_counter() - started
+        metrics.LOG_FLUSH_SECONDS.observe(_last_log_flush)
+
+def record_connection_failure(connection_id):
+    """
+    Conta falhas seguidas (rede/5xx); no limite abre o breaker da conexão.
+    Retorna True se o breaker está aberto (a mensagem deve ser estacionada).
+    """
+    if not connection_id:
+        return False
+    count = _consecutive_failures.get(connection_id, 0) + 1
+    _consecutive_failures[connection_id] = count
+    if count < breaker.BREAKER_FAILURE_THRESHOLD:
+        return False
+
+    db = SessionLocal()
+    try:
+        if breaker.open_breaker(db, connection_id):
+            print(f"🚑 Breaker da conexão {connection_id} aberto após {count} falhas seguidas")
+        db.commit()
+        _breakers.set(connection_id, True)
+        return True
+    except Exception as e:
+        print(f"Erro ao abrir breaker: {e}")
+        return False
+    finally:
+        db.close()
+
+def park_message(payload):
+    db = SessionLocal()
+    try:
+        breaker.park(db, payload)
+        if payload.get('campaign_id') and payload.get('contact_id'):
+            # Não foi enviada: a reentrega depois da recuperação precisa poder reivindicar
+            ledger.release(db, payload['campaign_id'], payload['contact_id'])
+        db.commit()
+        metrics.MESSAGES_PARKED.labels(str(payload['connection']['id'])).inc()
+        print(f"🅿️ Mensagem para {payload.get('phone')} retida (conexão {payload['connection']['id']} fora do ar)")
+    except Exception as e:
+        print(f"Erro ao reter mensagem: {e}")
+    finally:
+        db.close()
+
+def observe_rate(conn, payload, status_code, latency):
+    """
+    Alimenta o AIMD da conexão. Devolve a taxa a persistir quando ela mudou
+    o suficiente (>= 5% ou qualquer queda); senão None.
+    """
+    connection_id = conn.get('id')
+    if not connection_id or not ratecontrol.ADAPTIVE_RATE_ENABLED:
+        return None
+
+    ceiling = 60 / payload.get('delay_seconds', 6)
+    controller = _rate_controllers.get(connection_id)
+    if controller is None:
+        floor = conn.get('min_messages_per_minute') or ratecontrol.ADAPTIVE_RATE_FLOOR
+        db = SessionLocal()
+        try:
+            persisted = db.query(Connection.effective_rate).filter(Connection.id == connection_id).scalar()
+        finally:
+            db.close()
+        controller = ratecontrol.AIMDController(persisted or ceiling, floor, ceiling)
+        _rate_controllers[connection_id] = controller
+        _persisted_rates[connection_id] = persisted
+
+    rate = controller.observe(status_code, latency, ceiling=ceiling)
+    last = _persisted_rates.get(connection_id)
+    if last is None or rate < last or rate >= last * 1.05:
+        _persisted_rates[connection_id] = rate
+        if last is not None and rate < last:
+            print(f"🐢 Conexão {connection_id}: taxa reduzida para {rate:.1f} msgs/min")
+        return rate
+    return None
 
 def get_media_info(url, provided_type=None):
     """
@@ -74,11 +260,21 @@ def get_media_info(url, provided_type=None):
     # Retorna também o FILENAME agora
     return media_type, mime_type, filename 
 
-def send_via_evolution(payload):
+def evolution_message_id(response):
+    """key.id da mensagem enviada: é por ele que os recibos do webhook chegam."""
+    try:
+        return (response.json().get("key") or {}).get("id")
+    except (ValueError, AttributeError):
+        return None
+
+def send_via_evolution(payload, spans=None):
+    spans = {} if spans is None else spans
+    render_started = time.monotonic()
     conn = payload.get('connection')
     base_url = conn['base_url'].rstrip('/')
     api_key = conn['api_key']
     instance = conn['instance']
+    connection_id = conn.get('id')
     
     text = payload['message']
     if text:
@@ -112,77 +308,150 @@ def send_via_evolution(payload):
             "textMessage": {"text": text}
         }
 
+    spans['render'] = time.monotonic() - render_started
+    spans['log'] = _last_log_flush
+
+    started = time.monotonic()
     try:
         url = f"{base_url}{endpoint}/{instance}"
         print(f"[{instance}] Enviando para {payload['phone']} ({endpoint})...")
         print(f"   Arquivo identificado: {body.get('fileName')} ({body.get('mimetype')})")
         
         response = requests.post(url, json=body, headers=headers, timeout=30)
+        latency = time.monotonic() - started
+        spans['http'] = latency
+        timing = timings.encode(spans)
+        metrics.EVOLUTION_LATENCY.labels(str(connection_id)).observe(latency)
+        rate = observe_rate(conn, payload, response.status_code, latency)
         
         campaign_id = payload.get('campaign_id')
         
         if response.status_code in [200, 201]:
+            metrics.SENDS.labels(str(connection_id), "sent").inc()
             print(f"✅ Sucesso: {payload['phone']}")
-            if campaign_id: save_log(campaign_id, payload['phone'], payload['name'], "sent")
+            _consecutive_failures.pop(connection_id, None)
+            if campaign_id: save_log(campaign_id, payload['phone'], payload['name'], "sent", contact_id=payload.get('contact_id'), connection_id=connection_id, effective_rate=rate, timing=timing, message_id=evolution_message_id(response))
         else:
             error_msg = response.text
+            metrics.SENDS.labels(str(connection_id), "failed").inc()
             print(f"❌ Falha API ({response.status_code}): {error_msg}")
-            if campaign_id: save_log(campaign_id, payload['phone'], payload['name'], "failed", error=error_msg)
+            if response.status_code >= 500 and record_connection_failure(connection_id):
+                park_message(payload)
+            elif campaign_id: save_log(campaign_id, payload['phone'], payload['name'], "failed", error=error_msg, contact_id=payload.get('contact_id'), connection_id=connection_id, effective_rate=rate, timing=timing, invalid_number=suppressions.is_invalid_number(response.status_code, error_msg))
             
     except Exception as e:
         print(f"❌ Erro Crítico: {e}")
+        metrics.SENDS.labels(str(connection_id), "error").inc()
+        spans.setdefault('http', time.monotonic() - started)
+        rate = observe_rate(conn, payload, None, 0.0)
         campaign_id = payload.get('campaign_id')
-        if campaign_id: save_log(campaign_id, payload['phone'], payload['name'], "failed", error=str(e))
+        if record_connection_failure(connection_id):
+            park_message(payload)
+        elif campaign_id: save_log(campaign_id, payload['phone'], payload['name'], "failed", error=str(e), contact_id=payload.get('contact_id'), connection_id=connection_id, effective_rate=rate, timing=timings.encode(spans))
 
-def callback(ch, method, properties, body):
+def process_message(body, sleep=time.sleep):
+    """
+    Processa uma mensagem da fila (o backend confirma quando isto retorna).
+    Toda espera passa por `sleep` (ver wait_for_slot).
+    """
+    global _legacy_next_send
     db = None
-    acked = False
     try:
         payload = json.loads(body)
+        spans = {}
+        dequeued = time.time()
+        if payload.get("enqueued_at"):
+            spans["queue"] = dequeued - payload["enqueued_at"]
+
+        check_started = time.monotonic()
+        connection_id = (payload.get("connection") or {}).get("id")
+        if connection_id and _breakers.is_open(connection_id):
+            # Instância fora do ar: sem esperar slot nem timeout, a mensagem fica retida
+            park_message(payload)
+            return
 
         campaign_id = payload.get("campaign_id")
+        reason = campaign_drop_reason(campaign_id, payload.get("epoch"))
+        if reason:
+            # Pause/cancel: descarta na saída da fila, sem esperar o slot
+            metrics.MESSAGES_DROPPED.labels(reason).inc()
+            return
+
+        spans["check"] = time.monotonic() - check_started
+
+        # Mensagens do scheduler trazem o slot de envio; espera até ele
+        not_before = payload.get("not_before")
+        if not_before:
+            waited, reason = wait_for_slot(not_before, campaign_id, payload.get("epoch"), sleep)
+            if waited:
+                spans["wait"] = waited
+            if reason:
+                metrics.MESSAGES_DROPPED.labels(reason).inc()
+                return
+        else:
+            # Sem slot (publicação direta): mantém a cadência antiga, mas espera
+            # antes do próximo envio em vez de segurar o ack da mensagem anterior
+            wait = _legacy_next_send - time.monotonic()
+            if wait > 0:
+                sleep(wait)
+                spans["wait"] = wait
+            _legacy_next_send = time.monotonic() + payload.get('delay_seconds', 5)
+
+        check_started = time.monotonic()
         if campaign_id:
+            # Confirma no banco depois da espera: o pause pode ter chegado durante ela
             db = SessionLocal()
             campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
-            if campaign and campaign.status == "paused":
-                print(f"⏸️ Campanha {campaign_id} pausada. Ignorando mensagem para {payload.get('phone')}")
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-                acked = True
-                return
+            if campaign:
+                _campaign_states.set(campaign_id, campaign.status, campaign.feed_epoch)
+                reason = drop_reason(campaign.status, campaign.feed_epoch, payload.get("epoch"))
+                if reason:
+                    print(f"⏸️ Campanha {campaign_id} ({reason}): mensagem para {payload.get('phone')} descartada")
+                    metrics.MESSAGES_DROPPED.labels(reason).inc()
+                    return
+            contact_id = payload.get("contact_id")
+            if contact_id:
+                if not ledger.claim(db, campaign_id, contact_id):
+                    # Reentrega de algo já reivindicado/enviado: nunca manda duas vezes
+                    print(f"🔂 Contato {contact_id} da campanha {campaign_id} já despachado; ignorando")
+                    metrics.MESSAGES_DROPPED.labels("duplicate").inc()
+                    return
+                db.commit()
+            # Não segura a leitura aberta durante o envio (o log grava em outra sessão)
+            db.close()
+            db = None
+        spans["check"] += time.monotonic() - check_started
+
+        if not_before:
+            spans["late"] = max(time.time() - not_before, 0)
+            metrics.QUEUE_LAG.observe(spans["late"])
+        send_via_evolution(payload, spans)
 
-        send_via_evolution(payload)
-        
-        delay = payload.get('delay_seconds', 5)
-        time.sleep(delay)
-        
     except Exception as e:
         print(f"Erro no processamento da fila: {e}")
+        metrics.MESSAGES_DROPPED.labels("error").inc()
     finally:
         if db:
             db.close()
-        if not acked:
-            ch.basic_ack(delivery_tag=method.delivery_tag)
 
 def start_worker():
-    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-    parameters = pika.ConnectionParameters(host=RABBITMQ_HOST, credentials=credentials)
+    metrics.start_listener()
 
     while True:
+        queue = None
         try:
-            connection = pika.BlockingConnection(parameters)
-            channel = connection.channel()
-            channel.queue_declare(queue='whatsapp_campaigns', durable=True)
-            channel.basic_qos(prefetch_count=1)
-            
-            print(f' [*] Heimdall Worker conectado. Aguardando mensagens...')
-            channel.basic_consume(queue='whatsapp_campaigns', on_message_callback=callback)
-            channel.start_consuming()
-        except pika.exceptions.AMQPConnectionError:
-            print("RabbitMQ indisponível, tentando em 5s...")
-            time.sleep(5)
+            queue = queues.get_queue()
+            print(f' [*] Heimdall Worker conectado (fila {queues.QUEUE_BACKEND}). Aguardando mensagens...')
+            queue.consume(functools.partial(process_message, sleep=queue.sleep), prefetch=WORKER_PREFETCH)
         except Exception as e:
-            print(f"Erro no loop principal: {e}")
+            print(f"Fila indisponível ({e}), tentando em 5s...")
             time.sleep(5)
+        finally:
+            if queue:
+                try:
+                    queue.close()
+                except Exception:
+                    pass
 
 if __name__ == "__main__":
     start_worker()
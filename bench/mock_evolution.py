@@ -0,0 +1,93 @@
+"""
+Evolution API falsa para benchmarks.
+
+Responde sendText/sendMedia e connectionState com latência e taxa de erro
+configuráveis. Pode rodar sozinha (para apontar um worker de verdade) ou ser
+iniciada dentro do run.py.
+
+    python bench/mock_evolution.py --port 8081 --latency-ms 150 --error-rate 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockEvolutionHandler(BaseHTTPRequestHandler):
+    # Preenchidos por make_server
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    counters = None
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if not self.path.startswith("/message/"):
+            self._reply(404, {"error": "not found"})
+        elif random.random() < self.error_rate:
+            self.counters["errors"] += 1
+            self._reply(500, {"error": "mock failure"})
+        else:
+            self.counters["sent"] += 1
+            self._reply(201, {"key": {"id": f"MOCK{self.counters['sent']}"}, "status": "PENDING"})
+
+    def do_GET(self):
+        if self.path.startswith("/instance/connectionState/"):
+            instance = self.path.rsplit("/", 1)[-1]
+            self._reply(200, {"instance": {"instanceName": instance, "state": "open"}})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def log_message(self, format, *args):
+        # Sem log por requisição: distorceria o benchmark
+        pass
+
+
+def make_server(host="127.0.0.1", port=0, latency_ms=0, jitter_ms=0, error_rate=0.0):
+    handler = type("Handler", (MockEvolutionHandler,), {
+        "latency": latency_ms / 1000,
+        "jitter": jitter_ms / 1000,
+        "error_rate": error_rate,
+        "counters": {"sent": 0, "errors": 0},
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(**kwargs):
+    """Sobe o servidor numa thread; devolve (server, base_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evolution API falsa")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f" [*] Evolution falsa em http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,218 @@
+"""
+Benchmark de vazão do Heimdall.
+
+Sobe uma Evolution API falsa (mock_evolution.py) e usa a fila embutida
+(queues.py, QUEUE_BACKEND=embedded) no lugar do RabbitMQ, e mede num banco
+descartável:
+
+    import     POST /contacts/import em lotes
+    publish    services.publish_campaign_to_queue da audiência inteira
+    worker     worker.process_message consumindo as mensagens contra a Evolution falsa
+    endpoints  GET /campaigns/{id}/stats, /logs e /timings sobre logs em escala
+
+O resultado sai em JSON (stdout ou --output) para comparar entre versões:
+
+    python bench/run.py --contacts 100000 --send-count 2000 --latency-ms 50 --error-rate 0.01
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux devolve KB; macOS, bytes
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def latency_summary(samples, timings):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(timings.percentile(ordered, 50) * 1000, 2) if ordered else None,
+        "p99_ms": round(timings.percentile(ordered, 99) * 1000, 2) if ordered else None,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de vazão do Heimdall")
+    parser.add_argument("--contacts", type=int, default=10000, help="tamanho da audiência importada")
+    parser.add_argument("--import-batch", type=int, default=5000)
+    parser.add_argument("--send-count", type=int, default=2000, help="mensagens consumidas pelo worker")
+    parser.add_argument("--log-rows", type=int, default=None, help="logs sintéticos para os endpoints (padrão: --contacts)")
+    parser.add_argument("--endpoint-repeat", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--database-url", default=None, help="padrão: SQLite num diretório temporário")
+    parser.add_argument("--output", default=None, help="arquivo JSON (padrão: stdout)")
+    parser.add_argument("--verbose", action="store_true", help="mantém os prints da API/worker")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    tmpdir = tempfile.mkdtemp(prefix="heimdall-bench-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ["QUEUE_BACKEND"] = "embedded"
+    os.environ["EMBEDDED_QUEUE_PATH"] = os.path.join(tmpdir, "queue.db")
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+
+    import mock_evolution
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with quiet:
+        from fastapi.testclient import TestClient
+
+        import database
+        import main as api
+        import models
+        import queues
+        import scheduler
+        import services
+        import timings
+        import worker
+
+    server, evolution_url = mock_evolution.start_in_background(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+    )
+
+    # Context manager: roda o lifespan da API (migrações)
+    stack = contextlib.ExitStack()
+    client = stack.enter_context(TestClient(api.app))
+    client.post("/auth/register", json={
+        "first_name": "Bench", "last_name": "User", "phone": "0",
+        "email": "bench@example.com", "password": "bench",
+    })
+    token = client.post("/auth/login", json={"email": "bench@example.com", "password": "bench"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    results = {}
+
+    # --- import ---
+    list_id = client.post("/lists", json={"name": "bench"}, headers=headers).json()["id"]
+    batch_latencies = []
+    started = time.perf_counter()
+    for offset in range(0, args.contacts, args.import_batch):
+        batch = [
+            {"name": f"Contato {i}", "number": f"55{11000000000 + i}"}
+            for i in range(offset, min(offset + args.import_batch, args.contacts))
+        ]
+        batch_started = time.perf_counter()
+        with quiet:
+            response = client.post("/contacts/import", json={"contacts": batch, "list_id": list_id}, headers=headers)
+        response.raise_for_status()
+        batch_latencies.append(time.perf_counter() - batch_started)
+    elapsed = time.perf_counter() - started
+    results["import"] = {
+        "rows": args.contacts,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(args.contacts / elapsed, 1),
+        "batch_size": args.import_batch,
+        **latency_summary(batch_latencies, timings),
+    }
+
+    # --- publish ---
+    connection = client.post("/connections", json={
+        "name": "mock", "api_url": evolution_url, "api_key": "bench", "instance_name": "bench",
+    }, headers=headers).json()
+    with quiet:
+        campaign_id = client.post("/campaigns", json={
+            "name": "bench", "message_body": "Olá $contact_name", "messages_per_minute": 600000,
+            "connection_id": connection["id"], "contact_list_id": list_id,
+        }, headers=headers).json()["campaign_id"]
+
+    db = database.SessionLocal()
+    campaign = db.get(models.Campaign, campaign_id)
+    conn = db.get(models.Connection, connection["id"])
+    contacts = [
+        {"id": contact_id, "number": number, "name": name}
+        for contact_id, number, name in scheduler.pending_contacts(db, campaign, args.contacts)
+    ]
+    started = time.perf_counter()
+    services.publish_campaign_to_queue(
+        scheduler.campaign_payload(campaign), scheduler.connection_payload(conn), contacts,
+    )
+    elapsed = time.perf_counter() - started
+    results["publish"] = {
+        "messages": len(contacts),
+        "seconds": round(elapsed, 3),
+        "msgs_per_sec": round(len(contacts) / elapsed, 1) if elapsed else None,
+    }
+    db.close()
+
+    # --- worker ---
+    queue = queues.get_queue()
+    send_latencies = []
+    consumed = 0
+    started = time.perf_counter()
+    with quiet:
+        while consumed < args.send_count:
+            message = queue.receive()
+            if message is None:
+                break
+            consumed += 1
+            message_started = time.perf_counter()
+            worker.process_message(message.body)
+            queue.ack(message)
+            send_latencies.append(time.perf_counter() - message_started)
+    elapsed = time.perf_counter() - started
+    queue.close()
+    results["worker"] = {
+        "messages": consumed,
+        "seconds": round(elapsed, 3),
+        "msgs_per_sec": round(consumed / elapsed, 1) if elapsed else None,
+        "evolution_sent": server.RequestHandlerClass.counters["sent"],
+        "evolution_errors": server.RequestHandlerClass.counters["errors"],
+        **latency_summary(send_latencies, timings),
+    }
+
+    # --- endpoints sobre logs em escala ---
+    log_rows = args.log_rows if args.log_rows is not None else args.contacts
+    with database.engine.begin() as bulk:
+        chunk = 10000
+        for offset in range(0, log_rows, chunk):
+            bulk.execute(models.CampaignLog.__table__.insert(), [
+                {
+                    "campaign_id": campaign_id, "connection_id": connection["id"],
+                    "contact_number": f"55{11000000000 + i}", "contact_name": f"Contato {i}",
+                    "status": "sent" if i % 20 else "failed", "timings": "5,0,1,2,0,40,3",
+                }
+                for i in range(offset, min(offset + chunk, log_rows))
+            ])
+
+    results["endpoints"] = {"log_rows": log_rows}
+    for name, path in (
+        ("stats", f"/campaigns/{campaign_id}/stats"),
+        ("logs", f"/campaigns/{campaign_id}/logs"),
+        ("timings", f"/campaigns/{campaign_id}/timings"),
+    ):
+        latencies = []
+        for _ in range(args.endpoint_repeat):
+            request_started = time.perf_counter()
+            client.get(path, headers=headers).raise_for_status()
+            latencies.append(time.perf_counter() - request_started)
+        results["endpoints"][name] = latency_summary(latencies, timings)
+
+    stack.close()
+    server.shutdown()
+    report = {
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "verbose", "database_url")},
+        "database": database.engine.dialect.name,
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark da serialização das listagens.
+
+Compara, sobre N linhas num SQLite descartável, os dois caminhos de resposta:
+
+    orm         entidades ORM (+ selectinload) validadas pelo schema Pydantic
+                (from_attributes) e serializadas por ele — o caminho antigo
+    projection  só as colunas do schema em tuplas, dicts montados à mão e
+                orjson (responses.py) — o caminho atual de /contacts,
+                /campaigns e /logs
+
+    python bench/serialization.py --rows 10000 --repeat 5
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+
+def best_of(repeat, fn):
+    """Menor tempo (ms) entre as repetições e o tamanho do JSON gerado."""
+    timings, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn())
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1000, 2), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da serialização das listagens")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="heimdall-serial-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+
+    import database
+    import migrations
+    import models
+    import responses
+    import retention
+    import schemas
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        migrations.upgrade(database.engine)
+    with database.engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{
+            "id": 1, "first_name": "Bench", "last_name": "User", "phone": "0",
+            "email": "bench@example.com", "password_hash": "x",
+        }])
+        conn.execute(models.Tag.__table__.insert(), [{"id": 1, "name": "bench", "user_id": 1}])
+        conn.execute(models.Campaign.__table__.insert(), [{"id": 1, "name": "bench", "message_body": "x", "user_id": 1}])
+        conn.execute(models.Contact.__table__.insert(), [
+            {"id": i, "name": f"Contato {i}", "number": f"55{11000000000 + i}", "user_id": 1}
+            for i in range(1, args.rows + 1)
+        ])
+        conn.execute(models.contact_tags.insert(), [
+            {"contact_id": i, "tag_id": 1} for i in range(1, args.rows + 1)
+        ])
+        conn.execute(models.CampaignLog.__table__.insert(), [
+            {
+                "campaign_id": 1, "contact_id": i, "connection_id": 1,
+                "contact_number": f"55{11000000000 + i}", "contact_name": f"Contato {i}",
+                "status": "sent", "timings": "5,0,1,2,0,40,3",
+            }
+            for i in range(1, args.rows + 1)
+        ])
+
+    contacts_adapter = TypeAdapter(List[schemas.Contact])
+    db = database.SessionLocal()
+
+    def contacts_orm():
+        rows = db.query(models.Contact).options(selectinload(models.Contact.tags)).order_by(models.Contact.id).all()
+        db.expunge_all()
+        return contacts_adapter.dump_json(contacts_adapter.validate_python(rows, from_attributes=True))
+
+    def contacts_projection():
+        page = responses.rows_to_dicts(("id", "name", "number"), db.execute(
+            select(models.Contact.id, models.Contact.name, models.Contact.number).order_by(models.Contact.id)
+        ).all())
+        tags = {}
+        for contact_id, tag_id, name in db.execute(
+            select(models.contact_tags.c.contact_id, models.Tag.id, models.Tag.name)
+            .join(models.Tag, models.Tag.id == models.contact_tags.c.tag_id)
+        ).all():
+            tags.setdefault(contact_id, []).append({"id": tag_id, "name": name})
+        for contact in page:
+            contact["tags"] = tags.get(contact["id"], [])
+        return responses.FastJSONResponse(page).body
+
+    def logs_orm():
+        # O /logs antigo devolvia as entidades sem response_model (jsonable_encoder)
+        rows = db.query(models.CampaignLog).filter(models.CampaignLog.campaign_id == 1).all()
+        db.expunge_all()
+        return json.dumps(jsonable_encoder(rows)).encode()
+
+    def logs_projection():
+        rows = db.execute(
+            select(*[getattr(models.CampaignLog, field) for field in retention.LOG_FIELDS])
+            .where(models.CampaignLog.campaign_id == 1)
+        ).all()
+        return responses.FastJSONResponse(responses.rows_to_dicts(retention.LOG_FIELDS, rows)).body
+
+    results = {}
+    for name, orm, projection in (
+        ("contacts", contacts_orm, contacts_projection),
+        ("logs", logs_orm, logs_projection),
+    ):
+        orm_ms, orm_bytes = best_of(args.repeat, orm)
+        projection_ms, projection_bytes = best_of(args.repeat, projection)
+        results[name] = {
+            "orm_ms": orm_ms,
+            "projection_ms": projection_ms,
+            "speedup": round(orm_ms / projection_ms, 2) if projection_ms else None,
+            "bytes": projection_bytes,
+            "orm_bytes": orm_bytes,
+        }
+    db.close()
+
+    print(json.dumps({"rows": args.rows, "repeat": args.repeat, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -98,6 +98,7 @@ const translations = {
       successDelete: 'Contact removed successfully.',
       errorDelete: 'Failed to remove contact.',
       errorFetch: 'Failed to load contacts.',
+      searchPlaceholder: 'Search by name or number (start or end)',
     },
     lists: {
       title: 'Contact Lists',
@@ -174,6 +175,7 @@ const translations = {
       status: {
         draft: 'Draft',
         running: 'Running',
+        preparing: 'Preparing',
         processing: 'Processing',
         completed: 'Completed',
         paused: 'Paused',
@@ -289,6 +291,7 @@ const translations = {
       successDelete: 'Contato removido com sucesso.',
       errorDelete: 'Falha ao remover contato.',
       errorFetch: 'Falha ao carregar contatos.',
+      searchPlaceholder: 'Buscar por nome ou número (início ou final)',
     },
     lists: {
       title: 'Listas de Contatos',
@@ -365,6 +368,7 @@ const translations = {
       status: {
         draft: 'Rascunho',
         running: 'Em execução',
+        preparing: 'Preparando',
         processing: 'Processando',
         completed: 'Concluída',
         paused: 'Pausada',
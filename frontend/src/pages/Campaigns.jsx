@@ -474,7 +474,7 @@ const Campaigns = () => {
                           <Play className="w-4 h-4" />
                           {t('campaigns.resume')}
                         </Button>
-                      ) : campaign.status === 'running' || campaign.status === 'processing' ? (
+                      ) : campaign.status === 'running' || campaign.status === 'processing' || campaign.status === 'preparing' ? (
                         <Button
                           onClick={() => handlePauseCampaign(campaign.id)}
                           size="sm"
@@ -42,12 +42,12 @@ const ContactLists = () => {
 
   const fetchListDetails = async (listId) => {
     try {
-      const response = await apiFetch(`/lists/${listId}`);
+      const response = await apiFetch(`/lists/${listId}/contacts?limit=100`);
       if (!response.ok) {
         throw new Error('Failed to fetch list details');
       }
       const data = await response.json();
-      setListDetails((prev) => ({ ...prev, [listId]: data }));
+      setListDetails((prev) => ({ ...prev, [listId]: { contacts: Array.isArray(data) ? data : [] } }));
     } catch (error) {
       toast({
         title: t('common.error'),
@@ -175,7 +175,7 @@ const ContactLists = () => {
                       <div className="flex-1">
                         <h3 className="text-lg font-bold text-[#075e54]">{list.name}</h3>
                         <p className="text-sm text-gray-500 mt-1">
-                          {t('lists.totalContacts', { count: contacts.length })}
+                          {t('lists.totalContacts', { count: list.member_count ?? contacts.length })}
                         </p>
                       </div>
                       <Button
@@ -14,6 +14,7 @@ const Contacts = () => {
   const [contacts, setContacts] = useState([]);
   const [tags, setTags] = useState([]);
   const [loading, setLoading] = useState(false);
+  const [searchQuery, setSearchQuery] = useState('');
   const [formData, setFormData] = useState({
     name: '',
     number: '',
@@ -27,10 +28,13 @@ const Contacts = () => {
     fetchTags();
   }, []);
 
-  const fetchContacts = async () => {
+  const fetchContacts = async (query = searchQuery) => {
     setLoading(true);
     try {
-      const response = await apiFetch('/contacts');
+      const term = query.trim();
+      const response = await apiFetch(
+        term ? `/contacts/search?q=${encodeURIComponent(term)}&limit=100` : '/contacts?limit=100'
+      );
       const data = await response.json();
       setContacts(Array.isArray(data) ? data : []);
     } catch (error) {
@@ -128,7 +132,7 @@ const Contacts = () => {
             <h1 className="text-3xl font-bold text-[#075e54]  mb-2">{t('contacts.title')}</h1>
             <p className="text-[#128c7e] ">{t('contacts.subtitle')}</p>
           </div>
-          <Button onClick={fetchContacts} variant="outline" className="gap-2 bg-white/90 text-[#075e54] border-[#075e54] hover:bg-[#25d366] hover:text-white hover:border-transparent">
+          <Button onClick={() => fetchContacts()} variant="outline" className="gap-2 bg-white/90 text-[#075e54] border-[#075e54] hover:bg-[#25d366] hover:text-white hover:border-transparent">
             <RefreshCw className={`w-4 h-4 ${loading ? 'animate-spin' : ''}`} />
             {t('common.refresh')}
           </Button>
@@ -204,6 +208,20 @@ const Contacts = () => {
           className="bg-white shadow-sm border border-[#e9edef] rounded-xl p-6"
         >
           <h2 className="text-xl font-bold text-[#075e54] mb-4 pb-4 border-b border-[#e9edef]">{t('contacts.allContacts')}</h2>
+          <form
+            onSubmit={(e) => {
+              e.preventDefault();
+              fetchContacts();
+            }}
+            className="mb-4"
+          >
+            <Input
+              value={searchQuery}
+              onChange={(e) => setSearchQuery(e.target.value)}
+              placeholder={t('contacts.searchPlaceholder')}
+              className="bg-gray-50 border-gray-200 text-[#075e54] placeholder:text-gray-400"
+            />
+          </form>
           {loading ? (
             <div className="text-center py-8 text-gray-500">{t('common.loading')}</div>
           ) : contacts.length === 0 ? (
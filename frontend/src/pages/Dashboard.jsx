@@ -24,7 +24,7 @@ const Dashboard = () => {
       const [connectionsRes, tagsRes, contactsRes, campaignsRes] = await Promise.all([
         apiFetch('/connections').catch(() => ({ json: async () => [] })),
         apiFetch('/tags').catch(() => ({ json: async () => [] })),
-        apiFetch('/contacts').catch(() => ({ json: async () => [] })),
+        apiFetch('/contacts/count').catch(() => ({ json: async () => ({}) })),
         apiFetch('/campaigns').catch(() => ({ json: async () => [] })),
       ]);
 
@@ -36,7 +36,7 @@ const Dashboard = () => {
       setStats({
         connections: Array.isArray(connections) ? connections.length : 0,
         tags: Array.isArray(tags) ? tags.length : 0,
-        contacts: Array.isArray(contacts) ? contacts.length : 0,
+        contacts: typeof contacts?.total === 'number' ? contacts.total : 0,
         campaigns: Array.isArray(campaigns) ? campaigns.length : 0,
       });
     } catch (error) {